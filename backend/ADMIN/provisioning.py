@@ -0,0 +1,256 @@
+import csv
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from api.models import Department, Doctor, LabTechnician, Pharmacist, Receptionist, StaffIdSequence
+from api.utils.catalog_cache import bump_version
+
+BATCH_SIZE = 200
+# Below this many passwords the pool's start-up costs more than it saves.
+POOL_THRESHOLD = 8
+MAX_ROWS = 2000
+
+COMMON_FIELDS = [
+    'username', 'password', 'first_name', 'last_name', 'email', 'phone', 'date_of_birth',
+    'is_active', 'address', 'salary', 'sex',
+]
+
+
+class CSVParser(BaseParser):
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return read_csv(stream.read().decode(encoding))
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise ParseError(f"CSV parse error - {exc}")
+
+
+class StaffRowSerializer(serializers.ModelSerializer):
+    """One row of a bulk upload. Uniqueness is checked for the whole upload at once, not per row."""
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    password = serializers.CharField(write_only=True)
+
+    class Meta:
+        fields = COMMON_FIELDS
+        extra_kwargs = {'email': {'validators': []}}
+
+
+class ReceptionistRowSerializer(StaffRowSerializer):
+    class Meta(StaffRowSerializer.Meta):
+        model = Receptionist
+
+
+class DoctorRowSerializer(StaffRowSerializer):
+    # A plain id, checked against Department in bulk (a related field would query per row).
+    department_id = serializers.IntegerField(source='department_id_id', required=False)
+
+    class Meta(StaffRowSerializer.Meta):
+        model = Doctor
+        fields = COMMON_FIELDS + ['department_id']
+
+
+class PharmacistRowSerializer(StaffRowSerializer):
+    class Meta(StaffRowSerializer.Meta):
+        model = Pharmacist
+        fields = COMMON_FIELDS + ['pharmacy_license']
+
+
+class LabTechnicianRowSerializer(StaffRowSerializer):
+    class Meta(StaffRowSerializer.Meta):
+        model = LabTechnician
+        fields = COMMON_FIELDS + ['lab_certification']
+
+
+# role -> (row serializer, group the role's users join)
+ROLES = {
+    'receptionist': (ReceptionistRowSerializer, 'Receptionist'),
+    'doctor': (DoctorRowSerializer, 'Doctor'),
+    'pharmacist': (PharmacistRowSerializer, 'Pharmacist'),
+    'labtechnician': (LabTechnicianRowSerializer, 'LabTechnician'),
+}
+
+
+def read_csv(text):
+    """Rows of a CSV upload as dicts; empty cells count as not given."""
+    return [
+        {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+
+# Password hashing
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # Under the spawn/forkserver start methods a worker starts without Django set up.
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _workers():
+    return getattr(settings, 'PROVISIONING_HASH_WORKERS', None) or os.cpu_count() or 1
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_workers(), initializer=_init_worker)
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def hash_passwords(passwords):
+    """make_password() for each password, spread over a process pool when there are enough of them."""
+    if len(passwords) < POOL_THRESHOLD or _workers() < 2:
+        return [make_password(password) for password in passwords]
+    pool = _get_pool()
+    chunksize = max(1, len(passwords) // (_workers() * 4))
+    try:
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return [make_password(password) for password in passwords]
+
+
+# Provisioning
+
+class Provisioner:
+    """
+    Creates staff from a list of row dicts (role, username, password and the
+    role's profile fields). Bad rows are reported by index and skipped; good
+    rows are written BATCH_SIZE at a time, each batch in one transaction.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.created = []
+        self.errors = {}
+
+    def run(self):
+        valid = self._validate()
+        self._check_unique(valid)
+        valid = [(i, role, data) for i, role, data in valid if i not in self.errors]
+
+        hashes = hash_passwords([data.pop('password') for _, _, data in valid])
+        for (i, role, data), password in zip(valid, hashes):
+            data['password'] = password
+
+        groups = {name: Group.objects.get_or_create(name=name)[0] for _, name in ROLES.values()}
+        for start in range(0, len(valid), BATCH_SIZE):
+            batch = valid[start:start + BATCH_SIZE]
+            try:
+                with transaction.atomic():
+                    self._create(batch, groups)
+            except IntegrityError:
+                # Someone registered one of these meanwhile: find out which row, one at a time.
+                for row in batch:
+                    try:
+                        with transaction.atomic():
+                            self._create([row], groups)
+                    except IntegrityError as exc:
+                        self.errors[row[0]] = {'non_field_errors': [str(exc)]}
+
+        if any(row['role'] == 'doctor' for row in self.created):
+            bump_version('doctor')  # bulk_create sends no signals
+        self.created.sort(key=lambda row: row['row'])
+        return {
+            'created': self.created,
+            'errors': [{'row': i, 'errors': errors} for i, errors in sorted(self.errors.items())],
+        }
+
+    def _validate(self):
+        valid = []
+        for i, row in enumerate(self.rows):
+            if not isinstance(row, dict):
+                self.errors[i] = {'non_field_errors': ['Expected an object.']}
+                continue
+            role = str(row.get('role', '')).strip().lower()
+            if role not in ROLES:
+                self.errors[i] = {'role': [f"Must be one of: {', '.join(ROLES)}."]}
+                continue
+            serializer = ROLES[role][0](data=row)
+            if serializer.is_valid():
+                valid.append((i, role, dict(serializer.validated_data)))
+            else:
+                self.errors[i] = serializer.errors
+        return valid
+
+    def _reject(self, i, field, message):
+        self.errors.setdefault(i, {}).setdefault(field, []).append(message)
+
+    def _check_unique(self, valid):
+        """Usernames, emails (per role) and departments, for all rows with one query each."""
+        usernames = {data['username'] for _, _, data in valid}
+        taken = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        emails_taken = {}
+        for role, (serializer_class, _) in ROLES.items():
+            emails = {data['email'] for _, row_role, data in valid if row_role == role}
+            if emails:
+                model = serializer_class.Meta.model
+                emails_taken[role] = set(model.objects.filter(email__in=emails).values_list('email', flat=True))
+        department_ids = {data['department_id_id'] for _, _, data in valid if 'department_id_id' in data}
+        departments = set(Department.objects.filter(pk__in=department_ids).values_list('pk', flat=True)) \
+            if department_ids else set()
+
+        seen_usernames, seen_emails = set(), set()
+        for i, role, data in valid:
+            if data['username'] in taken or data['username'] in seen_usernames:
+                self._reject(i, 'username', 'This username is already taken.')
+            if data['email'] in emails_taken.get(role, ()) or (role, data['email']) in seen_emails:
+                self._reject(i, 'email', 'This email is already in use.')
+            if 'department_id_id' in data and data['department_id_id'] not in departments:
+                self._reject(i, 'department_id', 'Unknown department.')
+            seen_usernames.add(data['username'])
+            seen_emails.add((role, data['email']))
+
+    def _create(self, batch, groups):
+        users = [User(username=data['username'], password=data['password']) for _, _, data in batch]
+        User.objects.bulk_create(users)
+        # MySQL doesn't hand back the ids of bulk-inserted rows.
+        user_ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'pk'))
+
+        created, memberships = [], []
+        for role, (serializer_class, group_name) in ROLES.items():
+            rows = [(i, data) for i, row_role, data in batch if row_role == role]
+            if not rows:
+                continue
+            model = serializer_class.Meta.model
+            first = StaffIdSequence.objects.allocate(model.staff_id_prefix, model, count=len(rows))
+            profiles = []
+            for offset, (i, data) in enumerate(rows):
+                fields = {key: value for key, value in data.items() if key not in ('username', 'password')}
+                staff_id = f"{model.staff_id_prefix}{first + offset:04d}"
+                user_id = user_ids[data['username']]
+                profiles.append(model(user_id=user_id, staff_id=staff_id, **fields))
+                memberships.append(User.groups.through(user_id=user_id, group_id=groups[group_name].pk))
+                created.append({'row': i, 'role': role, 'username': data['username'], 'staff_id': staff_id})
+            model.objects.bulk_create(profiles)
+        User.groups.through.objects.bulk_create(memberships)
+        self.created.extend(created)
@@ -1,3 +1,90 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from api.models import Department, Doctor, Pharmacist, Receptionist
+from api.tests import admin_client
+
+from . import provisioning
+
+URL = '/api/admin/staff/bulk/'
+
+
+def staff_row(role, n, **extra):
+    return {
+        'role': role, 'username': f'{role}{n}', 'password': 'Secret-pass-1', 'first_name': 'F', 'last_name': 'L',
+        'email': f'{role}{n}@example.com', 'date_of_birth': '1990-01-01', **extra,
+    }
+
+
+class BulkStaffProvisionTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.department = Department.objects.create(department_name='Cardiology')
+
+    def test_good_rows_are_created_and_bad_rows_reported(self):
+        rows = [
+            staff_row('doctor', 1, department_id=self.department.pk),
+            staff_row('receptionist', 1),
+            staff_row('surgeon', 1),
+            staff_row('doctor', 2, department_id=9999),
+            staff_row('receptionist', 1),  # same username and email as row 1
+            staff_row('pharmacist', 1, pharmacy_license='PL-1'),
+        ]
+        response = self.client.post(URL, rows, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual([(row['row'], row['staff_id']) for row in body['created']],
+                         [(0, 'DR1001'), (1, 'RP1001'), (5, 'PH1001')])
+        self.assertEqual({error['row']: set(error['errors']) for error in body['errors']},
+                         {2: {'role'}, 3: {'department_id'}, 4: {'username', 'email'}})
+
+        doctor = Doctor.objects.get(staff_id='DR1001')
+        self.assertEqual(doctor.department_id, self.department)
+        self.assertEqual(list(doctor.user.groups.values_list('name', flat=True)), ['Doctor'])
+        self.assertTrue(doctor.user.check_password('Secret-pass-1'))
+        self.assertTrue(Pharmacist.objects.filter(user__username='pharmacist1').exists())
+
+    def test_csv_upload_and_existing_accounts(self):
+        User.objects.create_user('receptionist1', password='x')
+        csv = ('role,username,password,first_name,last_name,email,date_of_birth,phone\n'
+               'receptionist,receptionist1,pw-12345,A,B,a@example.com,1990-01-01,\n'
+               'receptionist,receptionist2,pw-12345,C,D,c@example.com,1990-01-01,555\n')
+        response = self.client.post(URL, csv, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['username'] for row in response.json()['created']], ['receptionist2'])
+        self.assertEqual(response.json()['errors'], [{'row': 0, 'errors': {'username': ['This username is already taken.']}}])
+        self.assertEqual(Receptionist.objects.get().phone, '555')
+
+    def test_staff_ids_continue_after_existing_profiles(self):
+        self.client.post(URL, [staff_row('receptionist', 1)], format='json')
+        response = self.client.post(URL, [staff_row('receptionist', 2), staff_row('receptionist', 3)], format='json')
+        self.assertEqual([row['staff_id'] for row in response.json()['created']], ['RP1002', 'RP1003'])
+
+    def test_nothing_valid_is_a_bad_request(self):
+        self.assertEqual(self.client.post(URL, [], format='json').status_code, 400)
+        response = self.client.post(URL, {'staff': [{'role': 'doctor'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], [])
+        self.assertFalse(User.objects.exclude(username='admin').exists())
+
+    def test_admins_only(self):
+        self.client.force_authenticate(User.objects.create_user('someone', password='x'))
+        self.assertEqual(self.client.post(URL, [staff_row('receptionist', 1)], format='json').status_code, 403)
+
+
+class PasswordHashingTests(TestCase):
+    @override_settings(PROVISIONING_HASH_WORKERS=2)
+    def test_broken_pool_falls_back_to_hashing_inline(self):
+        pool = mock.Mock()
+        pool.map.side_effect = provisioning.BrokenProcessPool
+        with mock.patch.object(provisioning, '_get_pool', return_value=pool), \
+                mock.patch.object(provisioning, '_discard_pool') as discard:
+            hashes = provisioning.hash_passwords([f'pw{n}' for n in range(provisioning.POOL_THRESHOLD)])
+
+        discard.assert_called_once_with(pool)
+        self.assertEqual(len(hashes), provisioning.POOL_THRESHOLD)
+        self.assertTrue(User(password=hashes[3]).check_password('pw3'))
@@ -6,11 +6,15 @@ from .views import (
     LabTechnicianListCreateView, LabTechnicianRetrieveUpdateDestroyView,
     AdminListCreateView, AdminRetrieveUpdateDestroyView,
     MedicineListCreateView, MedicineRetrieveUpdateDestroyView,
-    LabTestListCreateView, LabTestRetrieveUpdateDestroyView,DepartmentListCreateView, DepartmentRetrieveUpdateDestroyView   
+    LabTestListCreateView, LabTestRetrieveUpdateDestroyView,DepartmentListCreateView, DepartmentRetrieveUpdateDestroyView,
+    BulkStaffProvisionView
 
 )
 
 urlpatterns = [
+    # Bulk staff upload (JSON or CSV)
+    path('staff/bulk/', BulkStaffProvisionView.as_view(), name='staff-bulk-provision'),
+
     # Receptionist
     path('receptionists/', ReceptionistListCreateView.as_view(), name='receptionist-list-create'),
     path('receptionists/<int:pk>/', ReceptionistRetrieveUpdateDestroyView.as_view(), name='receptionist-detail'),
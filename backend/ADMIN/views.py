@@ -2,13 +2,16 @@
 
 from rest_framework import generics
 from api.models import Receptionist,Doctor,Pharmacist,LabTechnician
+from api.utils.catalog_cache import CatalogCacheMixin
+from api.utils.fieldsets import SparseFieldsetMixin
+from api.utils.streaming import StreamingListMixin
 from .serializers import ReceptionistSerializer
 
-class ReceptionistListCreateView(generics.ListCreateAPIView):
+class ReceptionistListCreateView(StreamingListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Receptionist.objects.all()
     serializer_class = ReceptionistSerializer
 
-class ReceptionistRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class ReceptionistRetrieveUpdateDestroyView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Receptionist.objects.all()
     serializer_class = ReceptionistSerializer
     # lookup_field = 'id'
@@ -20,11 +23,11 @@ from rest_framework import generics
 from api.models import Doctor
 from .serializers import DoctorSerializer
 
-class DoctorListCreateView(generics.ListCreateAPIView):
+class DoctorListCreateView(StreamingListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
 
-class DoctorRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class DoctorRetrieveUpdateDestroyView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
 
@@ -36,11 +39,11 @@ from rest_framework import generics
 from api.models import Pharmacist
 from .serializers import PharmacistSerializer
 
-class PharmacistListCreateView(generics.ListCreateAPIView):
+class PharmacistListCreateView(StreamingListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Pharmacist.objects.all()
     serializer_class = PharmacistSerializer
 
-class PharmacistRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class PharmacistRetrieveUpdateDestroyView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Pharmacist.objects.all()
     serializer_class = PharmacistSerializer
     lookup_field = 'pk'
@@ -54,11 +57,11 @@ from rest_framework import generics
 from api.models import LabTechnician
 from .serializers import LabTechnicianSerializer
 
-class LabTechnicianListCreateView(generics.ListCreateAPIView):
+class LabTechnicianListCreateView(StreamingListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = LabTechnician.objects.all()
     serializer_class = LabTechnicianSerializer
 
-class LabTechnicianRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class LabTechnicianRetrieveUpdateDestroyView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = LabTechnician.objects.all()
     serializer_class = LabTechnicianSerializer
     lookup_field = 'pk'
@@ -70,11 +73,11 @@ from rest_framework import generics
 from api.models import Admin
 from .serializers import AdminSerializer
 
-class AdminListCreateView(generics.ListCreateAPIView):
+class AdminListCreateView(StreamingListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Admin.objects.all()
     serializer_class = AdminSerializer
 
-class AdminRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class AdminRetrieveUpdateDestroyView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Admin.objects.all()
     serializer_class = AdminSerializer
 
@@ -86,11 +89,12 @@ from rest_framework import generics
 from api.models import Medicine
 from .serializers import MedicineSerializer
 
-class MedicineListCreateView(generics.ListCreateAPIView):
+class MedicineListCreateView(CatalogCacheMixin, StreamingListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
+    catalog = 'medicine'
 
-class MedicineRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class MedicineRetrieveUpdateDestroyView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
 
@@ -102,11 +106,12 @@ from rest_framework import generics
 from api.models import LabTest
 from .serializers import LabTestSerializer
 
-class LabTestListCreateView(generics.ListCreateAPIView):
+class LabTestListCreateView(CatalogCacheMixin, StreamingListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = LabTest.objects.all()
     serializer_class = LabTestSerializer
+    catalog = 'labtest'
 
-class LabTestRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class LabTestRetrieveUpdateDestroyView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = LabTest.objects.all()
     serializer_class = LabTestSerializer
 
@@ -117,11 +122,49 @@ from rest_framework import generics
 from api.models import Department
 from .serializers import DepartmentSerializer
 
-class DepartmentListCreateView(generics.ListCreateAPIView):
+class DepartmentListCreateView(StreamingListMixin, SparseFieldsetMixin, generics.ListCreateAPIView):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
 
-class DepartmentRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class DepartmentRetrieveUpdateDestroyView(SparseFieldsetMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     lookup_field = 'pk'
+
+
+
+
+from rest_framework import status
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from api.permissions import IsAdmin
+from .provisioning import MAX_ROWS, CSVParser, Provisioner, read_csv
+
+class BulkStaffProvisionView(APIView):
+    """
+    Create many staff at once from a JSON list of rows, a text/csv body or an
+    uploaded CSV `file`. Every row needs role (receptionist, doctor, pharmacist,
+    labtechnician), username and password plus the profile fields.
+    """
+    permission_classes = [IsAdmin]
+    parser_classes = [JSONParser, CSVParser, MultiPartParser]
+
+    def post(self, request):
+        if 'file' in request.FILES:
+            try:
+                rows = read_csv(request.FILES['file'].read().decode('utf-8-sig'))
+            except UnicodeDecodeError:
+                return Response({"error": "The file must be UTF-8 encoded CSV."}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, dict):
+            rows = request.data.get('staff')
+        else:
+            rows = request.data
+
+        if not isinstance(rows, list) or not rows:
+            return Response({"error": "Send a non-empty list of staff rows."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > MAX_ROWS:
+            return Response({"error": f"At most {MAX_ROWS} rows per upload."}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = Provisioner(rows).run()
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST)
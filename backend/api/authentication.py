@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import UserRoleStamp
+from .utils.roles import ROLE_VERSION_CLAIM, UserRole, load_user_role
+
+
+def current_role_version(user):
+    try:
+        return user.role_stamp.version
+    except ObjectDoesNotExist:
+        return 0
+
+
+def role_token_claims(user):
+    stamp, _ = UserRoleStamp.objects.get_or_create(user=user)
+    return load_user_role(user).to_claims(stamp.version)
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds role, staff_id, profile id and the role version to issued tokens."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in role_token_claims(user).items():
+            token[claim] = value
+        return token
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-stamps the role claims on every refreshed access token."""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        access = AccessToken(data['access'])
+        user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: access[api_settings.USER_ID_CLAIM]})
+        for claim, value in role_token_claims(user).items():
+            access[claim] = value
+        data['access'] = str(access)
+        return data
+
+
+class RoleClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the role claims of tokens whose role version
+    still matches the user's UserRoleStamp, so permission checks need no queries.
+    The stamp is fetched together with the user.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            user, token = result
+            if token.get(ROLE_VERSION_CLAIM) == current_role_version(user):
+                request._user_role = UserRole.from_claims(user, token)
+        return result
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = self.user_model.objects.select_related('role_stamp').get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,122 @@
+import json
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Appointment, ConsultationBill, Department, Doctor, Patient
+
+
+class Command(BaseCommand):
+    help = ("Seed a large appointment table and record EXPLAIN output and latency for the appointment hot-path "
+            "queries. Seeded rows are rolled back unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help="Appointments to seed.")
+        parser.add_argument('--doctors', type=int, default=20, help="Doctors to spread them over.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per query.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--keep', action='store_true', help="Commit the seeded rows instead of rolling back.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            doctors = self.seed(options['rows'], options['doctors'])
+            results = [self.measure(name, queryset, options['repeat']) for name, queryset in self.queries(doctors)]
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        for result in results:
+            self.stdout.write(self.style.MIGRATE_HEADING(result['query']))
+            self.stdout.write(f"  median {result['median_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms, "
+                              f"{result['rows']} row(s)")
+            self.stdout.write(f"  {result['explain']}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'rows': options['rows'], 'results': results}, f, indent=2)
+
+    def seed(self, rows, doctor_count):
+        department, _ = Department.objects.get_or_create(department_name='Benchmark')
+        doctors = []
+        for i in range(doctor_count):
+            user = User.objects.create(username=f'benchmark_doctor_{i}')
+            doctors.append(Doctor.objects.create(
+                user=user, staff_id=f'BM{i:04d}', first_name='Bench', last_name=str(i),
+                department_id=department, email=f'benchmark_doctor_{i}@example.com', date_of_birth=date(1980, 1, 1)
+            ))
+
+        patients = Patient.objects.bulk_create(
+            Patient(first_name='Bench', last_name=str(i), date_of_birth=date(1990, 1, 1), phone='0000000000')
+            for i in range(max(rows // 50, 1))
+        )
+        patient_ids = list(Patient.objects.filter(first_name='Bench').values_list('id', flat=True)[:len(patients)])
+
+        # Spread appointments over the last year and the next few days, mostly in the past.
+        now = timezone.now()
+        first_day = now - timedelta(days=365)
+        statuses = ['Completed'] * 6 + ['Cancelled'] * 2 + ['Pending'] * 2
+        batch = []
+        for i in range(rows):
+            start = first_day + timedelta(days=random.randint(0, 368), hours=random.randint(10, 16),
+                                          minutes=random.choice([0, 15, 30, 45]))
+            batch.append(Appointment(
+                doctor_id=random.choice(doctors).staff_id, patient_id=random.choice(patient_ids),
+                start_time=start, end_time=start + timedelta(minutes=15), status=random.choice(statuses)
+            ))
+            if len(batch) == 5000:
+                Appointment.objects.bulk_create(batch)
+                batch = []
+        Appointment.objects.bulk_create(batch)
+
+        appointment_ids = Appointment.objects.filter(doctor__in=doctors).values_list('id', flat=True).iterator()
+        bills = []
+        for appointment_id in appointment_ids:
+            bills.append(ConsultationBill(appointment_id=appointment_id, amount=500, paid=random.random() < 0.8))
+            if len(bills) == 5000:
+                ConsultationBill.objects.bulk_create(bills)
+                bills = []
+        ConsultationBill.objects.bulk_create(bills)
+        return doctors
+
+    def queries(self, doctors):
+        doctor = doctors[0]
+        now = timezone.now()
+        day = timezone.localdate()
+        day_start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+        yield 'overlap check / slot grid rebuild (doctor + day + status)', Appointment.objects.filter(
+            doctor_id=doctor.staff_id, start_time__gte=day_start, start_time__lt=day_start + timedelta(days=1),
+            status='Pending'
+        ).values_list('start_time', 'end_time')
+        yield 'expiry sweep (status + start_time)', Appointment.objects.filter(
+            status='Pending', start_time__lt=now
+        ).order_by('start_time').values_list('id', 'doctor_id', 'start_time')[:500]
+        yield 'AppointmentFilter (status + start_time__date)', Appointment.objects.filter(
+            status='Pending', start_time__date=day
+        ).order_by('-start_time')[:10]
+        yield 'doctor listing (doctor + consultationbill__paid)', Appointment.objects.filter(
+            doctor__staff_id=doctor.staff_id, consultationbill__paid=True
+        ).order_by('-start_time')[:10]
+        yield 'receptionist listing (-start_time)', Appointment.objects.order_by('-start_time')[:10]
+
+    def measure(self, name, queryset, repeat):
+        timings = []
+        rows = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = len(list(queryset.all()))
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return {
+            'query': name,
+            'sql': str(queryset.query),
+            'explain': queryset.explain(),
+            'rows': rows,
+            'median_ms': statistics.median(timings),
+            'p95_ms': timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        }
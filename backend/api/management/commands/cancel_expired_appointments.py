@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.utils.sweeper import DEFAULT_BATCH_SIZE, cancel_expired_appointments
+
+
+class Command(BaseCommand):
+    help = "Cancel pending appointments whose start time has passed. Run from cron, or with --interval to keep sweeping."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows cancelled per transaction.")
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stop a run after this many batches.")
+        parser.add_argument('--interval', type=int, default=None,
+                            help="Seconds between runs. Without it the command sweeps once and exits.")
+
+    def handle(self, *args, **options):
+        while True:
+            run = cancel_expired_appointments(
+                batch_size=options['batch_size'],
+                max_batches=options['max_batches'],
+            )
+            self.stdout.write(
+                f"Cancelled {run.cancelled_count} expired appointment(s) in {run.batches} batch(es)."
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,116 @@
+import csv
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Patient
+from api.utils.validators import validate_phone
+
+REQUIRED_COLUMNS = ('first_name', 'last_name', 'date_of_birth', 'phone')
+OPTIONAL_COLUMNS = ('blood_group', 'email', 'address')
+
+
+def clean_row(row):
+    """
+    A Patient built from one CSV row, checked against the model's own field rules
+    (lengths, choices, date and email formats) and the shared phone rule.
+    Returns (patient, None) or (None, {column: message}).
+    """
+    values, errors = {}, {}
+    for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS:
+        raw = (row.get(name) or '').strip()
+        if not raw and name in OPTIONAL_COLUMNS:
+            continue
+        field = Patient._meta.get_field(name)
+        try:
+            values[name] = field.clean(raw, None)
+            if name == 'phone':
+                validate_phone(values[name])
+        except ValidationError as exc:
+            errors[name] = ' '.join(exc.messages)
+    if errors:
+        return None, errors
+    return Patient(**values), None
+
+
+class Command(BaseCommand):
+    help = ("Import patients from a CSV file with columns first_name, last_name, date_of_birth (YYYY-MM-DD), "
+            "phone and optionally blood_group, email, address. The file is streamed, so any size works; "
+            "rows that fail validation are written to a rejects file.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Patients inserted per query.")
+        parser.add_argument('--rejects', help="Where to write rejected rows (default: <path>.rejects.csv).")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Encoding of the CSV file.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only; insert nothing.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        rejects_path = options['rejects'] or f"{options['path']}.rejects.csv"
+
+        try:
+            source = open(options['path'], newline='', encoding=options['encoding'])
+        except OSError as exc:
+            raise CommandError(f"Cannot read {options['path']}: {exc}")
+
+        with source:
+            reader = csv.DictReader(source)
+            missing = set(REQUIRED_COLUMNS) - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f"Missing column(s): {', '.join(sorted(missing))}.")
+
+            with open(rejects_path, 'w', newline='', encoding='utf-8') as rejects_file:
+                rejects = csv.DictWriter(rejects_file, fieldnames=['line', *reader.fieldnames, 'errors'],
+                                         extrasaction='ignore')
+                rejects.writeheader()
+                imported, rejected = self._import(reader, rejects, options)
+
+        if not rejected:
+            os.remove(rejects_path)
+        self.stdout.write(
+            f"{'Checked' if options['dry_run'] else 'Imported'} {imported} patient(s), rejected {rejected}"
+            + (f" (see {rejects_path})." if rejected else ".")
+        )
+
+    def _import(self, reader, rejects, options):
+        batch_size, dry_run = options['batch_size'], options['dry_run']
+        started = last_report = time.monotonic()
+        imported = rejected = 0
+        batch = []
+
+        for row in reader:
+            patient, errors = clean_row(row)
+            if errors:
+                rejected += 1
+                rejects.writerow({
+                    **row, 'line': reader.line_num,
+                    'errors': '; '.join(f"{name}: {message}" for name, message in errors.items()),
+                })
+                continue
+            batch.append(patient)
+            if len(batch) >= batch_size:
+                imported += self._flush(batch, dry_run)
+                if time.monotonic() - last_report >= 5:
+                    last_report = time.monotonic()
+                    self._report(imported, rejected, started)
+
+        imported += self._flush(batch, dry_run)
+        self._report(imported, rejected, started)
+        return imported, rejected
+
+    def _flush(self, batch, dry_run):
+        count = len(batch)
+        if count and not dry_run:
+            Patient.objects.bulk_create(batch)
+        batch.clear()
+        return count
+
+    def _report(self, imported, rejected, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        rate = (imported + rejected) / elapsed
+        self.stdout.write(f"{imported + rejected} row(s) read, {imported} imported, {rejected} rejected "
+                          f"in {elapsed:.1f}s ({rate:,.0f} rows/s).")
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import PatientTimelineEntry
+from api.utils import timeline
+from labtechnician.models import LabReport
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the patient timeline from prescriptions and lab reports. Run once after deploying the "
+            "timeline, or whenever it is suspected to have drifted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, help="Only rebuild this patient's timeline.")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Rows read per query.")
+
+    def handle(self, *args, **options):
+        prescriptions = timeline.prescription_queryset().prefetch_related('medical_histories')
+        reports = LabReport.objects.select_related('prescription', 'generated_by').prefetch_related(
+            'labreporttestresult_set__prescription_lab_test__lab_test'
+        )
+        entries = PatientTimelineEntry.objects.all()
+        if options['patient']:
+            prescriptions = prescriptions.filter(patient_id=options['patient'])
+            reports = reports.filter(prescription__patient_id=options['patient'])
+            entries = entries.filter(patient_id=options['patient'])
+
+        rows = []
+        for prescription in prescriptions.order_by('pk').iterator(chunk_size=options['chunk_size']):
+            history = next(iter(prescription.medical_histories.all()), None)
+            rows.append(PatientTimelineEntry(
+                patient_id=prescription.patient_id, kind='prescription', source_id=prescription.pk,
+                occurred_at=timeline.prescription_occurred_at(prescription),
+                payload=timeline.prescription_payload(prescription, history.diagnosis if history else None),
+            ))
+        for report in reports.order_by('pk').iterator(chunk_size=options['chunk_size']):
+            rows.append(PatientTimelineEntry(
+                patient_id=report.prescription.patient_id, kind='lab_report', source_id=report.pk,
+                occurred_at=report.created_at, payload=timeline.lab_report_payload(report),
+            ))
+
+        with transaction.atomic():
+            entries.delete()
+            PatientTimelineEntry.objects.bulk_create(rows, batch_size=options['chunk_size'])
+        self.stdout.write(f"Wrote {len(rows)} timeline entr{'y' if len(rows) == 1 else 'ies'}.")
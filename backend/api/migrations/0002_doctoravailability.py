@@ -0,0 +1,26 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('booked', models.BigIntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.doctor', to_field='staff_id')),
+            ],
+            options={
+                'unique_together': {('doctor', 'day')},
+            },
+        ),
+    ]
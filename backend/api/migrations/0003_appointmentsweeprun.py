@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_doctoravailability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSweepRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('cutoff', models.DateTimeField()),
+                ('batches', models.PositiveIntegerField(default=0)),
+                ('cancelled_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
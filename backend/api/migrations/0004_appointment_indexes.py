@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_appointmentsweeprun'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'start_time', 'status'], name='appt_doctor_start_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'start_time'], name='appt_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['start_time'], name='appt_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultationbill',
+            index=models.Index(fields=['appointment', 'paid'], name='consultbill_appt_paid_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['bill_date'], name='bill_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescriptionlabtest',
+            index=models.Index(fields=['created_at'], name='rxlabtest_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescriptionlabtest',
+            index=models.Index(fields=['status', 'created_at'], name='rxlabtest_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_userrolestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientTimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurred_at', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('prescription', 'Prescription'), ('lab_report', 'Lab report')], max_length=20)),
+                ('source_id', models.PositiveIntegerField()),
+                ('payload', models.JSONField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='api.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'occurred_at'], name='timeline_patient_time_idx')],
+                'unique_together': {('kind', 'source_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Whatever is in stock today becomes each medicine's opening balance.
+    Medicine = apps.get_model('api', 'Medicine')
+    StockMovement = apps.get_model('api', 'StockMovement')
+    StockMovement.objects.bulk_create(
+        [
+            StockMovement(medicine_id=pk, delta=stock, reason='opening')
+            for pk, stock in Medicine.objects.exclude(stock=0).values_list('pk', 'stock').iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_bill_item_unit_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('receipt', 'Receipt'), ('sale', 'Sale'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bill', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='api.bill')),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='api.medicine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['medicine', 'created_at'], name='stockmove_medicine_time_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
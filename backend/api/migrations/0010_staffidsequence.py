@@ -0,0 +1,20 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_stockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaffIdSequence',
+            fields=[
+                ('prefix', models.CharField(max_length=4, primary_key=True, serialize=False)),
+                ('last_number', models.PositiveIntegerField()),
+            ],
+        ),
+    ]
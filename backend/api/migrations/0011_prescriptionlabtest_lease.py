@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_staffidsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prescriptionlabtest',
+            name='claim_token',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='prescriptionlabtest',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claimed_lab_tests', to='api.labtechnician'),
+        ),
+        migrations.AddField(
+            model_name='prescriptionlabtest',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_prescriptionlabtest_lease'),
+    ]
+
+    # The new index is added first: MySQL won't drop the FK's own index until
+    # another index leads with the doctor column.
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'status', 'start_time'], name='appt_doctor_status_start_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_doctor_start_status_idx',
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='doctor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.doctor', to_field='staff_id'),
+        ),
+    ]
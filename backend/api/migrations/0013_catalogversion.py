@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_appointment_doctor_status_start_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('catalog', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32)),
+                ('modified', models.PositiveBigIntegerField()),
+            ],
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import CASCADE
+from django.db import IntegrityError, models, transaction
+from django.db.models import CASCADE, F
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
@@ -9,7 +9,69 @@ from rest_framework.exceptions import ValidationError
 
 # Create your models here.
 
-class Receptionist(models.Model):
+FIRST_STAFF_NUMBER = 1001
+
+
+class StaffIdSequenceManager(models.Manager):
+    def allocate(self, prefix, model, count=1):
+        """
+        Reserve the next `count` numbers for a staff id prefix and return the first.
+        The increment row-locks the prefix's row until the caller's transaction
+        ends, so concurrent registrations queue on it instead of colliding, and a
+        rolled-back registration gives its number back.
+        """
+        with transaction.atomic():
+            if not self.filter(prefix=prefix).update(last_number=F('last_number') + count):
+                self._start(prefix, model)
+                self.filter(prefix=prefix).update(last_number=F('last_number') + count)
+            return self.filter(prefix=prefix).values_list('last_number', flat=True).get() - count + 1
+
+    def _start(self, prefix, model):
+        # First use of a prefix: continue after whatever ids the table already holds.
+        numbers = [
+            int(staff_id[len(prefix):])
+            for staff_id in model.objects.filter(staff_id__startswith=prefix).values_list('staff_id', flat=True)
+            if staff_id[len(prefix):].isdigit()
+        ]
+        try:
+            with transaction.atomic():
+                self.create(prefix=prefix, last_number=max(numbers, default=FIRST_STAFF_NUMBER - 1))
+        except IntegrityError:
+            pass  # started concurrently
+
+
+class StaffIdSequence(models.Model):
+    """The last staff id number handed out for each prefix (RP, DR, PH, LT)."""
+    prefix = models.CharField(max_length=4, primary_key=True)
+    last_number = models.PositiveIntegerField()
+
+    objects = StaffIdSequenceManager()
+
+    def __str__(self):
+        return f"{self.prefix}{self.last_number:04d}"
+
+
+class SequentialStaffIdMixin:
+    """Gives a staff profile its staff_id ("<prefix>1001", ...) from StaffIdSequence on first save."""
+    staff_id_prefix = None
+
+    def save(self, *args, **kwargs):
+        if self.staff_id:
+            return super().save(*args, **kwargs)
+        # Number and row commit together, so ids are unique and gap-free.
+        with transaction.atomic():
+            number = StaffIdSequence.objects.allocate(self.staff_id_prefix, type(self))
+            self.staff_id = f"{self.staff_id_prefix}{number:04d}"
+            try:
+                super().save(*args, **kwargs)
+            except Exception:
+                self.staff_id = ''
+                raise
+
+
+class Receptionist(SequentialStaffIdMixin, models.Model):
+    staff_id_prefix = 'RP'
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     staff_id = models.CharField(max_length=10, unique=True)
     first_name = models.CharField(max_length=30)
@@ -31,22 +93,34 @@ class Receptionist(models.Model):
 
 
 
-    def save (self, *args, **kwargs):
-        if not self.staff_id:
-            last_receptionist = Receptionist.objects.order_by('-staff_id').first()
+    def __str__(self):
+        return self.staff_id
 
-            if last_receptionist:
-                last_receptionist_num = int(last_receptionist.staff_id[2:])
-                new_receptionist_num = last_receptionist_num + 1
-            else:
-                new_receptionist_num = 1001
+class UserRoleStamp(models.Model):
+    """
+    Bumped whenever a user's groups or staff profiles change. Access tokens carry
+    the version they were issued with, so stale role claims are ignored.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='role_stamp')
+    version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} v{self.version}"
 
-            self.staff_id = f"RP{new_receptionist_num:04d}"
 
-        super().save(*args,**kwargs)
+class CatalogVersion(models.Model):
+    """
+    The current version of a cached reference catalog (api.utils.catalog_cache).
+    Kept in the database rather than the cache so that every worker process
+    sees a write the moment it commits.
+    """
+    catalog = models.CharField(max_length=20, primary_key=True)
+    token = models.CharField(max_length=32)
+    modified = models.PositiveBigIntegerField()  # epoch seconds, for Last-Modified
 
     def __str__(self):
-        return self.staff_id
+        return f"{self.catalog} {self.token}"
+
 
 class Patient(models.Model):
     first_name = models.CharField(max_length=30, null=False, blank=False)  # Required field
@@ -83,7 +157,9 @@ class Department(models.Model):
     def __str__(self):
         return self.department_name
 
-class Doctor(models.Model):
+class Doctor(SequentialStaffIdMixin, models.Model):
+    staff_id_prefix = 'DR'
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     staff_id = models.CharField(max_length=10, unique=True)
     first_name = models.CharField(max_length=25)
@@ -105,27 +181,15 @@ class Doctor(models.Model):
     sex = models.CharField(max_length=10, choices=SEX_CHOICES, null=True, blank=True)
     availability = models.BooleanField(default=True)
 
-    def save (self, *args, **kwargs):
-        if not self.staff_id:
-            last_doctor = Doctor.objects.order_by('-id').first()
-
-            if last_doctor:
-                last_doctor_num = int(last_doctor.staff_id[2:])
-                new_doctor_num = last_doctor_num + 1
-            else:
-                new_doctor_num = 1001
-
-            self.staff_id = f"DR{new_doctor_num:04d}"
-
-        super().save(*args,**kwargs)
-
     def __str__(self):
         return self.staff_id
 
 
 class Appointment(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, null=False, blank=False)
-    doctor = models.ForeignKey(Doctor, to_field='staff_id', on_delete=models.CASCADE, null=False, blank=False)
+    # Indexed by appt_doctor_status_start_idx, which leads with doctor
+    doctor = models.ForeignKey(Doctor, to_field='staff_id', on_delete=models.CASCADE, null=False, blank=False,
+                               db_index=False)
     start_time = models.DateTimeField(null=False, blank=False)
     end_time = models.DateTimeField(null=False, blank=False)
     status = models.CharField(
@@ -134,6 +198,16 @@ class Appointment(models.Model):
         default='Pending'
     )
 
+    class Meta:
+        indexes = [
+            # Slot grid rebuilds / overlap checks: doctor and status equal, start_time range last
+            models.Index(fields=['doctor', 'status', 'start_time'], name='appt_doctor_status_start_idx'),
+            # Expiry sweep and AppointmentFilter: status + start_time
+            models.Index(fields=['status', 'start_time'], name='appt_status_start_idx'),
+            # Default listing order (-start_time)
+            models.Index(fields=['start_time'], name='appt_start_idx'),
+        ]
+
     @property
     def patient_name(self):
         """Return the patient's full name."""
@@ -144,6 +218,35 @@ class Appointment(models.Model):
 
 
 
+class DoctorAvailability(models.Model):
+    """
+    Precomputed slot grid for one doctor on one day. Bit i of `booked` is set when
+    the i-th slot of the working day (see api.utils.availability) is held by a
+    pending appointment.
+    """
+    doctor = models.ForeignKey(Doctor, to_field='staff_id', on_delete=models.CASCADE)
+    day = models.DateField()
+    booked = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('doctor', 'day')
+
+    def __str__(self):
+        return f"Availability for {self.doctor_id} on {self.day}"
+
+
+class AppointmentSweepRun(models.Model):
+    """One run of the expired-appointment sweeper and how many rows it cancelled."""
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    cutoff = models.DateTimeField()
+    batches = models.PositiveIntegerField(default=0)
+    cancelled_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Sweep at {self.started_at:%Y-%m-%d %H:%M}: {self.cancelled_count} cancelled"
+
+
 class Medicine(models.Model):
     medicine_name = models.CharField(max_length=100, unique=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -205,6 +308,20 @@ class PrescriptionLabTest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Work-queue lease (labtechnician.workqueue): a pending test is held by one
+    # technician until lease_expires_at, after which anyone may claim it again.
+    claimed_by = models.ForeignKey('LabTechnician', on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='claimed_lab_tests')
+    claim_token = models.UUIDField(null=True, blank=True, db_index=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the lab listings (-created_at), pending-only or not
+            models.Index(fields=['created_at'], name='rxlabtest_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='rxlabtest_status_created_idx'),
+        ]
+
 
     def __str__(self):
         return f"{self.lab_test.test_name} for {self.prescription.patient}"
@@ -219,6 +336,34 @@ class MedicalHistory(models.Model):
     def __str__(self):
         return f"Medical History for {self.patient} - {self.diagnosis} ({self.date_of_occurrence})"
 
+
+class PatientTimelineEntry(models.Model):
+    """
+    One event in a patient's history (a prescription, a lab report), rendered to
+    JSON when it happens so the timeline is read without joining anything.
+    Maintained by api.utils.timeline.
+    """
+    KIND_CHOICES = [
+        ('prescription', 'Prescription'),
+        ('lab_report', 'Lab report'),
+    ]
+
+    patient = models.ForeignKey(Patient, related_name='timeline', on_delete=models.CASCADE)
+    occurred_at = models.DateTimeField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    source_id = models.PositiveIntegerField()
+    payload = models.JSONField()
+
+    class Meta:
+        unique_together = ('kind', 'source_id')
+        indexes = [
+            # The timeline endpoint: one range scan per patient
+            models.Index(fields=['patient', 'occurred_at'], name='timeline_patient_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.source_id} for patient {self.patient_id}"
+
 class Bill(models.Model):
     BILL_TYPES = [
         ('Medicine', 'Medicine'),
@@ -232,6 +377,12 @@ class Bill(models.Model):
     bill_date = models.DateTimeField(auto_now_add=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of bills (-bill_date)
+            models.Index(fields=['bill_date'], name='bill_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
 
@@ -239,10 +390,38 @@ class MedicineBillItem(models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='medicines')
     medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # Medicine.price when billed
 
 class LabTestBillItem(models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='lab_tests')
     lab_test = models.ForeignKey(LabTest, on_delete=models.CASCADE)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # LabTest.price when billed
+
+class StockMovement(models.Model):
+    """
+    Append-only stock ledger. Medicine.stock is the running balance of its
+    movements; api.utils.stock writes both together.
+    """
+    REASON_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('receipt', 'Receipt'),
+        ('sale', 'Sale'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='stock_movements')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    bill = models.ForeignKey(Bill, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['medicine', 'created_at'], name='stockmove_medicine_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_reason_display()} {self.delta:+d} of {self.medicine_id}"
 
 class ConsultationBill(models.Model):  # Renamed from AppointmentBill
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE)
@@ -250,10 +429,18 @@ class ConsultationBill(models.Model):  # Renamed from AppointmentBill
     bill_date = models.DateTimeField(auto_now_add=True)
     paid = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Doctors only see appointments joined through consultationbill__paid
+            models.Index(fields=['appointment', 'paid'], name='consultbill_appt_paid_idx'),
+        ]
+
     def __str__(self):
         return f"Consultation Bill for {self.patient} - Amount: {self.amount}"
 
-class Pharmacist(models.Model):
+class Pharmacist(SequentialStaffIdMixin, models.Model):
+    staff_id_prefix = 'PH'
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     staff_id = models.CharField(max_length=10, unique=True)
     first_name = models.CharField(max_length=30)
@@ -276,23 +463,11 @@ class Pharmacist(models.Model):
 
     
 
-    def save (self, *args, **kwargs):
-        if not self.staff_id:
-            last_pharmasist = Pharmacist.objects.order_by('-staff_id').first()
-
-            if last_pharmasist:
-                last_pharmasist_num= int(last_pharmasist.staff_id[2:])
-                new_pharmasist_num = last_pharmasist_num + 1
-            else:
-                new_pharmasist_num = 1001
-
-            self.staff_id = f"PH{new_pharmasist_num:04d}"
-
-        super().save(*args,**kwargs)
-
     def __str__(self):
         return self.staff_id
-class LabTechnician(models.Model):
+class LabTechnician(SequentialStaffIdMixin, models.Model):
+    staff_id_prefix = 'LT'
+
     user = models.OneToOneField(User, on_delete=models.CASCADE,related_name='lab_technician'
 )
     staff_id = models.CharField(max_length=10, unique=True)
@@ -313,20 +488,6 @@ class LabTechnician(models.Model):
     sex = models.CharField(max_length=10, choices=SEX_CHOICES, null=True, blank=True)
     lab_certification= models.CharField(max_length=100, null=True, blank=True)
 
-    def save (self, *args, **kwargs):
-        if not self.staff_id:
-            last_labtechnician = LabTechnician.objects.order_by('-staff_id').first()
-
-            if last_labtechnician:
-                last_labtechnician_num = int(last_labtechnician. staff_id[2:])
-                new_labtechnician_num = last_labtechnician_num + 1
-            else:
-                new_labtechnician_num = 1001
-
-            self.staff_id = f"LT{new_labtechnician_num:04d}"
-
-        super().save(*args,**kwargs)
-
     def __str__(self):
         return self.staff_id
 
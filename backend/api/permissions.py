@@ -2,11 +2,12 @@ from rest_framework import permissions
 from .models import Doctor, Receptionist, Appointment, Bill, Prescription, \
     PrescriptionMedicine, PrescriptionLabTest, MedicalHistory, ConsultationBill, Department, \
     Patient, LabTest, LabTechnician, Medicine, Pharmacist, MedicineBillItem, LabTestBillItem  # Import your Doctor model
+from .utils.roles import get_request_role
 
 class IsAdmin(permissions.BasePermission):
 
     def has_permission(self, request, view):
-        return request.user.is_superuser or request.user.groups.filter(name="Admin").exists()
+        return get_request_role(request).is_admin
 
 class IsDoctor(permissions.BasePermission):
     """
@@ -21,7 +22,7 @@ class IsDoctor(permissions.BasePermission):
 
         # Check if the user is authenticated and is linked to a Doctor
         if request.user and request.user.is_authenticated:
-            return Doctor.objects.filter(user=request.user).exists()
+            return get_request_role(request).has_profile('doctor')
         return False
 
     def has_object_permission(self, request, view, obj):
@@ -30,15 +31,16 @@ class IsDoctor(permissions.BasePermission):
         The doctor should only be able to access their own prescriptions, appointments, and related data.
         """
         # Allow full access to admins
-        if request.user.is_superuser or request.user.groups.filter(name="Admin").exists():
+        role = get_request_role(request)
+        if role.is_admin:
             return True
 
         if hasattr(obj, "doctor"):  # Direct doctor reference (Appointment)
-            return obj.doctor.staff_id == request.user.doctor.staff_id
+            return obj.doctor_id == role.staff_id_for('doctor')
 
         if hasattr(obj,
                    "prescription"):  # Related via Prescription (MedicalHistory, PrescriptionMedicine, PrescriptionLabTest)
-            return obj.prescription.appointment.doctor.staff_id == request.user.doctor.staff_id
+            return obj.prescription.appointment.doctor_id == role.staff_id_for('doctor')
 
         return False  # Deny access for any other objects
 
@@ -52,15 +54,16 @@ class IsReceptionist(permissions.BasePermission):
 
     def has_permission(self, request, view):
         # Allow full access to admins
-        if request.user.is_superuser or request.user.groups.filter(name="Admin").exists():
+        role = get_request_role(request)
+        if role.is_admin:
             return True
 
         # Ensure the user is authenticated and is a Receptionist
-        return request.user.is_authenticated and Receptionist.objects.filter(user=request.user).exists()
+        return request.user.is_authenticated and role.has_profile('receptionist')
 
     def has_object_permission(self, request, view, obj):
         # Allow full access to admins
-        if request.user.is_superuser or request.user.groups.filter(name="Admin").exists():
+        if get_request_role(request).is_admin:
             return True
 
         # Receptionists can manage appointments and billing
@@ -80,17 +83,18 @@ class IsPharmacist(permissions.BasePermission):
 
     def has_permission(self, request, view):
         # Allow full access to admins
-        if request.user.is_superuser or request.user.groups.filter(name="Admin").exists():
+        role = get_request_role(request)
+        if role.is_admin:
             return True
 
         # Check if the user is authenticated and is a Pharmacist
         if request.user and request.user.is_authenticated:
-            return Pharmacist.objects.filter(user=request.user).exists()
+            return role.has_profile('pharmacist')
         return False
 
     def has_object_permission(self, request, view, obj):
         # Allow full access to admins
-        if request.user.is_superuser or request.user.groups.filter(name="Admin").exists():
+        if get_request_role(request).is_admin:
             return True
 
         # Pharmacists can access medicine-related objects
@@ -115,17 +119,18 @@ class IsLabTechnician(permissions.BasePermission):
 
     def has_permission(self, request, view):
         # Allow full access to admins
-        if request.user.is_superuser or request.user.groups.filter(name="Admin").exists():
+        role = get_request_role(request)
+        if role.is_admin:
             return True
 
         # Check if the user is authenticated and is a LabTechnician
         if request.user and request.user.is_authenticated:
-            return LabTechnician.objects.filter(user=request.user).exists()
+            return role.has_profile('labtechnician')
         return False
 
     def has_object_permission(self, request, view, obj):
         # Allow full access to admins
-        if request.user.is_superuser or request.user.groups.filter(name="Admin").exists():
+        if get_request_role(request).is_admin:
             return True
 
         # Lab technicians can access lab test-related objects
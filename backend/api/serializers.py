@@ -1,4 +1,5 @@
 # api/serializers.py
+from collections import Counter
 from datetime import datetime
 from warnings import catch_warnings
 
@@ -11,6 +12,8 @@ from rest_framework.exceptions import ValidationError
 from .models import Appointment, PrescriptionLabTest, PrescriptionMedicine, Prescription, ConsultationBill, \
     Bill, Doctor, Receptionist, Department, MedicalHistory, Medicine, LabTest, Patient, MedicineBillItem, \
     LabTestBillItem
+from .utils import doctor_directory, stock, validators
+from .utils.availability import CLOSING_HOUR, OPENING_HOUR, is_slot_free
 
 
 class PatientSerializer(serializers.ModelSerializer):
@@ -22,15 +25,25 @@ class PatientSerializer(serializers.ModelSerializer):
         """
         Custom validation for phone number format.
         """
-        if not value.isdigit() or len(value) != 10:
-            raise serializers.ValidationError("Invalid phone number format.")
-        return value
+        return validators.validate_phone(value)
+
+
+class DirectoryDoctorField(serializers.SlugRelatedField):
+    """Resolves staff_id through the in-process doctor directory instead of a query per request."""
+
+    def to_internal_value(self, data):
+        if not isinstance(data, (str, int)):
+            self.fail('invalid')
+        doctor = doctor_directory.get_doctor(str(data))
+        if doctor is None:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=str(data))
+        return doctor
 
 
 class AppointmentSerializer(serializers.ModelSerializer):
     doctor_name = serializers.CharField(source="doctor.first_name", read_only=True)
     patient_name = serializers.SerializerMethodField(read_only=True)
-    doctor = serializers.SlugRelatedField(
+    doctor = DirectoryDoctorField(
         slug_field='staff_id',
         queryset=Doctor.objects.all()
     )
@@ -61,26 +74,21 @@ class AppointmentSerializer(serializers.ModelSerializer):
         if end_time <= start_time:
             raise serializers.ValidationError("End time must be after start time.")
 
-        # Business Hours Validation (10 AM to 5 PM)
-        start_hour = start_time.time().hour
-        end_hour = end_time.time().hour
+        # Business Hours Validation (10 AM to 5 PM), the same day the slot grid covers
+        opening = start_time.replace(hour=OPENING_HOUR, minute=0, second=0, microsecond=0)
+        closing = start_time.replace(hour=CLOSING_HOUR, minute=0, second=0, microsecond=0)
 
-        if start_hour < 10 or end_hour > 17:
+        if start_time < opening or end_time > closing:
             raise serializers.ValidationError("Appointments can only be booked between 10 AM and 5 PM.")
 
         if start_time.weekday() >= 5:  # 5 = Saturday, 6 = Sunday
             raise serializers.ValidationError("Appointments can only be booked on weekdays.")
 
-        # Overlap Validation (only for new/full updates)
+        # Overlap Validation (only for new/full updates), answered from the doctor's slot grid
         if not self.partial:
-            overlapping = Appointment.objects.filter(
-                doctor=data.get('doctor', self.instance.doctor if self.instance else None),
-                start_time__date=start_time.date(),
-                end_time__gte=start_time,
-                start_time__lte=end_time,
-                status='Pending'
-            ).exclude(id=self.instance.id if self.instance else None)
-            if overlapping.exists():
+            doctor = data.get('doctor')
+            doctor_id = doctor.staff_id if doctor else self.instance.doctor_id
+            if not is_slot_free(doctor_id, start_time, end_time, exclude=self.instance):
                 raise serializers.ValidationError("Time slot already booked with a pending appointment.")
 
         return data
@@ -136,14 +144,14 @@ class MedicineBillItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = MedicineBillItem
-        fields = ['id', 'medicine', 'quantity']
+        fields = ['id', 'medicine', 'quantity', 'unit_price']
 
 class LabTestBillItemSerializer(serializers.ModelSerializer):
     lab_test = LabTestSerializer()
 
     class Meta:
         model = LabTestBillItem
-        fields = ['id', 'lab_test']
+        fields = ['id', 'lab_test', 'unit_price']
 
 class BillSerializer(serializers.ModelSerializer):
     medicines = MedicineBillItemSerializer(many=True, read_only=True)
@@ -160,14 +168,22 @@ class BillSerializer(serializers.ModelSerializer):
 
 
 class MedicineBillItemCreateSerializer(serializers.ModelSerializer):
+    # Plain ids: BillCreateSerializer checks them all with one query
+    medicine = serializers.IntegerField(source='medicine_id')
+    quantity = serializers.IntegerField(min_value=1)
+
     class Meta:
         model = MedicineBillItem
-        fields = ['medicine', 'quantity']
+        fields = ['medicine', 'quantity', 'unit_price']
+        read_only_fields = ['unit_price']
 
 class LabTestBillItemCreateSerializer(serializers.ModelSerializer):
+    lab_test = serializers.IntegerField(source='lab_test_id')
+
     class Meta:
         model = LabTestBillItem
-        fields = ['lab_test']
+        fields = ['lab_test', 'unit_price']
+        read_only_fields = ['unit_price']
 
 class BillCreateSerializer(serializers.ModelSerializer):
     medicines = MedicineBillItemCreateSerializer(many=True, required=False)
@@ -180,21 +196,61 @@ class BillCreateSerializer(serializers.ModelSerializer):
             'bill_type', 'paid', 'total_amount',
             'medicines', 'lab_tests'
         ]
+        # Totalled server-side from the catalog prices
+        read_only_fields = ['total_amount']
 
+    def validate(self, data):
+        # One IN query per catalog; the rows are kept for pricing in create()
+        self._medicines = _in_bulk_or_fail(Medicine, 'medicines', 'medicine_id', data.get('medicines', []))
+        self._lab_tests = _in_bulk_or_fail(LabTest, 'lab_tests', 'lab_test_id', data.get('lab_tests', []))
+        return data
 
     def create(self, validated_data):
-        print(validated_data)
         medicines_data = validated_data.pop('medicines', [])
         lab_tests_data = validated_data.pop('lab_tests', [])
-        bill = Bill.objects.create(**validated_data)
 
-        for med in medicines_data:
-            MedicineBillItem.objects.create(bill=bill, **med)
-        for test in lab_tests_data:
-            LabTestBillItem.objects.create(bill=bill, **test)
+        medicine_items = [
+            MedicineBillItem(unit_price=self._medicines[med['medicine_id']].price, **med)
+            for med in medicines_data
+        ]
+        lab_test_items = [
+            LabTestBillItem(unit_price=self._lab_tests[test['lab_test_id']].price, **test)
+            for test in lab_tests_data
+        ]
+        validated_data['total_amount'] = (
+            sum(item.unit_price * item.quantity for item in medicine_items)
+            + sum(item.unit_price for item in lab_test_items)
+        )
+
+        with transaction.atomic():
+            bill = Bill.objects.create(**validated_data)
+            for item in medicine_items + lab_test_items:
+                item.bill = bill
+            MedicineBillItem.objects.bulk_create(medicine_items)
+            LabTestBillItem.objects.bulk_create(lab_test_items)
+
+            quantities = Counter()
+            for item in medicine_items:
+                quantities[item.medicine_id] += item.quantity
+            try:
+                stock.dispense(quantities, bill=bill)
+            except stock.InsufficientStock as exc:
+                raise serializers.ValidationError({'medicines': [
+                    f"Not enough {self._medicines[pk].medicine_name} in stock: {requested} requested, {available} available."
+                    for pk, (requested, available) in exc.shortages.items()
+                ]})
 
         return bill
 
+
+def _in_bulk_or_fail(model, field_name, id_key, lines):
+    ids = {line[id_key] for line in lines}
+    found = model.objects.in_bulk(ids) if ids else {}
+    unknown = ids - found.keys()
+    if unknown:
+        raise serializers.ValidationError({field_name: f"Unknown id(s): {', '.join(map(str, sorted(unknown)))}."})
+    return found
+
 class AppointmentSummarySerializer(serializers.ModelSerializer):
     patient_name = serializers.SerializerMethodField()
     doctor_name = serializers.SerializerMethodField()
@@ -0,0 +1,156 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Appointment, Doctor, Receptionist, Pharmacist, LabTechnician, Admin, Prescription, \
+    Department, Medicine, LabTest, StockMovement
+from .utils import availability, timeline
+from .utils.catalog_cache import bump_version
+from .utils.roles import bump_role_versions
+
+
+SNAPSHOT_FIELDS = ('doctor_id', 'start_time', 'end_time', 'status')
+UNKNOWN = object()  # loaded with some of SNAPSHOT_FIELDS deferred
+
+
+def _appointment_snapshot(appointment):
+    return tuple(getattr(appointment, name) for name in SNAPSHOT_FIELDS)
+
+
+def _is_pending(snapshot):
+    return snapshot is not None and snapshot[3] == 'Pending' and snapshot[1] and snapshot[2]
+
+
+def _snapshot_day(snapshot):
+    return snapshot[0], timezone.localtime(snapshot[1]).date()
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    # Remember what the row looked like when loaded so saves can tell what moved.
+    # Deferred fields (.only()) are not read here: that would cost a query per row.
+    if not instance.pk:
+        instance._availability_snapshot = None
+    elif any(name not in instance.__dict__ for name in SNAPSHOT_FIELDS):
+        instance._availability_snapshot = UNKNOWN
+    else:
+        instance._availability_snapshot = _appointment_snapshot(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def update_doctor_availability(sender, instance, **kwargs):
+    old = getattr(instance, '_availability_snapshot', None)
+    new = _appointment_snapshot(instance)
+    instance._availability_snapshot = new
+
+    if old == new:
+        return
+    if old is UNKNOWN:
+        availability.refresh_day(*_snapshot_day(new))
+        return
+    if not _is_pending(old):
+        # Newly booked (or re-opened): only bits need setting.
+        if _is_pending(new):
+            availability.occupy(new[0], new[1], new[2])
+        return
+
+    # Cancelled, completed or moved: rebuild the affected day(s).
+    days = {_snapshot_day(old)}
+    if _is_pending(new):
+        days.add(_snapshot_day(new))
+    for doctor_id, day in days:
+        availability.refresh_day(doctor_id, day)
+
+
+@receiver(post_delete, sender=Appointment)
+def release_doctor_availability(sender, instance, **kwargs):
+    old = getattr(instance, '_availability_snapshot', None)
+    if old is not UNKNOWN and _is_pending(old):
+        availability.refresh_day(*_snapshot_day(old))
+
+
+@receiver(post_delete, sender=Prescription)
+def forget_prescription_timeline(sender, instance, **kwargs):
+    timeline.forget('prescription', instance.pk)
+
+
+@receiver(post_delete, sender='labtechnician.LabReport')
+def forget_lab_report_timeline(sender, instance, **kwargs):
+    timeline.forget('lab_report', instance.pk)
+
+
+# Stock written with a plain save() (admin, the medicine API) goes into the
+# ledger as well; api.utils.stock writes its own movements.
+
+@receiver(post_init, sender=Medicine)
+def remember_stock(sender, instance, **kwargs):
+    instance._ledger_stock = instance.__dict__.get('stock')
+
+
+@receiver(post_save, sender=Medicine)
+def record_stock_adjustment(sender, instance, created, **kwargs):
+    old, new = instance._ledger_stock, instance.__dict__.get('stock')
+    instance._ledger_stock = new
+    if new is None:
+        return
+    if created:
+        if new:
+            StockMovement.objects.create(medicine=instance, delta=new, reason='opening')
+    elif old is not None and new != old:
+        StockMovement.objects.create(medicine=instance, delta=new - old, reason='adjustment')
+
+
+# Role claims in access tokens (api.authentication) are stamped with a version
+# that has to move whenever anything they describe changes.
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # group.user_set.clear(): remember who was in the group
+        instance._cleared_user_ids = list(instance.user_set.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_role_versions([instance.pk])
+    elif action == 'post_clear':
+        bump_role_versions(getattr(instance, '_cleared_user_ids', []))
+    else:
+        bump_role_versions(pk_set or [])
+
+
+@receiver(post_init, sender=User)
+def remember_superuser_flag(sender, instance, **kwargs):
+    # None when the field was deferred; a save then bumps to be safe.
+    instance._was_superuser = instance.__dict__.get('is_superuser')
+
+
+@receiver(post_save, sender=User)
+def superuser_flag_changed(sender, instance, created, **kwargs):
+    if not created and instance.is_superuser != instance._was_superuser:
+        bump_role_versions([instance.pk])
+    instance._was_superuser = instance.is_superuser
+
+
+def staff_profile_changed(sender, instance, created=True, **kwargs):
+    if created:
+        bump_role_versions([instance.user_id])
+
+
+for profile_model in (Doctor, Receptionist, Pharmacist, LabTechnician, Admin):
+    post_save.connect(staff_profile_changed, sender=profile_model, dispatch_uid=f'role-stamp-save-{profile_model.__name__}')
+    post_delete.connect(staff_profile_changed, sender=profile_model, dispatch_uid=f'role-stamp-delete-{profile_model.__name__}')
+
+
+# Reference catalogs cached by api.utils.catalog_cache
+
+CATALOG_MODELS = {Department: 'department', Medicine: 'medicine', LabTest: 'labtest', Doctor: 'doctor'}
+
+
+def catalog_changed(sender, **kwargs):
+    bump_version(CATALOG_MODELS[sender])  # once the write commits
+
+
+for catalog_model in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=catalog_model, dispatch_uid=f'catalog-version-save-{catalog_model.__name__}')
+    post_delete.connect(catalog_changed, sender=catalog_model, dispatch_uid=f'catalog-version-delete-{catalog_model.__name__}')
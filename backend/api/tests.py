@@ -1,3 +1,813 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .models import Appointment, AppointmentSweepRun, Bill, CatalogVersion, Doctor, Department, DoctorAvailability, \
+    LabTest, MedicalHistory, Medicine, MedicineBillItem, Patient, PatientTimelineEntry, Pharmacist, Prescription, \
+    PrescriptionLabTest, PrescriptionMedicine, Receptionist, StaffIdSequence, StockMovement
+from .serializers import AppointmentSerializer, PrescriptionSerializer
+from .views import PatientViewSet
+from .authentication import RoleClaimsJWTAuthentication, RoleTokenObtainPairSerializer
+from .utils import availability, doctor_directory
+from .utils.downloads import file_etag, serve_file
+from .utils import stock
+from .utils.catalog_cache import get_version
+from .utils.related import related_lookups
+from .utils.renderers import FastJSONRenderer
+from .utils.roles import get_request_role, load_user_role
+from .utils.sweeper import cancel_expired_appointments
+
+MONDAY = date(2030, 1, 7)
+
+
+def at(day, hour, minute=0):
+    return timezone.make_aware(datetime(day.year, day.month, day.day, hour, minute))
+
+
+def make_doctor(n=0, department=None):
+    department = department or Department.objects.get_or_create(department_name='Cardio', defaults={'fee': 500})[0]
+    return Doctor.objects.create(
+        user=User.objects.create_user(f'doctor{n}', password='x'), first_name='D', last_name=str(n),
+        email=f'd{n}@example.com', date_of_birth=date(1980, 1, 1), department_id=department
+    )
+
+
+def make_patient(n=0):
+    return Patient.objects.create(first_name='P', last_name=str(n), date_of_birth=date(1990, 1, 1), phone='9876543210')
+
+
+def make_receptionist(n, **kwargs):
+    fields = {
+        'first_name': 'R', 'last_name': str(n), 'email': f'r{n}@example.com', 'date_of_birth': date(1990, 1, 1),
+        **kwargs,
+    }
+    return Receptionist.objects.create(user=User.objects.create_user(f'receptionist{n}', password='x'), **fields)
+
+
+class StaffIdAllocationTests(TestCase):
+    def test_ids_are_sequential_per_prefix(self):
+        ids = [make_receptionist(n).staff_id for n in range(3)]
+        self.assertEqual(ids, ['RP1001', 'RP1002', 'RP1003'])
+
+        department = Department.objects.create(department_name='Cardio', fee=500)
+        user = User.objects.create_user('doctor', password='x')
+        doctor = Doctor.objects.create(
+            user=user, first_name='D', last_name='R', email='d@example.com',
+            date_of_birth=date(1980, 1, 1), department_id=department
+        )
+        self.assertEqual(doctor.staff_id, 'DR1001')
+
+    def test_failed_registration_does_not_use_up_a_number(self):
+        make_receptionist(0)
+        with self.assertRaises(IntegrityError):
+            make_receptionist(1, email='r0@example.com')
+        self.assertEqual(make_receptionist(2).staff_id, 'RP1002')
+
+    def test_continues_after_existing_ids(self):
+        make_receptionist(0, staff_id='RP1041')
+        StaffIdSequence.objects.filter(prefix='RP').delete()
+        self.assertEqual(make_receptionist(1).staff_id, 'RP1042')
+
+    def test_explicit_staff_id_is_kept(self):
+        self.assertEqual(make_receptionist(0, staff_id='RP9000').staff_id, 'RP9000')
+        self.assertFalse(StaffIdSequence.objects.filter(prefix='RP').exists())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentStaffIdAllocationTests(TransactionTestCase):
+    workers = 8
+
+    def test_concurrent_registrations_get_distinct_ids(self):
+        users = [User.objects.create_user(f'pharmacist{n}', password='x') for n in range(self.workers)]
+        barrier = threading.Barrier(self.workers)
+        staff_ids, errors = [], []
+
+        def register(n):
+            try:
+                barrier.wait()
+                pharmacist = Pharmacist.objects.create(
+                    user=users[n], first_name='P', last_name=str(n), email=f'p{n}@example.com',
+                    date_of_birth=date(1990, 1, 1)
+                )
+                staff_ids.append(pharmacist.staff_id)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register, args=(n,)) for n in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(staff_ids), [f'PH{1001 + n}' for n in range(self.workers)])
+
+
+class AvailabilityGridTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+
+    def book(self, start, end):
+        return Appointment.objects.create(doctor=self.doctor, patient=self.patient, start_time=start, end_time=end)
+
+    def test_slot_mask_marks_every_touched_slot(self):
+        self.assertEqual(availability.slot_mask(at(MONDAY, 10), at(MONDAY, 10, 30)), 0b11)
+        self.assertEqual(availability.slot_mask(at(MONDAY, 10, 20), at(MONDAY, 10, 40)), 0b110)
+
+    def test_grid_follows_bookings_and_cancellations(self):
+        appointment = self.book(at(MONDAY, 11), at(MONDAY, 11, 30))
+        self.assertFalse(availability.is_slot_free(self.doctor.staff_id, at(MONDAY, 11, 15), at(MONDAY, 11, 45)))
+        self.assertTrue(availability.is_slot_free(self.doctor.staff_id, at(MONDAY, 11, 30), at(MONDAY, 12)))
+
+        appointment.status = 'Cancelled'
+        appointment.save()
+        self.assertEqual(DoctorAvailability.objects.get(doctor=self.doctor, day=MONDAY).booked, 0)
+        self.assertTrue(availability.is_slot_free(self.doctor.staff_id, at(MONDAY, 11), at(MONDAY, 11, 30)))
+
+    def test_unaligned_booking_only_blocks_its_own_minutes(self):
+        self.book(at(MONDAY, 10), at(MONDAY, 10, 20))
+        self.assertTrue(availability.is_slot_free(self.doctor.staff_id, at(MONDAY, 10, 20), at(MONDAY, 10, 30)))
+        self.assertFalse(availability.is_slot_free(self.doctor.staff_id, at(MONDAY, 10, 10), at(MONDAY, 10, 25)))
+
+    def test_editing_an_appointment_ignores_its_own_slots(self):
+        appointment = self.book(at(MONDAY, 14), at(MONDAY, 14, 30))
+        self.assertTrue(availability.is_slot_free(
+            self.doctor.staff_id, at(MONDAY, 14, 15), at(MONDAY, 14, 45), exclude=appointment
+        ))
+
+
+@mock.patch('django.utils.timezone.now', return_value=at(MONDAY, 8))
+class AppointmentHoursValidationTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+
+    def validate(self, start, end):
+        return AppointmentSerializer(data={
+            'doctor': self.doctor.staff_id, 'patient': self.patient.id, 'start_time': start, 'end_time': end,
+        })
+
+    def test_bookings_must_end_by_closing_time(self, now):
+        self.assertTrue(self.validate(at(MONDAY, 16, 30), at(MONDAY, 17)).is_valid())
+        self.assertFalse(self.validate(at(MONDAY, 16, 50), at(MONDAY, 17, 10)).is_valid())
+        self.assertFalse(self.validate(at(MONDAY, 17), at(MONDAY, 17, 45)).is_valid())
+        self.assertFalse(self.validate(at(MONDAY, 9, 45), at(MONDAY, 10, 15)).is_valid())
+
+    def test_overlapping_booking_is_rejected(self, now):
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient,
+                                   start_time=at(MONDAY, 16, 30), end_time=at(MONDAY, 17))
+        self.assertFalse(self.validate(at(MONDAY, 16, 45), at(MONDAY, 17)).is_valid())
+        self.assertTrue(self.validate(at(MONDAY, 16), at(MONDAY, 16, 30)).is_valid())
+
+
+class ExpiredAppointmentSweepTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        patient = make_patient()
+        self.past_day = date(2020, 1, 6)
+        self.expired = [
+            Appointment.objects.create(doctor=self.doctor, patient=patient,
+                                       start_time=at(self.past_day, 10 + n), end_time=at(self.past_day, 10 + n, 15))
+            for n in range(5)
+        ]
+        self.upcoming = Appointment.objects.create(doctor=self.doctor, patient=patient,
+                                                   start_time=at(MONDAY, 10), end_time=at(MONDAY, 10, 15))
+        availability.get_booked(self.doctor.staff_id, self.past_day)
+
+    def test_cancels_only_expired_pending_appointments_in_batches(self):
+        run = cancel_expired_appointments(batch_size=2)
+
+        self.assertEqual((run.cancelled_count, run.batches), (5, 3))
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(Appointment.objects.filter(status='Cancelled').count(), 5)
+        self.assertEqual(Appointment.objects.get(pk=self.upcoming.pk).status, 'Pending')
+        self.assertEqual(availability.get_booked(self.doctor.staff_id, self.past_day), 0)
+
+    def test_max_batches_stops_early_and_command_reports(self):
+        call_command('cancel_expired_appointments', batch_size=2, max_batches=1, stdout=io.StringIO())
+        self.assertEqual(Appointment.objects.filter(status='Cancelled').count(), 2)
+        self.assertEqual(AppointmentSweepRun.objects.get().cancelled_count, 2)
+
+
+class AppointmentIndexTests(TestCase):
+    def test_overlap_query_uses_doctor_status_start_index(self):
+        doctor = make_doctor()
+        patient = make_patient()
+        Appointment.objects.bulk_create(
+            Appointment(doctor=doctor, patient=patient, start_time=at(MONDAY, 10) + timedelta(days=n),
+                        end_time=at(MONDAY, 10, 15) + timedelta(days=n))
+            for n in range(50)
+        )
+        day_start, day_end = at(MONDAY, 0), at(MONDAY, 0) + timedelta(days=1)
+        plan = Appointment.objects.filter(
+            doctor_id=doctor.staff_id, status='Pending', start_time__gte=day_start, start_time__lt=day_end
+        ).values_list('start_time', 'end_time').explain()
+        self.assertIn('appt_doctor_status_start_idx', plan)
+
+    def test_benchmark_command_runs_and_rolls_back(self):
+        out = io.StringIO()
+        call_command('benchmark_appointment_queries', rows=200, doctors=2, repeat=1, stdout=out)
+        self.assertIn('overlap check', out.getvalue())
+        self.assertFalse(Appointment.objects.exists())
+
+
+def admin_client():
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user('admin', password='x', is_superuser=True))
+    return client
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        doctor = make_doctor()
+        patient = make_patient()
+        # Ten appointments sharing three start times, so pages split inside ties.
+        self.appointments = Appointment.objects.bulk_create(
+            Appointment(doctor=doctor, patient=patient, start_time=at(MONDAY, 10 + n % 3),
+                        end_time=at(MONDAY, 10 + n % 3, 15), status='Completed')
+            for n in range(10)
+        )
+        self.client = admin_client()
+
+    def walk(self, url):
+        pages = []
+        while url:
+            body = self.client.get(url).json()
+            pages.append(body)
+            url = body['next']
+        return pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        pages = self.walk('/api/appointments/?pagination=cursor&page_size=3')
+        ids = [row['id'] for page in pages for row in page['results']]
+        expected = list(Appointment.objects.order_by('-start_time', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 3, 1])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertIsNone(pages[0]['count'])
+
+    def test_previous_link_returns_the_same_page(self):
+        pages = self.walk('/api/appointments/?pagination=cursor&page_size=3&with_count=true')
+        self.assertEqual(pages[0]['count'], 10)
+        back = self.client.get(pages[2]['previous']).json()
+        self.assertEqual(back['results'], pages[1]['results'])
+        self.assertIsNotNone(back['previous'])
+        self.assertIsNotNone(back['next'])
+
+    def test_cursor_filters_on_the_whole_key(self):
+        page = self.client.get('/api/appointments/?pagination=cursor&page_size=3').json()
+        cursor = page['next'].split('cursor=')[1]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/appointments/?pagination=cursor&page_size=3&cursor={cursor}')
+        sql = next(query['sql'] for query in queries if 'api_appointment' in query['sql'] and 'LIMIT' in query['sql'])
+        quote = connection.ops.quote_name
+        self.assertIn(f"{quote('api_appointment')}.{quote('id')} <", sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_garbage_cursor_is_404(self):
+        self.assertEqual(self.client.get('/api/appointments/?cursor=nonsense').status_code, 404)
+
+
+class RoleResolutionTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.doctor.user.groups.add(Group.objects.create(name='Doctor'))
+
+    def test_groups_and_profiles_load_in_one_query(self):
+        with self.assertNumQueries(1):
+            role = load_user_role(self.doctor.user)
+        self.assertEqual(role.role, 'doctor')
+        self.assertEqual(role.groups, {'Doctor'})
+        self.assertEqual(role.staff_id_for('doctor'), self.doctor.staff_id)
+        self.assertFalse(role.has_profile('pharmacist'))
+        with self.assertNumQueries(0):
+            self.assertEqual(role.profile('doctor'), self.doctor)
+
+    def test_role_is_resolved_once_per_request(self):
+        request = APIRequestFactory().get('/')
+        request.user = self.doctor.user
+        with self.assertNumQueries(1):
+            first = get_request_role(request)
+            second = get_request_role(request)
+        self.assertIs(first, second)
+
+    def test_permissions_follow_the_resolved_role(self):
+        client = APIClient()
+        client.force_authenticate(self.doctor.user)
+        self.assertEqual(client.get('/api/appointments/').status_code, 200)
+        client.force_authenticate(User.objects.create_user('nobody', password='x'))
+        self.assertEqual(client.get('/api/appointments/').status_code, 403)
+
+
+class RoleClaimTokenTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.user = self.doctor.user
+        self.user.groups.add(Group.objects.create(name='Doctor'))
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        user, _ = RoleClaimsJWTAuthentication().authenticate(request)
+        return user, getattr(request, '_user_role', None)
+
+    def test_access_token_carries_role_claims(self):
+        token = RoleTokenObtainPairSerializer.get_token(self.user).access_token
+        self.assertEqual(token['role'], 'doctor')
+        self.assertEqual(token['staff_id'], self.doctor.staff_id)
+        self.assertEqual(token['profiles'], {'doctor': [self.doctor.pk, self.doctor.staff_id]})
+
+        with self.assertNumQueries(1):  # the user and its role stamp
+            user, role = self.authenticate(token)
+        self.assertEqual(user, self.user)
+        self.assertEqual(role.staff_id_for('doctor'), self.doctor.staff_id)
+
+    def test_group_change_invalidates_claims(self):
+        token = RoleTokenObtainPairSerializer.get_token(self.user).access_token
+        self.user.groups.add(Group.objects.create(name='Admin'))
+
+        _, role = self.authenticate(token)
+        self.assertIsNone(role)  # resolved from the database instead
+        self.assertTrue(load_user_role(self.user).is_admin)
+
+    def test_superuser_change_invalidates_claims(self):
+        token = RoleTokenObtainPairSerializer.get_token(self.user).access_token
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertIsNone(self.authenticate(token)[1])
+
+
+class AutoRelatedTests(TestCase):
+    def test_lookups_come_from_serializer_fields(self):
+        select, prefetch = related_lookups(AppointmentSerializer)
+        self.assertEqual(select, ['doctor', 'patient'])
+        self.assertEqual(prefetch, [])
+
+        select, prefetch = related_lookups(PrescriptionSerializer)
+        self.assertIn('prescriptionmedicine_set__medicine', prefetch)
+        self.assertIn('prescriptionlabtest_set__lab_test', prefetch)
+
+    def test_listing_cost_does_not_grow_with_rows(self):
+        client = admin_client()
+        doctor = make_doctor()
+
+        patients = [make_patient(n) for n in range(8)]
+
+        def list_queries(count):
+            Appointment.objects.all().delete()
+            Appointment.objects.bulk_create(
+                Appointment(doctor=doctor, patient=patient, status='Completed',
+                            start_time=at(MONDAY, 10), end_time=at(MONDAY, 10, 15))
+                for patient in patients[:count]
+            )
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(client.get('/api/appointments/').status_code, 200)
+            return len(queries)
+
+        self.assertEqual(list_queries(1), list_queries(8))
+
+
+class PatientTimelineTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.appointment = Appointment.objects.create(doctor=self.doctor, patient=self.patient, status='Completed',
+                                                      start_time=at(MONDAY, 11), end_time=at(MONDAY, 11, 15))
+        medicine = Medicine.objects.create(medicine_name='Aspirin', price=5, medicine_desc='-', manufacturer='-')
+        response = self.client.post('/api/prescriptions/', {
+            'patient': self.patient.id, 'doctor': self.doctor.staff_id, 'appointment': self.appointment.id,
+            'diagnosis': 'Flu', 'notes': 'Rest',
+            'medicines': [{'id': medicine.id, 'dosage': '1', 'frequency': 'daily', 'duration': '3 days'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.prescription_id = response.json()['id']
+
+    def entries(self):
+        return self.client.get(f'/api/patients/{self.patient.id}/timeline/').json()['entries']
+
+    def test_entry_is_dated_by_the_consultation_and_survives_a_rebuild(self):
+        live = self.entries()
+        self.assertEqual(len(live), 1)
+        self.assertEqual(live[0]['data']['diagnosis'], 'Flu')
+        self.assertEqual(PatientTimelineEntry.objects.get().occurred_at, self.appointment.start_time)
+
+        call_command('rebuild_patient_timeline', stdout=io.StringIO())
+        self.assertEqual(self.entries(), live)
+
+    def test_since_and_until_filter_on_occurred_at(self):
+        url = f'/api/patients/{self.patient.id}/timeline/'
+        self.assertEqual(len(self.client.get(url, {'since': MONDAY.isoformat()}).json()['entries']), 1)
+        self.assertEqual(len(self.client.get(url, {'until': MONDAY.isoformat()}).json()['entries']), 0)
+
+    def test_edits_rewrite_the_entry(self):
+        self.client.patch(f'/api/prescriptions/{self.prescription_id}/', {'notes': 'Fluids'}, format='json')
+        self.assertEqual(self.entries()[0]['data']['notes'], 'Fluids')
+
+        history = MedicalHistory.objects.get(prescription_id=self.prescription_id)
+        self.client.patch(f'/api/medical-history/{history.id}/', {'diagnosis': 'Cold'}, format='json')
+        self.assertEqual(self.entries()[0]['data']['diagnosis'], 'Cold')
+
+        self.client.delete(f'/api/medical-history/{history.id}/')
+        self.assertIsNone(self.entries()[0]['data']['diagnosis'])
+
+        self.client.delete(f'/api/prescriptions/{self.prescription_id}/')
+        self.assertEqual(self.entries(), [])
+
+
+class StreamingListTests(TestCase):
+    def test_renderer_matches_drf_output(self):
+        data = {'when': at(MONDAY, 10), 'day': MONDAY, 'amount': Decimal('12.50'), 'name': 'Zoë', 'ids': [1, 2]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    @mock.patch.object(PatientViewSet, 'stream_chunk_size', 3)
+    def test_stream_reads_keyset_chunks(self):
+        patients = [make_patient(n) for n in range(7)]
+        with CaptureQueriesContext(connection) as queries:
+            response = admin_client().get('/api/patients/?stream=true')
+            body = b''.join(response.streaming_content)
+
+        self.assertEqual([row['id'] for row in json.loads(body)], [patient.id for patient in patients])
+        patient_queries = [query['sql'] for query in queries if 'api_patient' in query['sql']]
+        self.assertEqual(len(patient_queries), 3)
+        self.assertTrue(all('LIMIT 3' in sql for sql in patient_queries))
+
+    def test_empty_stream_is_an_empty_array(self):
+        response = admin_client().get('/api/patients/?stream=true')
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        doctor = make_doctor()
+        Appointment.objects.create(doctor=doctor, patient=make_patient(), status='Completed',
+                                   start_time=at(MONDAY, 10), end_time=at(MONDAY, 10, 15))
+
+    def test_fields_and_omit_trim_the_response(self):
+        row = self.client.get('/api/appointments/?fields=id,status').json()['results'][0]
+        self.assertEqual(set(row), {'id', 'status'})
+        row = self.client.get('/api/appointments/?omit=patient_name,doctor_name').json()['results'][0]
+        self.assertNotIn('patient_name', row)
+        self.assertIn('start_time', row)
+
+    def test_unused_relations_are_not_joined(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/appointments/?fields=id,status')
+        sql = next(query['sql'] for query in queries if 'api_appointment' in query['sql'] and 'LIMIT' in query['sql'])
+        self.assertNotIn('api_patient', sql)
+        self.assertNotIn('end_time', sql)
+
+    def test_unknown_field_is_a_400(self):
+        response = self.client.get('/api/appointments/?fields=id,nope')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nope', response.json()['fields'])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        Medicine.objects.create(medicine_name='Aspirin', price=5, medicine_desc='-', manufacturer='-')
+
+    def test_conditional_requests_and_invalidation(self):
+        first = self.client.get('/api/medicines/')
+        etag = first['ETag']
+        self.assertEqual(len(first.json()), 1)
+
+        with self.assertNumQueries(1):  # the version row only
+            self.assertEqual(self.client.get('/api/medicines/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicine.objects.create(medicine_name='Ibuprofen', price=7, medicine_desc='-', manufacturer='-')
+        second = self.client.get('/api/medicines/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], etag)
+        self.assertEqual(len(second.json()), 2)
+
+    def test_bump_is_deferred_until_commit(self):
+        token = get_version('medicine')[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            stock.receive(Medicine.objects.get().pk, 5)
+            self.assertEqual(get_version('medicine')[0], token)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version('medicine')[0], token)
+
+    def test_version_written_by_another_worker_is_seen(self):
+        etag = self.client.get('/api/medicines/')['ETag']
+        # What another process's bump looks like from here: only the row changes.
+        CatalogVersion.objects.filter(catalog='medicine').update(token='elsewhere')
+        Medicine.objects.filter(medicine_name='Aspirin').update(price=9)
+        response = self.client.get('/api/medicines/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['price'], '9.00')
+
+
+class DoctorDirectoryTests(TestCase):
+    def test_directory_serves_lookups_and_follows_the_version(self):
+        department = Department.objects.create(department_name='Neuro', fee=800)
+        doctor = make_doctor(department=department)
+        self.assertEqual(doctor_directory.consultation_fee(doctor.staff_id), Decimal('800.00'))
+        self.assertEqual(doctor_directory.consultation_fee('DR0000'), doctor_directory.DEFAULT_CONSULTATION_FEE)
+
+        copy = doctor_directory.get_doctor(doctor.staff_id)
+        copy.first_name = 'Changed'
+        self.assertEqual(doctor_directory.get_doctor(doctor.staff_id).first_name, 'D')
+
+        # A change committed by another worker: the data and the version row move together.
+        Department.objects.filter(pk=department.pk).update(fee=900)
+        self.assertEqual(doctor_directory.consultation_fee(doctor.staff_id), Decimal('800.00'))
+        CatalogVersion.objects.filter(catalog='department').update(token='elsewhere')
+        self.assertEqual(doctor_directory.consultation_fee(doctor.staff_id), Decimal('900.00'))
+
+    def test_one_query_while_current(self):
+        make_doctor()
+        doctor_directory.doctor_rows()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(doctor_directory.doctor_rows()), 1)
+
+
+class PrescriptionCreateTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.appointment = Appointment.objects.create(doctor=self.doctor, patient=self.patient, status='Completed',
+                                                      start_time=at(MONDAY, 10), end_time=at(MONDAY, 10, 15))
+        self.medicines = [
+            Medicine.objects.create(medicine_name=f'M{n}', price=5, medicine_desc='-', manufacturer='-')
+            for n in range(4)
+        ]
+        self.lab_test = LabTest.objects.create(test_name='CBC', price=50, test_desc='-')
+
+    def post(self, medicines, lab_tests=()):
+        return self.client.post('/api/prescriptions/', {
+            'patient': self.patient.id, 'doctor': self.doctor.staff_id, 'appointment': self.appointment.id,
+            'diagnosis': 'Flu', 'notes': '',
+            'medicines': [
+                {'id': medicine_id, 'dosage': '1', 'frequency': 'daily', 'duration': '3 days'}
+                for medicine_id in medicines
+            ],
+            'lab_tests': [{'id': lab_test_id, 'test_date': MONDAY.isoformat()} for lab_test_id in lab_tests],
+        }, format='json')
+
+    def test_lines_are_created_with_a_constant_number_of_queries(self):
+        def queries_for(count):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post([m.id for m in self.medicines[:count]], [self.lab_test.id]).status_code,
+                                 201)
+            return len(queries)
+
+        queries_for(1)  # first use of the lab counters and catalog versions
+        self.assertEqual(queries_for(1), queries_for(4))
+        self.assertEqual(PrescriptionMedicine.objects.count(), 6)
+        self.assertEqual(PrescriptionLabTest.objects.count(), 3)
+
+    def test_unknown_line_rejects_the_whole_prescription(self):
+        response = self.post([self.medicines[0].id, 9999])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('9999', str(response.json()))
+        self.assertFalse(Prescription.objects.exists())
+
+    def test_appointment_must_match_patient_and_doctor(self):
+        self.patient = make_patient(1)
+        self.assertEqual(self.post([self.medicines[0].id]).status_code, 400)
+        self.assertFalse(Prescription.objects.exists())
+
+
+class BillTotalTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.aspirin = Medicine.objects.create(medicine_name='Aspirin', price=Decimal('2.50'), medicine_desc='-',
+                                               manufacturer='-', stock=10)
+        self.cbc = LabTest.objects.create(test_name='CBC', price=Decimal('40.00'), test_desc='-')
+
+    def post(self, **data):
+        return self.client.post('/api/bills/', {'name': 'Walk-in', 'bill_type': 'Medicine', **data}, format='json')
+
+    def test_total_and_unit_prices_come_from_the_catalog(self):
+        response = self.post(medicines=[{'medicine': self.aspirin.id, 'quantity': 4}],
+                             lab_tests=[{'lab_test': self.cbc.id}], total_amount='0.01')
+        self.assertEqual(response.status_code, 201, response.content)
+        bill = Bill.objects.get()
+        self.assertEqual(bill.total_amount, Decimal('50.00'))
+        self.assertEqual(bill.medicines.get().unit_price, Decimal('2.50'))
+        self.assertEqual(bill.lab_tests.get().unit_price, Decimal('40.00'))
+
+    def test_price_changes_do_not_rewrite_old_bills(self):
+        self.post(medicines=[{'medicine': self.aspirin.id, 'quantity': 2}])
+        Medicine.objects.filter(pk=self.aspirin.pk).update(price=Decimal('9.00'))
+        item = MedicineBillItem.objects.get()
+        self.assertEqual(item.unit_price, Decimal('2.50'))
+        self.assertEqual(Bill.objects.get().total_amount, Decimal('5.00'))
+
+    def test_unknown_ids_are_rejected(self):
+        response = self.post(medicines=[{'medicine': 9999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Bill.objects.exists())
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.client = admin_client()
+        self.aspirin = Medicine.objects.create(medicine_name='Aspirin', price=2, medicine_desc='-', manufacturer='-',
+                                               stock=10)
+
+    def sell(self, quantity):
+        return self.client.post('/api/bills/', {
+            'name': 'Walk-in', 'bill_type': 'Medicine', 'medicines': [{'medicine': self.aspirin.id, 'quantity': quantity}],
+        }, format='json')
+
+    def stock(self):
+        return Medicine.objects.get(pk=self.aspirin.pk).stock
+
+    def test_opening_stock_and_adjustments_are_in_the_ledger(self):
+        self.aspirin.stock = 12
+        self.aspirin.save()
+        self.assertEqual(list(StockMovement.objects.order_by('id').values_list('reason', 'delta')),
+                         [('opening', 10), ('adjustment', 2)])
+
+    def test_sales_decrement_stock_and_record_movements(self):
+        self.assertEqual(self.sell(4).status_code, 201)
+        self.assertEqual(self.stock(), 6)
+        sale = StockMovement.objects.get(reason='sale')
+        self.assertEqual((sale.delta, sale.bill), (-4, Bill.objects.get()))
+
+    def test_short_sale_writes_nothing(self):
+        response = self.sell(11)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Not enough Aspirin', str(response.json()))
+        self.assertEqual(self.stock(), 10)
+        self.assertFalse(Bill.objects.exists())
+        self.assertFalse(StockMovement.objects.filter(reason='sale').exists())
+
+    def test_receive_and_reconcile(self):
+        self.assertEqual(stock.receive(self.aspirin.pk, 5), 15)
+        with self.assertRaises(stock.InsufficientStock):
+            stock.receive(self.aspirin.pk, -16, reason='adjustment')
+
+        Medicine.objects.filter(pk=self.aspirin.pk).update(stock=3)  # drift: no movement written
+        result = stock.reconcile()
+        self.assertEqual(result['corrections'], [{'medicine_id': self.aspirin.pk, 'stock': 3, 'ledger_balance': 15}])
+        self.assertEqual(self.stock(), 15)
+        self.assertEqual(stock.reconcile()['corrections'], [])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentDispenseTests(TransactionTestCase):
+    def test_concurrent_sales_never_oversell(self):
+        medicine = Medicine.objects.create(medicine_name='Aspirin', price=2, medicine_desc='-', manufacturer='-',
+                                           stock=10)
+        barrier = threading.Barrier(2)
+        outcomes = []
+
+        def sell():
+            try:
+                barrier.wait()
+                with transaction.atomic():
+                    bill = Bill.objects.create(name='Walk-in', bill_type='Medicine')
+                    stock.dispense({medicine.pk: 6}, bill=bill)
+                outcomes.append('sold')
+            except stock.InsufficientStock:
+                outcomes.append('short')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sell) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['short', 'sold'])
+        self.assertEqual(Medicine.objects.get(pk=medicine.pk).stock, 4)
+
+
+class ImportPatientsTests(TestCase):
+    HEADER = 'first_name,last_name,date_of_birth,phone,blood_group,email\n'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'patients.csv')
+
+    def run_import(self, body, *args):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write(self.HEADER + body)
+        out = io.StringIO()
+        call_command('import_patients', self.path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_valid_rows_are_inserted_in_batches_and_bad_rows_rejected(self):
+        body = ('Ann,Lee,1980-02-03,5550000001,B+,ann@example.com\n'
+                'Bob,Ray,1981-02-03,555,A+,\n'
+                'Cid,Oak,not-a-date,5550000003,ZZ,\n'
+                'Dee,Fox,1983-02-03,5550000004,,\n'
+                'Eve,Day,1984-02-03,5550000005,O-,\n')
+        with CaptureQueriesContext(connection) as queries:
+            output = self.run_import(body, '--batch-size', '2')
+
+        self.assertIn('Imported 3 patient(s), rejected 2', output)
+        self.assertEqual(list(Patient.objects.order_by('first_name').values_list('first_name', 'blood_group')),
+                         [('Ann', 'B+'), ('Dee', 'A+'), ('Eve', 'O-')])
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('INSERT')]), 2)
+
+        with open(f'{self.path}.rejects.csv', encoding='utf-8') as file:
+            rejects = list(csv.DictReader(file))
+        self.assertEqual([row['line'] for row in rejects], ['3', '4'])
+        self.assertIn('phone: Invalid phone number format.', rejects[0]['errors'])
+        self.assertIn('date_of_birth:', rejects[1]['errors'])
+        self.assertIn('blood_group:', rejects[1]['errors'])
+
+    def test_dry_run_inserts_nothing_and_clean_files_leave_no_rejects(self):
+        output = self.run_import('Ann,Lee,1980-02-03,5550000001,,\n', '--dry-run')
+        self.assertIn('Checked 1 patient(s), rejected 0.', output)
+        self.assertFalse(Patient.objects.exists())
+        self.assertFalse(os.path.exists(f'{self.path}.rejects.csv'))
+
+    def test_missing_required_columns(self):
+        self.HEADER = 'first_name,last_name\n'
+        with self.assertRaisesMessage(CommandError, 'Missing column(s): date_of_birth, phone.'):
+            self.run_import('Ann,Lee\n')
+
+
+class ServeFileTests(TestCase):
+    BODY = b'0123456789abcdef'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'report.pdf')
+        with open(self.path, 'wb') as f:
+            f.write(self.BODY)
+
+    def get(self, etag='"v1"', **headers):
+        request = RequestFactory().get('/download/', headers=headers)
+        return serve_file(request, self.path, 'application/pdf', filename='report.pdf', etag=etag)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file_with_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.BODY)
+        self.assertEqual((response['ETag'], response['Accept-Ranges']), ('"v1"', 'bytes'))
+        self.assertIn('Last-Modified', response)
+
+    def test_conditional_get(self):
+        self.assertEqual(self.get(**{'If-None-Match': '"v1"'}).status_code, 304)
+        self.assertEqual(self.get(**{'If-None-Match': '"v0"'}).status_code, 200)
+        last_modified = self.get()['Last-Modified']
+        self.assertEqual(self.get(**{'If-Modified-Since': last_modified}).status_code, 304)
+        # Without a digest the ETag follows the file's size and mtime
+        self.assertEqual(self.get(etag=None)['ETag'], file_etag(os.stat(self.path)))
+
+    def test_byte_ranges(self):
+        response = self.get(Range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), b'2345')
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 2-5/16', '4'))
+
+        self.assertEqual(self.body(self.get(Range='bytes=-3')), b'def')
+        self.assertEqual(self.body(self.get(Range='bytes=10-99')), b'abcdef')
+        # Several ranges may be answered with the whole file
+        self.assertEqual(self.get(Range='bytes=0-1,4-5').status_code, 200)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range='bytes=16-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */16')
+
+    def test_stale_if_range_gets_the_whole_file(self):
+        self.assertEqual(self.get(Range='bytes=2-5', **{'If-Range': '"v1"'}).status_code, 206)
+        response = self.get(Range='bytes=2-5', **{'If-Range': '"v0"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.BODY)
+
+    def test_body_left_to_the_web_server(self):
+        with override_settings(SENDFILE_BACKEND='x-sendfile'):
+            response = self.get(Range='bytes=2-5')
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(response['X-Sendfile'], os.path.abspath(self.path))
+
+        with override_settings(SENDFILE_BACKEND='x-accel-redirect', MEDIA_ROOT=os.path.dirname(self.path),
+                               SENDFILE_URL_PREFIX='/protected/'):
+            self.assertEqual(self.get()['X-Accel-Redirect'], '/protected/report.pdf')
@@ -49,5 +49,6 @@ urlpatterns = [
     path('doctor/profile/', doctor_profile, name='doctor-profile'),
     path('receptionist/profile/', receptionist_profile, name='receptionist-profile'),
     path('prescriptions/patient/<int:patient_id>/', views.get_prescriptions_by_patient),
+    path('doctors/<str:staff_id>/availability/', views.doctor_availability, name='doctor-availability'),
 
 ]
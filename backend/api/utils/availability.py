@@ -0,0 +1,157 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Appointment, DoctorAvailability
+
+# Bookable window for every doctor (weekdays only), split into fixed slots.
+OPENING_HOUR = 10
+CLOSING_HOUR = 17
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = (CLOSING_HOUR - OPENING_HOUR) * 60 // SLOT_MINUTES
+
+
+def _day_bounds(day):
+    """Return the aware [start, end) datetimes covering a calendar day."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def slot_mask(start_time, end_time):
+    """
+    Bitmask of the slots touched by [start_time, end_time), clipped to business hours.
+    A booking that starts or ends inside a slot holds the whole slot.
+    """
+    start_time = timezone.localtime(start_time)
+    end_time = timezone.localtime(end_time)
+    if end_time <= start_time:
+        return 0
+
+    opening = start_time.replace(hour=OPENING_HOUR, minute=0, second=0, microsecond=0)
+    start_offset = (start_time - opening).total_seconds() / 60
+    end_offset = (end_time - opening).total_seconds() / 60
+
+    first = max(int(start_offset // SLOT_MINUTES), 0)
+    last = min(int(-(-end_offset // SLOT_MINUTES)), SLOTS_PER_DAY)  # ceil
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def build_day(doctor_id, day, exclude_id=None):
+    """Recompute a doctor's grid for one day from the pending appointments."""
+    day_start, day_end = _day_bounds(day)
+    appointments = Appointment.objects.filter(
+        doctor_id=doctor_id,
+        start_time__gte=day_start,
+        start_time__lt=day_end,
+        status='Pending',
+    )
+    if exclude_id:
+        appointments = appointments.exclude(id=exclude_id)
+
+    booked = 0
+    for start_time, end_time in appointments.values_list('start_time', 'end_time'):
+        booked |= slot_mask(start_time, end_time)
+    return booked
+
+
+def get_booked(doctor_id, day):
+    """Return the stored grid for a doctor/day, building it on first use."""
+    row = DoctorAvailability.objects.filter(doctor_id=doctor_id, day=day).first()
+    if row is None:
+        row, _ = DoctorAvailability.objects.get_or_create(
+            doctor_id=doctor_id, day=day,
+            defaults={'booked': build_day(doctor_id, day)}
+        )
+    return row.booked
+
+
+def overlaps_pending(doctor_id, start_time, end_time, exclude=None):
+    """Exact check against the pending appointments themselves."""
+    appointments = Appointment.objects.filter(
+        doctor_id=doctor_id,
+        status='Pending',
+        start_time__lt=end_time,
+        end_time__gt=start_time,
+    )
+    if exclude is not None and exclude.pk:
+        appointments = appointments.exclude(id=exclude.pk)
+    return appointments.exists()
+
+
+def is_slot_free(doctor_id, start_time, end_time, exclude=None):
+    """
+    True when no pending appointment overlaps [start_time, end_time).
+    `exclude` is the appointment being edited, whose own slots don't count.
+
+    The grid holds whole slots, so it can only over-report: a clear grid means
+    the time is free, while a hit may be an unaligned booking (10:00-10:20
+    holds the 10:15 slot) that doesn't actually overlap, and is confirmed
+    with an exact interval query.
+    """
+    mask = slot_mask(start_time, end_time)
+    day = timezone.localtime(start_time).date()
+
+    if exclude is not None and exclude.pk and exclude.status == 'Pending':
+        # Rare path (full edits): rebuild without the appointment itself.
+        booked = build_day(doctor_id, day, exclude_id=exclude.pk)
+    else:
+        booked = get_booked(doctor_id, day)
+    if mask and not booked & mask:
+        return True
+    return not overlaps_pending(doctor_id, start_time, end_time, exclude=exclude)
+
+
+def occupy(doctor_id, start_time, end_time):
+    """Mark the slots of a newly pending appointment as taken."""
+    day = timezone.localtime(start_time).date()
+    mask = slot_mask(start_time, end_time)
+    with transaction.atomic():
+        row = DoctorAvailability.objects.select_for_update().filter(doctor_id=doctor_id, day=day).first()
+        if row is None:
+            # First booking of the day: the new appointment is already in the table.
+            row, created = DoctorAvailability.objects.get_or_create(
+                doctor_id=doctor_id, day=day,
+                defaults={'booked': build_day(doctor_id, day)}
+            )
+            if created:
+                return
+            row = DoctorAvailability.objects.select_for_update().get(pk=row.pk)
+
+        if row.booked & mask != mask:
+            row.booked |= mask
+            row.save(update_fields=['booked'])
+
+
+def refresh_day(doctor_id, day):
+    """
+    Rebuild a doctor's grid for a day, e.g. after a cancellation or a move.
+    Days that were never built are left alone; get_booked builds them lazily.
+    """
+    DoctorAvailability.objects.filter(doctor_id=doctor_id, day=day).update(
+        booked=build_day(doctor_id, day)
+    )
+
+
+def day_schedule(doctor_id, day):
+    """Slot-by-slot view of a doctor's day, as returned by the availability endpoint."""
+    if day.weekday() >= 5:
+        return {'doctor': doctor_id, 'date': day.isoformat(), 'slot_minutes': SLOT_MINUTES, 'slots': []}
+
+    booked = get_booked(doctor_id, day)
+    now = timezone.now()
+    opening = timezone.make_aware(datetime.combine(day, time(hour=OPENING_HOUR)))
+
+    slots = []
+    for index in range(SLOTS_PER_DAY):
+        slot_start = opening + timedelta(minutes=index * SLOT_MINUTES)
+        slot_end = slot_start + timedelta(minutes=SLOT_MINUTES)
+        slots.append({
+            'start': slot_start.isoformat(),
+            'end': slot_end.isoformat(),
+            'available': not booked >> index & 1 and slot_start >= now,
+        })
+
+    return {'doctor': doctor_id, 'date': day.isoformat(), 'slot_minutes': SLOT_MINUTES, 'slots': slots}
@@ -0,0 +1,127 @@
+import hashlib
+import secrets
+import time
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.models import CatalogVersion
+
+from .streaming import wants_stream
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _new_token():
+    return secrets.token_hex(8)
+
+
+def get_versions(*catalogs):
+    """
+    {catalog: (token, modified)} with one query. The token changes on every
+    write to the catalog's tables; modified is when that happened, in whole
+    epoch seconds. The versions live in the CatalogVersion table, so all
+    worker processes agree on them; only response bodies go in the cache.
+    """
+    versions = {
+        catalog: (token, modified)
+        for catalog, token, modified in CatalogVersion.objects.filter(catalog__in=catalogs).values_list(
+            'catalog', 'token', 'modified'
+        )
+    }
+    for catalog in set(catalogs) - versions.keys():
+        # Never bumped: start a fresh version, which no client can hold yet.
+        row, _ = CatalogVersion.objects.get_or_create(
+            catalog=catalog, defaults={'token': _new_token(), 'modified': int(time.time())}
+        )
+        versions[catalog] = (row.token, row.modified)
+    return versions
+
+
+def get_version(catalog):
+    return get_versions(catalog)[catalog]
+
+
+def bump_version(*catalogs):
+    """
+    Invalidate everything cached for these catalogs. Call after .update()/bulk
+    writes, which send no signals. Takes effect when the current transaction
+    commits (at once outside one), so nothing is cached against the new
+    version before the write is visible, and concurrent writers don't queue
+    on the version row.
+    """
+    transaction.on_commit(lambda: _bump(catalogs))
+
+
+def _bump(catalogs):
+    now = int(time.time())
+    for catalog in catalogs:
+        # Last-Modified has one-second resolution, so every bump has to move it by at least a second.
+        bumped = CatalogVersion.objects.filter(catalog=catalog).update(
+            token=_new_token(), modified=Greatest(F('modified') + 1, Value(now))
+        )
+        if not bumped:
+            try:
+                with transaction.atomic():
+                    CatalogVersion.objects.create(catalog=catalog, token=_new_token(), modified=now)
+            except IntegrityError:
+                CatalogVersion.objects.filter(catalog=catalog).update(
+                    token=_new_token(), modified=Greatest(F('modified') + 1, Value(now))
+                )
+
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = (tag.strip() for tag in header.split(','))
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+class CatalogCacheMixin:
+    """
+    Caches the list response of a reference catalog under the catalog's version
+    (see bump_version and the signals in api.signals), and makes it conditional:
+    responses carry ETag / Last-Modified, and a client that already holds the
+    current version gets a 304 for the price of reading the version row.
+    Bodies are cached under the version token, so a worker whose cache is
+    not shared with the others can be cold but never stale.
+    """
+    catalog = None
+
+    def list(self, request, *args, **kwargs):
+        if wants_stream(request):
+            return super().list(request, *args, **kwargs)
+
+        token, modified = get_version(self.catalog)
+        query = request.GET.urlencode()
+        variant = hashlib.sha1(f'{type(self).__module__}.{type(self).__qualname__}?{query}'.encode()).hexdigest()[:12]
+        etag = f'"{self.catalog}-{token}-{variant}"'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(modified),
+            'Cache-Control': 'private, no-cache',
+        }
+
+        if_none_match = request.headers.get('If-None-Match')
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+        if _etag_matches(if_none_match, etag) or (
+            not if_none_match and if_modified_since is not None and modified <= if_modified_since
+        ):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        key = f'catalog:body:{self.catalog}:{token}:{variant}'
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, CACHE_TIMEOUT)
+        return Response(data, headers=headers)
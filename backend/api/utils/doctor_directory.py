@@ -0,0 +1,75 @@
+import copy
+import threading
+from decimal import Decimal
+
+from api.models import Doctor
+
+from .catalog_cache import get_versions
+
+DEFAULT_CONSULTATION_FEE = Decimal('500.00')
+
+_lock = threading.Lock()
+_directory = None
+
+
+class Directory:
+    """Every doctor with their department, as loaded for one (doctor, department) catalog version."""
+
+    def __init__(self, version, doctors, rows):
+        self.version = version
+        self.doctors = doctors
+        self.rows = rows
+
+
+def _current_version():
+    versions = get_versions('doctor', 'department')
+    return versions['doctor'][0], versions['department'][0]
+
+
+def _load(version):
+    from api.serializers import DoctorViewSerializer
+
+    doctors = list(Doctor.objects.select_related('department_id').order_by('pk'))
+    rows = list(DoctorViewSerializer(doctors, many=True).data)
+    return Directory(version, {doctor.staff_id: doctor for doctor in doctors}, rows)
+
+
+def get_directory():
+    """
+    The directory for the current catalog versions. The versions are read from
+    the database on every call (one query), so a Doctor or Department change
+    committed by any worker process is picked up by all of them on their next
+    lookup. One thread reloads it; the others keep using the previous copy
+    meanwhile, or wait for the first load.
+    """
+    global _directory
+    version = _current_version()
+    directory = _directory
+    if directory is not None and directory.version == version:
+        return directory
+
+    if not _lock.acquire(blocking=directory is None):
+        return directory
+    try:
+        if _directory is None or _directory.version != version:
+            _directory = _load(version)
+        return _directory
+    finally:
+        _lock.release()
+
+
+def doctor_rows():
+    """DoctorViewSerializer output for every doctor (the doctor list)."""
+    return get_directory().rows
+
+
+def get_doctor(staff_id):
+    """A copy of the Doctor (department included), or None for an unknown staff_id."""
+    doctor = get_directory().doctors.get(staff_id)
+    return copy.copy(doctor) if doctor is not None else None
+
+
+def consultation_fee(staff_id):
+    doctor = get_directory().doctors.get(staff_id)
+    department = doctor.department_id if doctor is not None else None
+    return department.fee if department is not None and department.fee else DEFAULT_CONSULTATION_FEE
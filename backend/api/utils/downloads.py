@@ -0,0 +1,119 @@
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+from .catalog_cache import _etag_matches
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat):
+    """A validator for a file that has no digest of its own: its size and modification time."""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to serve the whole
+    file (no header, or several ranges, which a 200 may answer), or False when
+    the range can't be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None if ',' in header else False
+    first, last = match.groups()
+    if not first and not last:
+        return False
+    if not first:  # bytes=-N: the last N bytes
+        length = int(last)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _read(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _sendfile(path, response):
+    """Hand the body to the web server when SENDFILE_BACKEND is set; returns whether it did."""
+    backend = getattr(settings, 'SENDFILE_BACKEND', None)
+    if backend == 'x-sendfile':
+        response['X-Sendfile'] = os.path.abspath(path)
+    elif backend == 'x-accel-redirect':
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.MEDIA_ROOT or '.'))
+        prefix = getattr(settings, 'SENDFILE_URL_PREFIX', '/protected/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative.replace(os.sep, '/')
+    else:
+        return False
+    return True
+
+
+def serve_file(request, path, content_type, filename=None, etag=None):
+    """
+    Send a file with conditional GET (ETag / Last-Modified), single byte-range
+    requests (206, or 416 when unsatisfiable) and, with SENDFILE_BACKEND set
+    ('x-sendfile' or 'x-accel-redirect'), the body left to the web server.
+    Call only after the request has been authorized.
+    """
+    stat = os.stat(path)
+    etag = etag or file_etag(stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, no-cache',
+    }
+    if filename:
+        headers['Content-Disposition'] = f'inline; filename="{filename}"'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    if _etag_matches(if_none_match, etag) or (
+        not if_none_match and if_modified_since is not None and int(stat.st_mtime) <= if_modified_since
+    ):
+        response = HttpResponseNotModified()
+        for name in ('ETag', 'Last-Modified', 'Cache-Control'):
+            response[name] = headers[name]
+        return response
+
+    # The web server does ranges itself from here.
+    response = HttpResponse(content_type=content_type, headers=headers)
+    if _sendfile(path, response):
+        return response
+
+    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    if_range = request.headers.get('If-Range')
+    if byte_range and if_range and if_range.strip() != etag:
+        byte_range = None  # the client's partial copy is of an older version
+    if byte_range is False:
+        response = HttpResponse(status=416, headers=headers)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range is None:
+        return FileResponse(open(path, 'rb'), content_type=content_type, headers=headers)
+
+    start, end = byte_range
+    response = StreamingHttpResponse(_read(path, start, end - start + 1), status=206,
+                                     content_type=content_type, headers=headers)
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
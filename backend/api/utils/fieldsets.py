@@ -0,0 +1,122 @@
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from .related import _relation_map, field_chains, serializer_lookups
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def _names(request, param):
+    value = request.query_params.get(param, '')
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def trim_fields(serializer, fields, omit):
+    """Drop every field not in `fields` (when given) and every field in `omit`."""
+    target = serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+    available = set(target.fields)
+    unknown = (fields | omit) - available
+    if unknown:
+        raise ValidationError({
+            FIELDS_PARAM: f"Unknown field(s): {', '.join(sorted(unknown))}. "
+                          f"Available: {', '.join(sorted(available))}."
+        })
+    keep = (fields or available) - omit
+    for name in available - keep:
+        target.fields.pop(name)
+    return serializer
+
+
+def _first_attrs(serializer, field):
+    """First attribute (on the instance) of everything a field reads, or None when that can't be told."""
+    if field.source == '*':
+        return None
+    if isinstance(field, serializers.BaseSerializer):
+        return {field.source_attrs[0]}
+    if isinstance(field, serializers.RelatedField) and len(field.source_attrs) == 1:
+        return {field.source_attrs[0]}
+    chains = field_chains(serializer, field)
+    if not chains and isinstance(field, serializers.SerializerMethodField):
+        return None
+    return {chain[0] for chain in chains}
+
+
+def _lookup_root(lookup):
+    return getattr(lookup, 'prefetch_through', lookup).split('__')[0]
+
+
+def sparse_columns(serializer, queryset, extra=()):
+    """
+    The model fields to load for a (trimmed) serializer: what its fields read, the
+    relations the queryset joins or prefetches through, and `extra` (e.g. the
+    ordering). None when a field reads something that isn't a model field, such as
+    a model method, in which case nothing is deferred.
+    """
+    model = queryset.model
+    concrete = {}
+    for field in model._meta.concrete_fields:
+        concrete[field.name] = concrete[field.attname] = field
+    relations = _relation_map(model)
+
+    columns = {model._meta.pk.name}
+    wanted = set(extra)
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        attrs = _first_attrs(serializer, field)
+        if attrs is None:
+            return None
+        wanted |= attrs
+
+    if queryset.query.select_related is True:
+        return None
+    wanted |= set(queryset.query.select_related or ())
+    wanted |= {_lookup_root(lookup) for lookup in queryset._prefetch_related_lookups}
+
+    for attr in wanted:
+        if attr in concrete:
+            columns.add(concrete[attr].name)
+        elif attr != 'pk' and attr not in relations:
+            return None
+    return sorted(columns)
+
+
+class SparseFieldsetMixin:
+    """
+    ?fields=id,name keeps only the listed fields, ?omit=a,b drops some. Applies to
+    reads only. The SQL is trimmed to match: unused relations are neither joined
+    nor prefetched (with AutoRelatedMixin) and the column list is cut down with
+    .only(). Put it before AutoRelatedMixin in the bases.
+    """
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = None
+            if self.request is not None and self.request.method in SAFE_METHODS:
+                fields, omit = _names(self.request, FIELDS_PARAM), _names(self.request, OMIT_PARAM)
+                if fields or omit:
+                    self._fieldset = (fields, omit)
+        return self._fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fieldset = self.get_fieldset()
+        return trim_fields(serializer, *fieldset) if fieldset else serializer
+
+    def get_related_lookups(self):
+        if self.get_fieldset():
+            return serializer_lookups(self.get_serializer())
+        return super().get_related_lookups()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not self.get_fieldset():
+            return queryset
+
+        ordering = list(queryset.query.order_by) + list(getattr(self, 'cursor_ordering', ()))
+        ordering += list(queryset.model._meta.ordering)
+        extra = {name.lstrip('-').split('__')[0] for name in ordering if isinstance(name, str)}
+        columns = sparse_columns(self.get_serializer(), queryset, extra)
+        return queryset.only(*columns) if columns else queryset
@@ -1,5 +1,12 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 import math
 
 class LimitTenPagination(PageNumberPagination):
@@ -13,3 +20,139 @@ class LimitTenPagination(PageNumberPagination):
             'total_pages': total_pages,
             'results': data
         })
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination: every page is a range scan from the last seen row,
+    so deep pages cost the same as the first one. The cursor holds the whole
+    ordering key of that row, e.g. (start_time, id), so rows that tie on the
+    first column are still paged by the tiebreaker rather than by an OFFSET.
+    The total count is only run when asked for with ?with_count=true, otherwise
+    it is null.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-id',)
+    count_query_param = 'with_count'
+
+    def get_ordering(self, request, queryset, view):
+        # Views pick their keyset with `cursor_ordering`, e.g. ('-start_time', '-id'); the
+        # last field must be unique so every row has a distinct position.
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        # Paging backwards walks the inverted ordering from the cursor, then flips the page.
+        ordering = [_invert(name) for name in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(_after(ordering, position))
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
+
+    def _position(self, instance):
+        return [getattr(instance, name) for name in self.fields]
+
+    def _link(self, position, reverse):
+        payload = {'p': [_encode_value(value) for value in position]}
+        if reverse:
+            payload['r'] = 1
+        encoded = urlsafe_b64encode(json.dumps(payload, separators=(',', ':'), default=str).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, model=None):
+        """(position, reverse) from the request's cursor; (None, False) on the first page."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            values = payload['p']
+            if len(values) != len(self.fields):
+                raise ValueError(values)
+            position = [model._meta.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self._position(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+
+def _invert(name):
+    return name[1:] if name.startswith('-') else f'-{name}'
+
+
+def _after(ordering, position):
+    """
+    Rows strictly after `position` in `ordering`: (a, b) after (x, y) is
+    a beyond x, or a == x and b beyond y.
+    """
+    condition = Q()
+    equal = Q()
+    for name, value in zip(ordering, position):
+        field = name.lstrip('-')
+        beyond = Q(**{f"{field}__{'lt' if name.startswith('-') else 'gt'}": value})
+        condition |= equal & beyond
+        equal &= Q(**{field: value})
+    return condition
+
+
+def _encode_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def wants_keyset(request):
+    return request.query_params.get('pagination') == 'cursor' or 'cursor' in request.query_params
+
+
+class KeysetPaginationMixin:
+    """
+    Lets a view switch to KeysetPagination with ?pagination=cursor (then follow the
+    `next` links). Without it the view keeps its usual pagination_class.
+    """
+    cursor_ordering = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and wants_keyset(self.request):
+            self._paginator = KeysetPagination()
+        return super().paginator
@@ -0,0 +1,156 @@
+import ast
+import inspect
+import textwrap
+
+from django.apps import apps
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+
+# serializer class -> (select_related lookups, prefetch_related lookups)
+_LOOKUP_CACHE = {}
+
+
+def _relation_map(model):
+    """attribute name -> field, for forward fields and reverse relation accessors."""
+    fields = {}
+    for field in model._meta.get_fields():
+        if field.auto_created and not field.concrete:
+            fields[field.get_accessor_name()] = field
+        else:
+            fields[field.name] = field
+    return fields
+
+
+def attribute_chains(func, arg_index):
+    """
+    Attribute chains read off one argument of a function, found by parsing its
+    source: `obj.doctor.department_id.department_name` gives
+    ('doctor', 'department_id', 'department_name').
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    except (OSError, TypeError, SyntaxError):
+        return []
+    function = tree.body[0]
+    if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)) or len(function.args.args) <= arg_index:
+        return []
+    name = function.args.args[arg_index].arg
+
+    chains = set()
+    for node in ast.walk(function):
+        if isinstance(node, ast.Attribute):
+            chain = []
+            while isinstance(node, ast.Attribute):
+                chain.append(node.attr)
+                node = node.value
+            if isinstance(node, ast.Name) and node.id == name:
+                chains.add(tuple(reversed(chain)))
+    return sorted(chains)
+
+
+def field_chains(serializer, field):
+    """Attribute chains (relative to the serialized instance) a field reads."""
+    if isinstance(field, serializers.SerializerMethodField):
+        method = getattr(serializer, field.method_name, None)
+        return attribute_chains(method, 1) if method else []
+    if field.source == '*':
+        return []
+
+    attrs = tuple(field.source_attrs)
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    prop = getattr(model, attrs[0], None) if model else None
+    if isinstance(prop, property) and len(attrs) == 1:
+        # Model properties, e.g. Appointment.patient_name
+        return attribute_chains(prop.fget, 0)
+
+    if isinstance(field, PrimaryKeyRelatedField) and len(attrs) == 1:
+        return []  # only reads the <fk>_id column
+    if isinstance(field, (RelatedField, ManyRelatedField)):
+        return [attrs + ('pk',)]
+    return [attrs]
+
+
+def _resolve(model, chain):
+    """Split a chain into the relation lookup it traverses and whether it crosses a to-many relation."""
+    lookup, many = [], False
+    for attr in chain:
+        field = _relation_map(model).get(attr)
+        if field is None or not field.is_relation or field.related_model is None:
+            break
+        lookup.append(attr)
+        many = many or field.one_to_many or field.many_to_many
+        model = field.related_model
+    return '__'.join(lookup), many, model
+
+
+def _collect(serializer, model, prefix, in_prefetch, select, prefetch):
+    def add(lookup, many):
+        (prefetch if many or in_prefetch else select).add(prefix + lookup)
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(nested, serializers.Serializer):
+            lookup, many, related_model = _resolve(model, tuple(field.source_attrs))
+            if lookup and lookup == '__'.join(field.source_attrs):
+                add(lookup, many)
+                _collect(nested, related_model, prefix + lookup + '__', many or in_prefetch, select, prefetch)
+            continue
+
+        for chain in field_chains(serializer, field):
+            lookup, many, _ = _resolve(model, chain)
+            if lookup:
+                add(lookup, many)
+
+
+def serializer_lookups(serializer):
+    """Lookups for one serializer instance, e.g. one whose fields have been trimmed."""
+    select, prefetch = set(), set()
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is not None:
+        _collect(serializer, model, '', False, select, prefetch)
+    return sorted(select), sorted(prefetch)
+
+
+def related_lookups(serializer_class):
+    """
+    The select_related / prefetch_related lookups needed to serialize a ModelSerializer
+    without per-row queries. Worked out once per serializer class from field sources,
+    nested serializers, SerializerMethodField bodies and model properties.
+    """
+    if serializer_class not in _LOOKUP_CACHE:
+        _LOOKUP_CACHE[serializer_class] = serializer_lookups(serializer_class())
+    return _LOOKUP_CACHE[serializer_class]
+
+
+def optimize_queryset(queryset, serializer_class, lookups=None):
+    model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+    if model is None or queryset.model is not model:
+        return queryset
+    select, prefetch = lookups or related_lookups(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class AutoRelatedMixin:
+    """
+    Applies the select_related / prefetch_related a view's serializer needs, so a
+    list of any length is serialized in a constant number of queries.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if apps.ready and getattr(cls, 'serializer_class', None) is not None:
+            related_lookups(cls.serializer_class)
+
+    def get_related_lookups(self):
+        return related_lookups(self.get_serializer_class())
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return optimize_queryset(queryset, self.get_serializer_class(), self.get_related_lookups())
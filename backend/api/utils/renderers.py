@@ -0,0 +1,29 @@
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to DRF's json-based renderer
+    orjson = None
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer backed by orjson when it is installed. The output matches DRF's
+    renderer: compact, UTF-8, dates and decimals formatted by DRF's own encoder.
+    Indented output (the browsable API) still goes through the json module.
+    """
+    _encoder = encoders.JSONEncoder()
+    _options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self._encoder.default, option=self._options)
+        # Same strict-javascript-subset escaping as JSONRenderer.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
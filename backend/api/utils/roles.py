@@ -1,15 +1,131 @@
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Exists, F, OuterRef
+
+from api.models import UserRoleStamp
+
+# Groups the permission classes look at ('Doctors' is what labtechnician.permissions checks).
+ROLE_GROUPS = ('Admin', 'Receptionist', 'Doctor', 'Doctors', 'Pharmacist', 'LabTechnician')
+
+ROLE_VERSION_CLAIM = 'role_version'
+
+# profile type -> (model, reverse one-to-one accessor on User)
+PROFILE_RELATIONS = {
+    'doctor': ('api.Doctor', 'doctor'),
+    'receptionist': ('api.Receptionist', 'receptionist'),
+    'pharmacist': ('api.Pharmacist', 'pharmacist'),
+    'labtechnician': ('api.LabTechnician', 'lab_technician'),
+    'admin': ('api.Admin', 'admin'),
+}
+
+
+class UserRole:
+    """
+    Everything the permission classes need to know about a user: the role groups
+    they belong to and which staff profiles they have, as {type: (pk, staff_id)}.
+    """
+
+    def __init__(self, user, groups=(), profiles=None, loaded_profiles=None):
+        self.user = user
+        self.groups = frozenset(groups)
+        self.profiles = profiles or {}
+        self._loaded_profiles = loaded_profiles or {}
+
+    @property
+    def is_admin(self):
+        return bool(self.user.is_superuser) or 'Admin' in self.groups
+
+    @property
+    def role(self):
+        if self.is_admin:
+            return 'admin'
+        elif 'Receptionist' in self.groups:
+            return 'receptionist'
+        elif 'Doctor' in self.groups:
+            return 'doctor'
+        elif 'Pharmacist' in self.groups:
+            return 'pharmacist'
+        elif 'LabTechnician' in self.groups:
+            return 'labtechnician'
+        else:
+            return 'unknown'
+
+    def in_group(self, *names):
+        return not self.groups.isdisjoint(names)
+
+    def has_profile(self, profile_type):
+        return profile_type in self.profiles
+
+    def staff_id_for(self, profile_type):
+        return self.profiles[profile_type][1] if profile_type in self.profiles else None
+
+    def to_claims(self, version):
+        """JWT claims describing this role; see api.authentication."""
+        primary = next(iter(self.profiles.values()), (None, None))
+        return {
+            'role': self.role,
+            'staff_id': primary[1],
+            'profile_id': primary[0],
+            'groups': sorted(self.groups),
+            'profiles': {profile_type: list(ids) for profile_type, ids in self.profiles.items()},
+            ROLE_VERSION_CLAIM: version,
+        }
+
+    @classmethod
+    def from_claims(cls, user, token):
+        profiles = {profile_type: tuple(ids) for profile_type, ids in token.get('profiles', {}).items()}
+        return cls(user, token.get('groups', ()), profiles)
+
+    def profile(self, profile_type):
+        """The profile instance (Doctor, Receptionist, ...) or None, loaded at most once."""
+        if profile_type not in self.profiles:
+            return None
+        if profile_type not in self._loaded_profiles:
+            model = apps.get_model(PROFILE_RELATIONS[profile_type][0])
+            self._loaded_profiles[profile_type] = model.objects.get(pk=self.profiles[profile_type][0])
+        return self._loaded_profiles[profile_type]
+
+
+def load_user_role(user):
+    """Resolve a user's groups and staff profiles with a single query."""
+    if user is None or not user.is_authenticated:
+        return UserRole(user or AnonymousUser())
+
+    memberships = User.groups.through.objects.filter(user_id=OuterRef('pk'))
+    flags = {f'in_group_{i}': Exists(memberships.filter(group__name=name)) for i, name in enumerate(ROLE_GROUPS)}
+    relations = [relation for _, relation in PROFILE_RELATIONS.values()]
+    row = User.objects.select_related(*relations).annotate(**flags).get(pk=user.pk)
+
+    groups = [name for i, name in enumerate(ROLE_GROUPS) if getattr(row, f'in_group_{i}')]
+    profiles, loaded = {}, {}
+    for profile_type, (_, relation) in PROFILE_RELATIONS.items():
+        try:
+            profile = getattr(row, relation)
+        except ObjectDoesNotExist:
+            continue
+        profiles[profile_type] = (profile.pk, profile.staff_id)
+        loaded[profile_type] = profile
+    return UserRole(user, groups, profiles, loaded)
+
+
+def get_request_role(request):
+    """The caller's UserRole, resolved once per request and memoized on it."""
+    role = getattr(request, '_user_role', None)
+    if role is None or role.user is not request.user:
+        role = load_user_role(request.user)
+        request._user_role = role
+    return role
+
+
 def get_user_role(user):
-    groups = user.groups.all().values_list('name', flat=True)
-
-    if user.is_superuser or 'Admin' in groups:
-        return 'admin'
-    elif 'Receptionist' in groups:
-        return 'receptionist'
-    elif 'Doctor' in groups:
-        return 'doctor'
-    elif 'Pharmacist' in groups:
-        return 'pharmacist'
-    elif 'LabTechnician' in groups:
-        return 'labtechnician'
-    else:
-        return 'unknown'
\ No newline at end of file
+    return load_user_role(user).role
+
+
+def bump_role_versions(user_ids):
+    """
+    Invalidate the role claims of every token issued to these users. Users without
+    a stamp have never been issued a claim-bearing token, so there is nothing to bump.
+    """
+    if user_ids:
+        UserRoleStamp.objects.filter(user_id__in=user_ids).update(version=F('version') + 1)
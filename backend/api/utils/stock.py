@@ -0,0 +1,100 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+
+from api.models import Medicine, StockMovement
+
+from .catalog_cache import bump_version
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        # {medicine_id: (requested, available)}
+        self.shortages = shortages
+        super().__init__(shortages)
+
+
+def _bump_catalog():
+    # Stock is part of the cached medicine catalog, and .update() sends no signals.
+    bump_version('medicine')
+
+
+def _apply(deltas):
+    """One UPDATE moving every medicine's stock by its delta."""
+    Medicine.objects.filter(pk__in=deltas).update(stock=Case(
+        *(When(pk=pk, then=F('stock') + delta) for pk, delta in deltas.items()),
+        output_field=IntegerField(),
+    ))
+
+
+def dispense(quantities, bill=None):
+    """
+    Take {medicine_id: quantity} out of stock for a sale. Only the medicines
+    involved are locked (in pk order, so concurrent sales can't deadlock), and
+    nothing is written if any of them is short: InsufficientStock is raised.
+    Must be called inside the transaction that creates the bill.
+    """
+    quantities = {pk: qty for pk, qty in quantities.items() if qty}
+    if not quantities:
+        return
+    available = dict(
+        Medicine.objects.select_for_update().filter(pk__in=quantities).order_by('pk').values_list('pk', 'stock')
+    )
+    shortages = {
+        pk: (qty, available.get(pk, 0))
+        for pk, qty in quantities.items() if available.get(pk, 0) < qty
+    }
+    if shortages:
+        raise InsufficientStock(shortages)
+
+    _apply({pk: -qty for pk, qty in quantities.items()})
+    StockMovement.objects.bulk_create([
+        StockMovement(medicine_id=pk, delta=-qty, reason='sale', bill=bill)
+        for pk, qty in quantities.items()
+    ])
+    _bump_catalog()
+
+
+@transaction.atomic
+def receive(medicine_id, quantity, reason='receipt'):
+    """
+    Add (or, for a negative quantity, remove) stock of one medicine and return
+    the new balance. The check and the change are one conditional UPDATE.
+    Raises Medicine.DoesNotExist or InsufficientStock.
+    """
+    updated = Medicine.objects.filter(pk=medicine_id, stock__gte=max(-quantity, 0)).update(
+        stock=F('stock') + quantity
+    )
+    if not updated:
+        stock = Medicine.objects.filter(pk=medicine_id).values_list('stock', flat=True).first()
+        if stock is None:
+            raise Medicine.DoesNotExist(f"Medicine {medicine_id} does not exist.")
+        raise InsufficientStock({medicine_id: (-quantity, stock)})
+
+    StockMovement.objects.create(medicine_id=medicine_id, delta=quantity, reason=reason)
+    _bump_catalog()
+    return Medicine.objects.filter(pk=medicine_id).values_list('stock', flat=True).get()
+
+
+@transaction.atomic
+def reconcile(medicine_ids=None):
+    """
+    Check Medicine.stock against the sum of its ledger and set it to the ledger
+    balance where they differ. Returns the corrections made.
+    """
+    medicines = Medicine.objects.select_for_update().order_by('pk')
+    if medicine_ids is not None:
+        medicines = medicines.filter(pk__in=medicine_ids)
+    stock = dict(medicines.values_list('pk', 'stock'))
+
+    balances = dict(
+        StockMovement.objects.filter(medicine_id__in=stock).values('medicine_id')
+        .annotate(balance=Sum('delta')).values_list('medicine_id', 'balance')
+    )
+    corrections = [
+        {'medicine_id': pk, 'stock': current, 'ledger_balance': balances.get(pk, 0)}
+        for pk, current in stock.items() if current != balances.get(pk, 0)
+    ]
+    if corrections:
+        _apply({row['medicine_id']: row['ledger_balance'] - row['stock'] for row in corrections})
+        _bump_catalog()
+    return {'checked': len(stock), 'corrections': corrections}
@@ -0,0 +1,56 @@
+from django.http import StreamingHttpResponse
+
+from .renderers import FastJSONRenderer
+
+
+def wants_stream(request):
+    return request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def pk_chunks(queryset, chunk_size):
+    """
+    The queryset's rows in primary-key order, as lists of up to `chunk_size`,
+    each fetched by its own `pk > last` LIMIT query. Unlike iterator(), this
+    keeps memory flat on drivers without server-side cursors (mysqlclient
+    buffers a query's whole result set client-side), and prefetch_related
+    applies per chunk.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+class StreamingListMixin:
+    """
+    Adds ?stream=true to a list endpoint: rows are read in primary-key order,
+    `stream_chunk_size` at a time with one keyset query per chunk (pk_chunks),
+    serialized a chunk at a time and written out as one JSON array, so memory
+    stays flat however large the table is. Pagination and the view's ordering
+    are not applied to streamed responses.
+    """
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        if not wants_stream(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(self.stream_rows(queryset), content_type='application/json')
+
+    def stream_rows(self, queryset):
+        renderer = FastJSONRenderer()
+        yield b'['
+        for index, chunk in enumerate(pk_chunks(queryset, self.stream_chunk_size)):
+            yield self._render_chunk(renderer, chunk, index == 0)
+        yield b']'
+
+    def _render_chunk(self, renderer, chunk, first):
+        # Render the chunk as an array and drop the brackets, so chunks join with commas.
+        body = renderer.render(self.get_serializer(chunk, many=True).data)[1:-1]
+        return body if first else b',' + body
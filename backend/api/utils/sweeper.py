@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Appointment, AppointmentSweepRun
+from api.utils import availability
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def cancel_expired_appointments(batch_size=DEFAULT_BATCH_SIZE, max_batches=None):
+    """
+    Cancel pending appointments whose start time has passed, `batch_size` rows per
+    transaction so row locks stay short. Returns the AppointmentSweepRun record.
+    """
+    cutoff = timezone.now()
+    run = AppointmentSweepRun.objects.create(cutoff=cutoff)
+    expired = Appointment.objects.filter(status='Pending', start_time__lt=cutoff)
+
+    while max_batches is None or run.batches < max_batches:
+        batch = list(expired.order_by('start_time').values_list('id', 'doctor_id', 'start_time')[:batch_size])
+        if not batch:
+            break
+
+        with transaction.atomic():
+            run.cancelled_count += Appointment.objects.filter(
+                id__in=[appointment_id for appointment_id, _, _ in batch],
+                status='Pending'
+            ).update(status='Cancelled')
+
+        # .update() skips the model signals, so release the slots here.
+        days = {(doctor_id, timezone.localtime(start_time).date()) for _, doctor_id, start_time in batch}
+        for doctor_id, day in days:
+            availability.refresh_day(doctor_id, day)
+
+        run.batches += 1
+
+    run.finished_at = timezone.now()
+    run.save(update_fields=['finished_at', 'batches', 'cancelled_count'])
+    return run
@@ -0,0 +1,120 @@
+from django.db.models import Prefetch
+
+from api.models import MedicalHistory, PatientTimelineEntry, Prescription, PrescriptionLabTest, PrescriptionMedicine
+
+TIMELINE_LIMIT = 100
+MAX_TIMELINE_LIMIT = 500
+
+
+def _person(staff):
+    if staff is None:
+        return None
+    return {'staff_id': staff.staff_id, 'name': f"{staff.first_name} {staff.last_name}"}
+
+
+def prescription_payload(prescription, diagnosis=None):
+    """Everything the history screen shows for a prescription, as plain JSON."""
+    return {
+        'prescription_id': prescription.id,
+        'appointment_id': prescription.appointment_id,
+        'doctor': _person(prescription.doctor),
+        'diagnosis': diagnosis,
+        'notes': prescription.notes,
+        'medicines': [
+            {
+                'id': line.medicine_id,
+                'name': line.medicine.medicine_name,
+                'dosage': line.dosage,
+                'frequency': line.frequency,
+                'duration': line.duration,
+            }
+            for line in prescription.prescriptionmedicine_set.all()
+        ],
+        'lab_tests': [
+            {
+                'id': line.lab_test_id,
+                'name': line.lab_test.test_name,
+                'test_date': line.test_date.isoformat(),
+            }
+            for line in prescription.prescriptionlabtest_set.all()
+        ],
+    }
+
+
+def lab_report_payload(lab_report):
+    return {
+        'report_id': lab_report.id,
+        'prescription_id': lab_report.prescription_id,
+        'requested_by': lab_report.requested_by,
+        'generated_by': _person(lab_report.generated_by),
+        'remarks': lab_report.remarks,
+        'results': [
+            {
+                'prescription_lab_test_id': result.prescription_lab_test_id,
+                'test_name': result.prescription_lab_test.lab_test.test_name,
+                'result_data': result.result_data,
+            }
+            for result in lab_report.labreporttestresult_set.all()
+        ],
+    }
+
+
+def _record(patient_id, kind, source_id, occurred_at, payload):
+    PatientTimelineEntry.objects.update_or_create(
+        kind=kind, source_id=source_id,
+        defaults={'patient_id': patient_id, 'occurred_at': occurred_at, 'payload': payload}
+    )
+
+
+def prescription_queryset():
+    return Prescription.objects.select_related('doctor', 'appointment').prefetch_related(
+        Prefetch('prescriptionmedicine_set', PrescriptionMedicine.objects.select_related('medicine')),
+        Prefetch('prescriptionlabtest_set', PrescriptionLabTest.objects.select_related('lab_test')),
+    )
+
+
+def prescription_occurred_at(prescription):
+    # Prescriptions carry no timestamp of their own; the consultation is the closest thing,
+    # and unlike the time of writing it comes out the same when the timeline is rebuilt.
+    return prescription.appointment.start_time
+
+
+def record_prescription(prescription, diagnosis=None):
+    """
+    Write (or rewrite) the timeline entry of a prescription. Call again whenever
+    the prescription or its medical history changes.
+    """
+    if 'prescriptionmedicine_set' not in getattr(prescription, '_prefetched_objects_cache', {}):
+        prescription = prescription_queryset().get(pk=prescription.pk)
+    if diagnosis is None:
+        diagnosis = MedicalHistory.objects.filter(prescription=prescription).values_list('diagnosis', flat=True).first()
+    _record(prescription.patient_id, 'prescription', prescription.id, prescription_occurred_at(prescription),
+            prescription_payload(prescription, diagnosis))
+
+
+def record_lab_report(lab_report):
+    """Write (or rewrite) the timeline entry of a lab report; it is dated when the report was created."""
+    lab_report = type(lab_report).objects.select_related('prescription', 'generated_by').prefetch_related(
+        'labreporttestresult_set__prescription_lab_test__lab_test'
+    ).get(pk=lab_report.pk)
+    _record(lab_report.prescription.patient_id, 'lab_report', lab_report.id, lab_report.created_at,
+            lab_report_payload(lab_report))
+
+
+def forget(kind, source_id):
+    PatientTimelineEntry.objects.filter(kind=kind, source_id=source_id).delete()
+
+
+def patient_timeline(patient_id, since=None, until=None, limit=TIMELINE_LIMIT):
+    """A patient's entries, newest first, read off the (patient, occurred_at) index."""
+    entries = PatientTimelineEntry.objects.filter(patient_id=patient_id)
+    if since is not None:
+        entries = entries.filter(occurred_at__gte=since)
+    if until is not None:
+        entries = entries.filter(occurred_at__lt=until)
+    return [
+        {'kind': kind, 'occurred_at': occurred_at, 'data': payload}
+        for kind, occurred_at, payload in entries.order_by('-occurred_at', '-id').values_list(
+            'kind', 'occurred_at', 'payload'
+        )[:limit]
+    ]
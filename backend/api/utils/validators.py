@@ -0,0 +1,8 @@
+from django.core.exceptions import ValidationError
+
+
+def validate_phone(value):
+    """Phone numbers are exactly ten digits. Shared by PatientSerializer and the patient import."""
+    if not value.isdigit() or len(value) != 10:
+        raise ValidationError("Invalid phone number format.", code='invalid')
+    return value
@@ -1,9 +1,11 @@
+from datetime import datetime
+
 from django.contrib.auth.models import Group
-from django.core.exceptions import ObjectDoesNotExist
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.http import JsonResponse
-from django.utils.timezone import now
-from rest_framework.decorators import api_view, permission_classes
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
@@ -13,24 +15,29 @@ from rest_framework.views import APIView
 from .models import Appointment, Patient, Prescription, Bill, ConsultationBill, Doctor, Department, \
     Receptionist, MedicalHistory, PrescriptionLabTest, LabTest, PrescriptionMedicine, Medicine
 from .permissions import IsDoctor, IsReceptionist, IsAdmin
+from labtechnician import analytes, counters
 from labtechnician.permissions import IsLabTechnician
 from .serializers import AppointmentSerializer, PatientSerializer, PrescriptionSerializer, BillSerializer, \
     ConsultationBillSerializer, DoctorSerializer, ReceptionistSerializer, DoctorViewSerializer, DepartmentSerializer, \
     ReceptionistViewSerializer, MedicalHistorySerializer, MedicineSerializer, LabTestSerializer, BillCreateSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 
+from .utils import availability, doctor_directory, timeline
+from .utils.catalog_cache import CatalogCacheMixin
 from .utils.filters import AppointmentFilter, BillFilter
-from .utils.pagination import LimitTenPagination
-from .utils.roles import get_user_role
+from .utils.pagination import LimitTenPagination, KeysetPaginationMixin
+from .utils.fieldsets import SparseFieldsetMixin
+from .utils.related import AutoRelatedMixin, optimize_queryset
+from .utils.roles import get_request_role
+from .utils.streaming import StreamingListMixin
 
 
-class PrescriptionViewSet(viewsets.ModelViewSet):
+class PrescriptionViewSet(SparseFieldsetMixin, AutoRelatedMixin, viewsets.ModelViewSet):
     permission_classes = [IsDoctor | IsAdmin]
     queryset = Prescription.objects.all()
     serializer_class = PrescriptionSerializer
 
     def create(self, request, *args, **kwargs):
-        print(request.data)
         patient_id = request.data.get('patient')
         doctor_id = request.data.get('doctor')
         appointment_id = request.data.get('appointment')
@@ -39,54 +46,107 @@ class PrescriptionViewSet(viewsets.ModelViewSet):
         medicines_data = request.data.get('medicines', [])  # List of medicine objects with dosage and frequency
         lab_tests_data = request.data.get('lab_tests', [])  # List of lab test objects with test_date
 
-        # Create the prescription
-        prescription = Prescription.objects.create(
-            patient_id=patient_id,
-            doctor_id=doctor_id,
-            appointment_id=appointment_id,
-            notes=medical_notes
-        )
+        try:
+            valid = Appointment.objects.filter(pk=appointment_id, patient_id=patient_id, doctor_id=doctor_id).exists()
+        except (TypeError, ValueError):
+            valid = False
+        if not valid:
+            raise ValidationError("Invalid patient, doctor or appointment.")
+
+        # One IN query per catalog for every referenced medicine / lab test
+        medicine_ids = _validate_lines(medicines_data, 'medicines', Medicine, ('id', 'dosage', 'frequency', 'duration'))
+        lab_test_ids = _validate_lines(lab_tests_data, 'lab_tests', LabTest, ('id', 'test_date'))
+        test_dates = [_line_date(line['test_date']) for line in lab_tests_data]
+        if None in test_dates:
+            raise ValidationError({'lab_tests': "test_date must be a valid date (YYYY-MM-DD)."})
 
-        # Add medicines with dosage and frequency
-        for medicine_data in medicines_data:
-            PrescriptionMedicine.objects.create(
-                prescription=prescription,
-                medicine_id=medicine_data['id'],
-                dosage=medicine_data['dosage'],
-                frequency=medicine_data['frequency'],
-                duration = medicine_data['duration']
-
-            )
-
-        # Add lab tests with test_date
-        for lab_test_data in lab_tests_data:
-            PrescriptionLabTest.objects.create(
-                prescription=prescription,
-                lab_test_id=lab_test_data['id'],
-                test_date=lab_test_data['test_date']
-            )
-
-        # Create medical history
-        medical_history = MedicalHistory.objects.create(
-            patient_id=patient_id,
-            diagnosis=diagnosis,
-            prescription=prescription
-        )
+        try:
+            with transaction.atomic():
+                prescription = Prescription.objects.create(
+                    patient_id=patient_id,
+                    doctor_id=doctor_id,
+                    appointment_id=appointment_id,
+                    notes=medical_notes
+                )
+
+                PrescriptionMedicine.objects.bulk_create(
+                    PrescriptionMedicine(
+                        prescription=prescription,
+                        medicine_id=medicine_id,
+                        dosage=medicine_data['dosage'],
+                        frequency=medicine_data['frequency'],
+                        duration=medicine_data['duration']
+                    )
+                    for medicine_id, medicine_data in zip(medicine_ids, medicines_data)
+                )
+                PrescriptionLabTest.objects.bulk_create(
+                    PrescriptionLabTest(prescription=prescription, lab_test_id=lab_test_id, test_date=test_date)
+                    for lab_test_id, test_date in zip(lab_test_ids, test_dates)
+                )
+                # bulk_create sends no signals, so the lab dashboard's pending gauge is moved here
+                counters.bump(counters.PENDING, len(lab_test_ids))
+
+                MedicalHistory.objects.create(
+                    patient_id=patient_id,
+                    diagnosis=diagnosis,
+                    prescription=prescription
+                )
+
+                prescription = timeline.prescription_queryset().get(pk=prescription.pk)
+                timeline.record_prescription(prescription, diagnosis)
+        except IntegrityError:
+            raise ValidationError("Invalid patient, doctor or appointment.")
 
         serializer = self.get_serializer(prescription)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            prescription = serializer.save()
+            timeline.record_prescription(prescription)
+
+
+def _line_date(value):
+    try:
+        return parse_date(str(value))
+    except ValueError:
+        return None
+
+
+def _validate_lines(lines, name, model, required):
+    """
+    Check a list of prescription lines and that every id exists, with one IN
+    query. Returns the ids as integers, in line order.
+    """
+    if not isinstance(lines, list):
+        raise ValidationError({name: "Expected a list."})
+    ids = []
+    for index, line in enumerate(lines):
+        missing = [key for key in required if not isinstance(line, dict) or line.get(key) in (None, '')]
+        if missing:
+            raise ValidationError({name: f"Line {index + 1} is missing {', '.join(missing)}."})
+        try:
+            ids.append(int(line['id']))
+        except (TypeError, ValueError):
+            raise ValidationError({name: f"Line {index + 1} has an invalid id."})
+
+    unknown = set(ids) - model.objects.in_bulk(set(ids)).keys() if ids else set()
+    if unknown:
+        raise ValidationError({name: f"Unknown id(s): {', '.join(map(str, sorted(unknown)))}."})
+    return ids
+
+
 @api_view(['GET'])
 def get_prescriptions_by_patient(request, patient_id):
     try:
-        prescriptions = Prescription.objects.filter(patient__id=patient_id)
+        prescriptions = optimize_queryset(Prescription.objects.filter(patient__id=patient_id), PrescriptionSerializer)
         serializer = PrescriptionSerializer(prescriptions, many=True)
         return Response(serializer.data)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class MedicalHistoryViewSet(viewsets.ModelViewSet):
+class MedicalHistoryViewSet(SparseFieldsetMixin, AutoRelatedMixin, viewsets.ModelViewSet):
     serializer_class = MedicalHistorySerializer
     permission_classes = [IsAdmin | IsDoctor]
 
@@ -95,16 +155,11 @@ class MedicalHistoryViewSet(viewsets.ModelViewSet):
         Admins can view all medical histories.
         Doctors can only view medical histories of their assigned patients.
         """
-        user = self.request.user
-        role = get_user_role(user)
+        user_role = get_request_role(self.request)
+        role = user_role.role
 
         if role == "admin":
-            queryset= MedicalHistory.objects.all().select_related(
-                'prescription'
-            ).prefetch_related(
-                'prescription__prescriptionmedicine_set',
-                'prescription__prescriptionlabtest_set'
-            )
+            queryset= MedicalHistory.objects.all()
             patient_id = self.request.query_params.get('patient_id')
             if patient_id:
                 try:
@@ -115,19 +170,15 @@ class MedicalHistoryViewSet(viewsets.ModelViewSet):
             return queryset
 
         elif role == "doctor":
-            doctor = Doctor.objects.filter(user=user).first()
-            if not doctor:
+            staff_id = user_role.staff_id_for('doctor')
+            if not staff_id:
                 raise PermissionDenied("You are not assigned as a doctor.")
 
-            appointments = Appointment.objects.filter(doctor=doctor)
+            appointments = Appointment.objects.filter(doctor_id=staff_id)
             patient_ids = appointments.values_list('patient', flat=True).distinct()
 
-            queryset = MedicalHistory.objects.filter(patient__in=patient_ids).select_related(
-                'prescription'
-            ).prefetch_related(
-                'prescription__prescriptionmedicine_set',
-                'prescription__prescriptionlabtest_set'
-            )
+            # Related rows are loaded by AutoRelatedMixin, trimmed to the requested fields
+            queryset = MedicalHistory.objects.filter(patient__in=patient_ids)
 
             # Optional filtering by patient_id from query params
             patient_id = self.request.query_params.get('patient_id')
@@ -143,7 +194,25 @@ class MedicalHistoryViewSet(viewsets.ModelViewSet):
         else:
             raise PermissionDenied("You do not have access to view medical histories.")
 
-class PatientViewSet(viewsets.ModelViewSet):
+    # The diagnosis is part of the prescription's timeline entry, so every change rewrites it.
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            history = serializer.save()
+            timeline.record_prescription(history.prescription)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            history = serializer.save()
+            timeline.record_prescription(history.prescription)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            prescription = instance.prescription
+            instance.delete()
+            timeline.record_prescription(prescription)
+
+class PatientViewSet(StreamingListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     permission_classes = [IsDoctor | IsReceptionist | IsAdmin]
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
@@ -151,33 +220,106 @@ class PatientViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ['first_name', 'last_name', 'phone', 'email']
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], permission_classes=[IsDoctor | IsAdmin])
+    def timeline(self, request, pk=None):
+        """
+        The patient's prescriptions and lab reports, newest first, from the
+        pre-rendered timeline table. Optional ?since= / ?until= (date or datetime)
+        and ?limit=.
+        """
+        try:
+            patient_id = int(pk)
+            limit = min(int(request.query_params.get('limit', timeline.TIMELINE_LIMIT)), timeline.MAX_TIMELINE_LIMIT)
+        except ValueError:
+            raise ValidationError("patient id and limit must be integers.")
+        since = _parse_moment(request.query_params.get('since'), 'since')
+        until = _parse_moment(request.query_params.get('until'), 'until')
+
+        role = get_request_role(request)
+        if not role.is_admin and not Appointment.objects.filter(
+            doctor_id=role.staff_id_for('doctor'), patient_id=patient_id
+        ).exists():
+            raise PermissionDenied("You can only view the timeline of your own patients.")
+
+        entries = timeline.patient_timeline(patient_id, since, until, max(limit, 1))
+        if not entries and not Patient.objects.filter(pk=patient_id).exists():
+            return Response({'error': 'Patient not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'patient': patient_id, 'entries': entries})
+
+    @action(detail=True, methods=['get'], permission_classes=[IsDoctor | IsAdmin], url_path='analyte-trend')
+    def analyte_trend(self, request, pk=None):
+        """
+        ?analyte=Hemoglobin: the patient's readings of that analyte, oldest first,
+        as columns (measured_at, value, unit, ...). Optional ?since= / ?until= and ?limit=.
+        """
+        analyte = request.query_params.get('analyte', '').strip()
+        if not analyte:
+            raise ValidationError("analyte is required.")
+        try:
+            patient_id = int(pk)
+            limit = min(int(request.query_params.get('limit', analytes.TREND_LIMIT)), analytes.TREND_LIMIT)
+        except ValueError:
+            raise ValidationError("patient id and limit must be integers.")
+        since = _parse_moment(request.query_params.get('since'), 'since')
+        until = _parse_moment(request.query_params.get('until'), 'until')
+
+        role = get_request_role(request)
+        if not role.is_admin and not Appointment.objects.filter(
+            doctor_id=role.staff_id_for('doctor'), patient_id=patient_id
+        ).exists():
+            raise PermissionDenied("You can only view the results of your own patients.")
+
+        series = analytes.trend(patient_id, analyte, since, until, max(limit, 1))
+        if not series['value'] and not Patient.objects.filter(pk=patient_id).exists():
+            return Response({'error': 'Patient not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(series)
+
+
+def _parse_moment(value, name):
+    """Parse a ?since=/?until= value given either as a date or a datetime."""
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError
+            moment = datetime.combine(day, datetime.min.time())
+    except ValueError:
+        raise ValidationError(f"{name} must be a date (YYYY-MM-DD) or an ISO datetime.")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class AppointmentViewSet(KeysetPaginationMixin, SparseFieldsetMixin, AutoRelatedMixin, viewsets.ModelViewSet):
     permission_classes = [IsDoctor | IsReceptionist | IsAdmin]
     serializer_class = AppointmentSerializer
     queryset = Appointment.objects.all().order_by('-start_time')
     pagination_class = LimitTenPagination
+    cursor_ordering = ('-start_time', '-id')
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_class = AppointmentFilter
     search_fields = ['doctor__name', 'patient__name']
 
     def get_queryset(self):
-        user = self.request.user
+        role = get_request_role(self.request)
         queryset = super().get_queryset()
 
-        queryset.filter(status='Pending', start_time__lt=now()).update(status='Cancelled')
+        # Expired pending appointments are cancelled by the cancel_expired_appointments command.
 
-        if user.is_superuser or user.groups.filter(name="Admin").exists():
+        if role.is_admin:
             return queryset
 
         # Check if the user is a doctor
-        if Doctor.objects.filter(user=user).exists():
-            doctor = Doctor.objects.get(user=user)
-            queryset =  queryset.filter(doctor__staff_id=doctor.staff_id)
+        if role.has_profile('doctor'):
+            queryset =  queryset.filter(doctor_id=role.staff_id_for('doctor'))
             queryset = queryset.filter(consultationbill__paid=True)
             return queryset
 
         # Check if the user is a receptionist
-        if Receptionist.objects.filter(user=user).exists():
+        if role.has_profile('receptionist'):
             return queryset
 
         # If the user is neither, return an empty queryset (or raise a permission error)
@@ -185,14 +327,8 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         appointment = serializer.save()
-        doctor = appointment.doctor
-
-        try:
-            department = doctor.department_id
-            price = department.fee if department and department.fee else 500.00
-        except ObjectDoesNotExist:
-            # Fallback if somehow doctor has no department
-            price = 500.00
+        # Department fee (500.00 if unset), from the cached doctor directory
+        price = doctor_directory.consultation_fee(appointment.doctor_id)
 
         # Create consultation bill
         ConsultationBill.objects.create(
@@ -201,10 +337,29 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         )
 
 
-class BillViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+@permission_classes([IsReceptionist | IsDoctor | IsAdmin])
+def doctor_availability(request, staff_id):
+    """Free/booked slots of a doctor for ?date=YYYY-MM-DD (defaults to today)."""
+    date_param = request.query_params.get('date')
+    try:
+        day = parse_date(date_param) if date_param else timezone.localdate()
+    except ValueError:
+        day = None
+    if day is None:
+        return Response({'error': 'Invalid date, expected YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not Doctor.objects.filter(staff_id=staff_id).exists():
+        return Response({'error': 'Doctor not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response(availability.day_schedule(staff_id, day))
+
+
+class BillViewSet(KeysetPaginationMixin, SparseFieldsetMixin, AutoRelatedMixin, viewsets.ModelViewSet):
     permission_classes = [IsDoctor | IsReceptionist | IsAdmin]
     queryset = Bill.objects.all().order_by('-bill_date')
     pagination_class = LimitTenPagination
+    cursor_ordering = ('-bill_date', '-id')
     filter_backends = [DjangoFilterBackend]
     filterset_class = BillFilter
 
@@ -214,13 +369,13 @@ class BillViewSet(viewsets.ModelViewSet):
         return BillSerializer
 
 
-class ConsultationBillViewSet(viewsets.ModelViewSet):
+class ConsultationBillViewSet(SparseFieldsetMixin, AutoRelatedMixin, viewsets.ModelViewSet):
     permission_classes = [IsReceptionist | IsAdmin]
 
     queryset = ConsultationBill.objects.all().order_by("-id")
     serializer_class = ConsultationBillSerializer
 
-class DoctorListViewSet(viewsets.ModelViewSet):
+class DoctorListViewSet(SparseFieldsetMixin, AutoRelatedMixin, viewsets.ModelViewSet):
     permission_classes = [IsReceptionist | IsAdmin]
 
     queryset = Doctor.objects.all()
@@ -230,7 +385,14 @@ class DoctorListViewSet(viewsets.ModelViewSet):
         # Fetch doctors with only the required fields
         return Doctor.objects.all()
 
-class DoctorAdminViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        # The plain list is served from the doctor directory; filtered,
+        # trimmed or streamed requests go through the queryset as usual.
+        if request.query_params.keys() - {'format'}:
+            return super().list(request, *args, **kwargs)
+        return Response(doctor_directory.doctor_rows())
+
+class DoctorAdminViewSet(SparseFieldsetMixin, AutoRelatedMixin, viewsets.ModelViewSet):
     permission_classes = [IsAdmin]
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
@@ -243,32 +405,31 @@ def receptionist_profile(request):
     if not request.user.is_authenticated:
         return JsonResponse({"error": "User not authenticated"}, status=401)
 
-    try:
-        receptionist = Receptionist.objects.get(user=request.user)
-        serializer = ReceptionistViewSerializer(receptionist)
-        return JsonResponse(serializer.data, status=200)
-    except Receptionist.DoesNotExist:
+    receptionist = get_request_role(request).profile('receptionist')
+    if receptionist is None:
         raise PermissionDenied("You are not authorized to access this profile")
+    serializer = ReceptionistViewSerializer(receptionist)
+    return JsonResponse(serializer.data, status=200)
 
 @api_view(['GET'])
 @permission_classes([IsDoctor | IsAdmin])
 def doctor_profile(request):
     if not request.user.is_authenticated:
         return JsonResponse({"error": "User not authenticated"}, status=401)
-    try:
-        doctor = Doctor.objects.get(user=request.user)
-        serializer = DoctorViewSerializer(doctor)
-        return JsonResponse(serializer.data, status=200)
-    except Doctor.DoesNotExist:
+    doctor = get_request_role(request).profile('doctor')
+    if doctor is None:
         raise PermissionDenied("You are not authorized to access this profile")
+    serializer = DoctorViewSerializer(doctor)
+    return JsonResponse(serializer.data, status=200)
 
-class DepartmentReadOnlyViewSet(viewsets.ReadOnlyModelViewSet):
+class DepartmentReadOnlyViewSet(CatalogCacheMixin, SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsReceptionist | IsAdmin]
 
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
+    catalog = 'department'
 
-class DepartmentAdminViewSet(viewsets.ModelViewSet):
+class DepartmentAdminViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAdmin]  # Only admins can access
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
@@ -306,35 +467,23 @@ def register_doctor(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_user_role(request):
-    user = request.user
-    groups = user.groups.all().values_list('name', flat=True)
-
-    if user.is_superuser or 'Admin' in groups:
-        return JsonResponse({'role': 'admin'}, status=200)
-    elif 'Receptionist' in groups:
-        return JsonResponse({'role': 'receptionist'}, status=200)
-    elif 'Doctor' in groups:
-        return JsonResponse({'role': 'doctor'}, status=200)
-    elif 'Pharmacist' in groups:
-        return JsonResponse({'role': 'pharmacist'}, status=200)
-    elif 'LabTechnician' in groups:
-        return JsonResponse({'role': 'labtechnician'}, status=200)
-    else:
-        return JsonResponse({'role': 'unknown'}, status=200)
+    return JsonResponse({'role': get_request_role(request).role}, status=200)
 
 
-class MedicineViewSet(viewsets.ModelViewSet):
+class MedicineViewSet(CatalogCacheMixin, StreamingListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
 
     queryset = Medicine.objects.all()
     serializer_class = MedicineSerializer
+    catalog = 'medicine'
 
-class LabTestViewSet(viewsets.ModelViewSet):
+class LabTestViewSet(CatalogCacheMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     permission_classes = [IsLabTechnician | IsAdmin | IsDoctor]
 
     queryset = LabTest.objects.all()
     serializer_class = LabTestSerializer
+    catalog = 'labtest'
 
-class ReceptionistViewSet(viewsets.ModelViewSet):
+class ReceptionistViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     permission_classes = [IsReceptionist | IsAdmin]
     queryset = Receptionist.objects.all()
     serializer_class = ReceptionistViewSerializer
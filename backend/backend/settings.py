@@ -65,12 +65,17 @@ CORS_ALLOW_ALL_ORIGINS = True  # Allow all origins (for development)
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.RoleClaimsJWTAuthentication',
 
     ),
     'DEFAULT_PERMISSION_CLASSES': (
             'rest_framework.permissions.IsAuthenticated',
         ),
+    # orjson-backed when installed, plain JSONRenderer otherwise
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.utils.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 
@@ -80,6 +85,9 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),  # Longer refresh lifespan
     "ROTATE_REFRESH_TOKENS": True,  # Issue a new refresh token when used
     'AUTH_HEADER_TYPES': ("Bearer",),
+    # Tokens carry role/staff_id claims (see api.authentication)
+    "TOKEN_OBTAIN_SERIALIZER": "api.authentication.RoleTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "api.authentication.RoleTokenRefreshSerializer",
 }
 
 DJOSER = {
@@ -127,6 +135,16 @@ DATABASES = {
     }
 }
 
+# Cached catalog responses (api.utils.catalog_cache) live here, keyed by the catalog
+# versions kept in the database, so a per-process cache is never stale, only colder;
+# a shared backend (Redis, Memcached) lets workers reuse each other's bodies.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cms-default',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -169,4 +187,10 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Lab report downloads (api.utils.downloads). None streams the file from Django;
+# 'x-sendfile' (Apache mod_xsendfile) or 'x-accel-redirect' (nginx, with
+# SENDFILE_URL_PREFIX an internal location aliased to MEDIA_ROOT) hands it to the web server.
+SENDFILE_BACKEND = None
+SENDFILE_URL_PREFIX = '/protected/'
+
 # HOSPITAL_NAME = "ABC HOSPITAL"
@@ -0,0 +1,176 @@
+import math
+import re
+
+from django.db.models import F, Q
+
+from .models import LabAnalyteResult, LabReportTestResult
+
+TREND_LIMIT = 1000
+COHORT_LIMIT = 500
+MAX_COHORT_LIMIT = 5000
+
+RANGE_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*(?:-|–|to)\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def analyte_key(name):
+    return ' '.join(str(name).split()).casefold()[:100]
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        try:
+            number = float(str(value).strip())
+        except ValueError:
+            return None
+    return number if math.isfinite(number) else None
+
+
+def _reference(reading):
+    """(low, high) from a reading's low/high (or min/max) keys or a "12-16" reference_range."""
+    low = _number(reading.get('low', reading.get('min')))
+    high = _number(reading.get('high', reading.get('max')))
+    text = reading.get('reference_range', reading.get('range'))
+    if isinstance(text, str) and (match := RANGE_RE.match(text)):
+        low = float(match.group(1)) if low is None else low
+        high = float(match.group(2)) if high is None else high
+    return low, high
+
+
+def parse_result_data(result_data):
+    """
+    The analytes in a result_data, as dicts of LabAnalyteResult fields. Readings
+    are {"Hemoglobin": {"value": 14.2, "unit": "g/dL"}} or plain {"Hemoglobin": 14.2};
+    anything else has no analytes.
+    """
+    if not isinstance(result_data, dict):
+        return []
+    parsed = []
+    for name, reading in result_data.items():
+        if not str(name).strip():
+            continue
+        reading = reading if isinstance(reading, dict) else {'value': reading}
+        raw = reading.get('value')
+        if raw is None or isinstance(raw, (dict, list)):
+            continue
+        low, high = _reference(reading)
+        value = _number(raw)
+        parsed.append({
+            'analyte': analyte_key(name),
+            'name': str(name).strip()[:100],
+            'value': value,
+            'value_text': '' if value is not None else str(raw)[:100],
+            'unit': str(reading.get('unit') or '')[:30],
+            'reference_low': low,
+            'reference_high': high,
+        })
+    return parsed
+
+
+def analyte_rows(result, patient_id, measured_at):
+    return [
+        LabAnalyteResult(result_id=result.pk, lab_report_id=result.lab_report_id, patient_id=patient_id,
+                         measured_at=measured_at, **fields)
+        for fields in parse_result_data(result.result_data)
+    ]
+
+
+def record_result(result, replace=True):
+    """(Re)write the analyte rows of one LabReportTestResult."""
+    lab_report = result.lab_report
+    if replace:
+        LabAnalyteResult.objects.filter(result_id=result.pk).delete()
+    LabAnalyteResult.objects.bulk_create(
+        analyte_rows(result, lab_report.prescription.patient_id, lab_report.created_at)
+    )
+
+
+def result_queryset():
+    """Results loaded with just what record_results() reads."""
+    return LabReportTestResult.objects.select_related('lab_report__prescription').only(
+        'id', 'result_data', 'lab_report__id', 'lab_report__created_at', 'lab_report__prescription__patient_id'
+    )
+
+
+def record_results(results):
+    """
+    (Re)write the analyte rows of many results (from result_queryset()) with
+    one delete and one insert. Returns the number of rows written.
+    """
+    results = list(results)
+    LabAnalyteResult.objects.filter(result_id__in=[result.pk for result in results]).delete()
+    rows = [
+        row for result in results
+        for row in analyte_rows(result, result.lab_report.prescription.patient_id, result.lab_report.created_at)
+    ]
+    LabAnalyteResult.objects.bulk_create(rows)
+    return len(rows)
+
+
+def trend(patient_id, analyte, since=None, until=None, limit=TREND_LIMIT):
+    """
+    A patient's readings of one analyte, oldest first, as parallel columns
+    (one list per field) read off the (patient, analyte, measured_at) index.
+    """
+    readings = LabAnalyteResult.objects.filter(patient_id=patient_id, analyte=analyte_key(analyte))
+    if since is not None:
+        readings = readings.filter(measured_at__gte=since)
+    if until is not None:
+        readings = readings.filter(measured_at__lt=until)
+    # The newest `limit`, returned in time order.
+    rows = list(readings.order_by('-measured_at', '-id').values_list(
+        'measured_at', 'value', 'value_text', 'unit', 'reference_low', 'reference_high', 'lab_report_id'
+    )[:limit])[::-1]
+    columns = list(zip(*rows)) or [()] * 7
+    return {
+        'patient': patient_id,
+        'analyte': analyte_key(analyte),
+        'measured_at': list(columns[0]),
+        'value': list(columns[1]),
+        'value_text': list(columns[2]),
+        'unit': list(columns[3]),
+        'reference_low': list(columns[4]),
+        'reference_high': list(columns[5]),
+        'report_id': list(columns[6]),
+    }
+
+
+def out_of_range(analyte, low=None, high=None, since=None, until=None, limit=COHORT_LIMIT):
+    """
+    Numeric readings of an analyte outside [low, high] across all patients,
+    newest first. Without low/high each reading is judged against the
+    reference range recorded with it.
+    """
+    readings = LabAnalyteResult.objects.filter(analyte=analyte_key(analyte), value__isnull=False)
+    if since is not None:
+        readings = readings.filter(measured_at__gte=since)
+    if until is not None:
+        readings = readings.filter(measured_at__lt=until)
+
+    if low is not None or high is not None:
+        outside = Q()
+        if low is not None:
+            outside |= Q(value__lt=low)
+        if high is not None:
+            outside |= Q(value__gt=high)
+    else:
+        outside = Q(reference_low__isnull=False, value__lt=F('reference_low')) | \
+            Q(reference_high__isnull=False, value__gt=F('reference_high'))
+
+    rows = readings.filter(outside).order_by('-measured_at', '-id').values_list(
+        'patient_id', 'measured_at', 'value', 'unit', 'reference_low', 'reference_high', 'lab_report_id'
+    )[:limit]
+    columns = list(zip(*rows)) or [()] * 7
+    return {
+        'analyte': analyte_key(analyte),
+        'patient_id': list(columns[0]),
+        'measured_at': list(columns[1]),
+        'value': list(columns[2]),
+        'unit': list(columns[3]),
+        'reference_low': list(columns[4]),
+        'reference_high': list(columns[5]),
+        'report_id': list(columns[6]),
+    }
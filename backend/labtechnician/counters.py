@@ -0,0 +1,71 @@
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import PrescriptionLabTest
+
+from .models import LabCounter
+
+ALL_TIME = date(1970, 1, 1)
+
+PENDING = 'pending'                        # gauge: lab tests waiting for a result
+COMPLETED = 'completed'                    # per day: lab tests that got a result
+REPORTS = 'reports'                        # per day: lab reports generated
+TURNAROUND_SECONDS = 'turnaround_seconds'  # per day: prescribed -> completed, summed over COMPLETED
+
+
+def counter_key(metric, day=ALL_TIME):
+    return f'{metric}:{day.isoformat()}'
+
+
+def _initial_value(metric, delta):
+    if metric == PENDING:
+        # First use of the gauge: count what is there, this change included.
+        return PrescriptionLabTest.objects.filter(status='Pending').count()
+    return delta
+
+
+def bump(metric, delta, day=ALL_TIME):
+    """Add delta to a counter inside the caller's transaction."""
+    if not delta:
+        return
+    key = counter_key(metric, day)
+    if LabCounter.objects.filter(key=key).update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            LabCounter.objects.create(key=key, metric=metric, day=day, value=_initial_value(metric, delta))
+    except IntegrityError:
+        # Created concurrently
+        LabCounter.objects.filter(key=key).update(value=F('value') + delta)
+
+
+def record_completion(prescribed_at, completed_at=None):
+    completed_at = completed_at or timezone.now()
+    day = timezone.localdate(completed_at)
+    bump(COMPLETED, 1, day)
+    bump(TURNAROUND_SECONDS, max(int((completed_at - prescribed_at).total_seconds()), 0), day)
+
+
+def dashboard(day=None):
+    """Today's dashboard numbers, in one primary-key read."""
+    day = day or timezone.localdate()
+    keys = {
+        counter_key(PENDING): PENDING,
+        counter_key(COMPLETED, day): COMPLETED,
+        counter_key(REPORTS, day): REPORTS,
+        counter_key(TURNAROUND_SECONDS, day): TURNAROUND_SECONDS,
+    }
+    values = {keys[key]: value for key, value in LabCounter.objects.filter(key__in=keys).values_list('key', 'value')}
+
+    if PENDING not in values:
+        values[PENDING] = PrescriptionLabTest.objects.filter(status='Pending').count()
+    completed = values.get(COMPLETED, 0)
+    return {
+        'pending_tests': values[PENDING],
+        'completed_today': completed,
+        'reports_today': values.get(REPORTS, 0),
+        'avg_turnaround_seconds': values.get(TURNAROUND_SECONDS, 0) // completed if completed else None,
+    }
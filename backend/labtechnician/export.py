@@ -0,0 +1,104 @@
+import csv
+import tempfile
+import zipfile
+
+from django.utils import timezone
+
+from api.utils.streaming import pk_chunks
+
+from . import reports
+from .storage import report_storage
+
+CHUNK_SIZE = 64 * 1024
+MANIFEST_SPOOL = 1024 * 1024  # manifest bytes kept in memory before spilling to a temp file
+MANIFEST_FIELDS = ['report_id', 'patient_id', 'patient_name', 'prescription_id', 'created_at', 'file', 'error']
+
+
+class _Sink:
+    """Write-only file for ZipFile that hands out what has been written since the last take()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_name(lab_report):
+    patient = lab_report.prescription.patient
+    day = timezone.localtime(lab_report.created_at).date().isoformat()
+    return f'patient-{patient.id}/LR-{lab_report.id}-{day}.pdf'
+
+
+def stream_reports_zip(queryset, chunk_size=100):
+    """
+    A ZIP of the reports' PDFs, yielded piece by piece as it is written. Reports
+    are read `chunk_size` at a time in pk order (one keyset query per chunk, see
+    pk_chunks) and files are copied in CHUNK_SIZE blocks, so only one chunk of
+    reports and one block of a file are in memory at once. The manifest.csv
+    written at the end lists every report; its rows are spooled to disk past
+    MANIFEST_SPOOL bytes. Reports without a PDF yet (queued or failed) are
+    claimed and rendered on the way through reports.render_one(); one a worker
+    is rendering at that moment is listed in the manifest instead.
+    """
+    return (data for data in _zip_pieces(queryset, chunk_size) if data)
+
+
+def _manifest_row(lab_report):
+    patient = lab_report.prescription.patient
+    return {
+        'report_id': lab_report.id,
+        'patient_id': patient.id,
+        'patient_name': f"{patient.first_name} {patient.last_name}",
+        'prescription_id': lab_report.prescription_id,
+        'created_at': lab_report.created_at.isoformat(),
+    }
+
+
+def _zip_pieces(queryset, chunk_size):
+    sink = _Sink()
+    with tempfile.SpooledTemporaryFile(max_size=MANIFEST_SPOOL, mode='w+', newline='') as manifest:
+        writer = csv.DictWriter(manifest, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+
+        # An unseekable sink makes ZipFile stream entries with data descriptors.
+        with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+            for chunk in pk_chunks(queryset, chunk_size):
+                for lab_report in chunk:
+                    row = _manifest_row(lab_report)
+                    try:
+                        name = reports.stored_pdf(lab_report) or reports.render_one(lab_report.pk)
+                    except Exception as exc:
+                        writer.writerow({**row, 'error': f'PDF could not be rendered: {exc}'})
+                        continue
+                    if name is None:
+                        writer.writerow({**row, 'error': 'PDF is being rendered by the worker; export again shortly'})
+                        continue
+                    path = report_storage.local_path(name)
+                    if path is None:
+                        writer.writerow({**row, 'error': 'PDF file missing'})
+                        continue
+
+                    entry_name = archive_name(lab_report)
+                    with open(path, 'rb') as source, archive.open(entry_name, mode='w', force_zip64=True) as entry:
+                        while block := source.read(CHUNK_SIZE):
+                            entry.write(block)
+                            yield sink.take()
+                    writer.writerow({**row, 'file': entry_name})
+                    yield sink.take()
+
+            manifest.seek(0)
+            with archive.open('manifest.csv', mode='w', force_zip64=True) as entry:
+                while block := manifest.read(CHUNK_SIZE):
+                    entry.write(block.encode())
+                    yield sink.take()
+        yield sink.take()
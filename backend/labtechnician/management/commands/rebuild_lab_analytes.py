@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.utils.streaming import pk_chunks
+from labtechnician import analytes
+from labtechnician.models import LabReportTestResult
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the analyte table from the result_data of every lab result. Run once after deploying "
+            "it to backfill older reports, or whenever it is suspected to have drifted. Results are "
+            "rewritten a chunk at a time, each chunk in its own short transaction, so readers keep "
+            "seeing every other result's analytes while it runs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Results rewritten per transaction.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        written = results = 0
+        for chunk in pk_chunks(LabReportTestResult.objects.only('pk'), chunk_size):
+            ids = [result.pk for result in chunk]
+            with transaction.atomic():
+                # Locked so a result saved meanwhile can't have its fresh analytes overwritten with stale ones.
+                locked = list(LabReportTestResult.objects.select_for_update().filter(pk__in=ids)
+                              .order_by('pk').values_list('pk', flat=True))
+                written += analytes.record_results(analytes.result_queryset().filter(pk__in=locked))
+            results += len(ids)
+        self.stdout.write(f"Wrote {written} analyte reading(s) for {results} result(s).")
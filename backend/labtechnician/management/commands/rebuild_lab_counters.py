@@ -0,0 +1,41 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import PrescriptionLabTest
+from labtechnician import counters
+from labtechnician.models import LabCounter, LabReport, LabReportTestResult
+
+
+class Command(BaseCommand):
+    help = ("Recompute the lab dashboard counters from the lab tests and reports. Completion times are taken "
+            "from the report that carried each result.")
+
+    def handle(self, *args, **options):
+        values = Counter()
+        values[(counters.PENDING, counters.ALL_TIME)] = PrescriptionLabTest.objects.filter(status='Pending').count()
+
+        for created_at in LabReport.objects.values_list('created_at', flat=True).iterator():
+            values[(counters.REPORTS, timezone.localdate(created_at))] += 1
+
+        results = LabReportTestResult.objects.filter(prescription_lab_test__status='Completed').values_list(
+            'prescription_lab_test_id', 'prescription_lab_test__created_at', 'lab_report__created_at'
+        ).order_by('lab_report__created_at')
+        seen = set()
+        for test_id, prescribed_at, completed_at in results.iterator():
+            if test_id in seen:
+                continue  # a test reported twice counts once, at its first report
+            seen.add(test_id)
+            day = timezone.localdate(completed_at)
+            values[(counters.COMPLETED, day)] += 1
+            values[(counters.TURNAROUND_SECONDS, day)] += max(int((completed_at - prescribed_at).total_seconds()), 0)
+
+        with transaction.atomic():
+            LabCounter.objects.all().delete()
+            LabCounter.objects.bulk_create(
+                LabCounter(key=counters.counter_key(metric, day), metric=metric, day=day, value=value)
+                for (metric, day), value in values.items()
+            )
+        self.stdout.write(f"Rebuilt {len(values)} lab counter(s).")
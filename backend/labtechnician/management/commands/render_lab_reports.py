@@ -0,0 +1,40 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from labtechnician import reports
+
+
+class Command(BaseCommand):
+    help = ("Render queued lab report PDFs in a process pool. Keeps polling the queue every --interval "
+            "seconds; with --once it renders what is queued and exits. Several workers may run at once.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Rendering processes (0 renders in this process).")
+        parser.add_argument('--batch-size', type=int, default=20, help="Reports claimed at a time.")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between polls of an empty queue.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="Queue reports that failed MAX_ATTEMPTS times again before starting.")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            self.stdout.write(f"Re-queued {reports.requeue_failed()} failed report(s).")
+
+        try:
+            while True:
+                # A fresh pool whenever the last one was discarded after a process died
+                pool = reports.get_pool(options['workers']) if options['workers'] > 0 else None
+                rendered, failed = reports.render_batch(options['batch_size'], pool)
+                if rendered or failed:
+                    self.stdout.write(f"Rendered {rendered} report(s), {failed} failed.")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            reports.shutdown_pool()
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labtechnician', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabCounter',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('metric', models.CharField(max_length=30)),
+                ('day', models.DateField()),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('metric', 'day')},
+            },
+        ),
+    ]
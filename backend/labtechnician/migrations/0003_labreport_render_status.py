@@ -0,0 +1,46 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_rendered_reports_ready(apps, schema_editor):
+    # Reports from before the queue were rendered in the request; the rest get queued.
+    LabReport = apps.get_model('labtechnician', 'LabReport')
+    LabReport.objects.exclude(report_pdf__isnull=True).exclude(report_pdf='').update(status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_staffidsequence'),
+        ('labtechnician', '0002_labcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labreport',
+            name='render_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='labreport',
+            name='render_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='labreport',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('rendering', 'Rendering'), ('ready', 'Ready'), ('failed', 'Failed')], default='queued', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='labreport',
+            name='status_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='labreport',
+            index=models.Index(fields=['status', 'status_changed_at'], name='labreport_status_idx'),
+        ),
+        migrations.RunPython(mark_rendered_reports_ready, migrations.RunPython.noop),
+    ]
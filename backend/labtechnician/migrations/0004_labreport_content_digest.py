@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labtechnician', '0003_labreport_render_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labreport',
+            name='content_digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_staffidsequence'),
+        ('labtechnician', '0004_labreport_content_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabAnalyteResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('analyte', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=100)),
+                ('value', models.FloatField(blank=True, null=True)),
+                ('value_text', models.CharField(blank=True, max_length=100)),
+                ('unit', models.CharField(blank=True, max_length=30)),
+                ('reference_low', models.FloatField(blank=True, null=True)),
+                ('reference_high', models.FloatField(blank=True, null=True)),
+                ('measured_at', models.DateTimeField()),
+                ('lab_report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytes', to='labtechnician.labreport')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lab_analytes', to='api.patient')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytes', to='labtechnician.labreporttestresult')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'analyte', 'measured_at'], name='analyte_patient_trend_idx'), models.Index(fields=['analyte', 'measured_at'], name='analyte_cohort_idx'), models.Index(fields=['analyte', 'value'], name='analyte_value_idx')],
+            },
+        ),
+    ]
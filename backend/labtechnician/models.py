@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 from api.models import *
 
 # Create your models here.
@@ -50,15 +51,97 @@ class LabReport(models.Model):
     generated_by = models.ForeignKey(LabTechnician, on_delete=models.SET_NULL, null=True)
     report_pdf = models.FileField(upload_to='lab_reports/', null=True, blank=True)
 
+    # The PDF is rendered off the request by `manage.py render_lab_reports` (labtechnician.reports).
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('rendering', 'Rendering'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    status_changed_at = models.DateTimeField(default=timezone.now)
+    render_attempts = models.PositiveSmallIntegerField(default=0)
+    render_error = models.TextField(blank=True)
+    # Digest of the rendered inputs; report_pdf is stored under it (labtechnician.storage)
+    content_digest = models.CharField(max_length=64, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'status_changed_at'], name='labreport_status_idx'),
+        ]
+
     def __str__(self):
         return f"Lab Report for {self.prescription.patient} (ID: {self.id})"
 
 
 
+class LabReportTestResultQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # post_save keeps LabAnalyteResult in step with result_data; a queryset
+        # update sends no signal, so rewrite the analytes of the rows it touched.
+        if 'result_data' not in kwargs:
+            return super().update(**kwargs)
+        from . import analytes
+
+        with transaction.atomic(using=self.db):
+            ids = list(self.values_list('pk', flat=True))
+            updated = super().update(**kwargs)
+            analytes.record_results(analytes.result_queryset().filter(pk__in=ids))
+        return updated
+
+
 class LabReportTestResult(models.Model):
     lab_report = models.ForeignKey(LabReport, on_delete=models.CASCADE)  # Parent report
     prescription_lab_test = models.ForeignKey(PrescriptionLabTest, on_delete=models.CASCADE)  # Specific test from prescription
     result_data = models.JSONField()  # Format: {"Hemoglobin": {"value": 14.2, "unit": "g/dL"}}
 
+    objects = LabReportTestResultQuerySet.as_manager()
+
     def __str__(self):
         return f"Result for {self.prescription_lab_test.lab_test.test_name} in Report #{self.lab_report.id}"
+
+
+class LabAnalyteResult(models.Model):
+    """
+    One analyte of a LabReportTestResult's result_data, typed and indexed for
+    trend and cohort queries. Kept in step with result_data by labtechnician.analytes.
+    """
+    result = models.ForeignKey(LabReportTestResult, on_delete=models.CASCADE, related_name='analytes')
+    lab_report = models.ForeignKey(LabReport, on_delete=models.CASCADE, related_name='analytes')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='lab_analytes')
+    analyte = models.CharField(max_length=100)  # normalized key: case-folded, single-spaced
+    name = models.CharField(max_length=100)  # as written in result_data
+    value = models.FloatField(null=True, blank=True)  # None when the result isn't a number
+    value_text = models.CharField(max_length=100, blank=True)
+    unit = models.CharField(max_length=30, blank=True)
+    reference_low = models.FloatField(null=True, blank=True)
+    reference_high = models.FloatField(null=True, blank=True)
+    measured_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'analyte', 'measured_at'], name='analyte_patient_trend_idx'),
+            models.Index(fields=['analyte', 'measured_at'], name='analyte_cohort_idx'),
+            models.Index(fields=['analyte', 'value'], name='analyte_value_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} = {self.value if self.value is not None else self.value_text} {self.unit}".rstrip()
+
+
+class LabCounter(models.Model):
+    """
+    A running count behind the lab technician dashboard, keyed "<metric>:<day>".
+    Per-day metrics have one row per day; gauges such as "pending" live on the
+    ALL_TIME day. Maintained by labtechnician.counters.
+    """
+    key = models.CharField(max_length=40, primary_key=True)
+    metric = models.CharField(max_length=30)
+    day = models.DateField()
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('metric', 'day')
+
+    def __str__(self):
+        return f"{self.metric} on {self.day}: {self.value}"
@@ -1,5 +1,6 @@
 from rest_framework import permissions
 from django.contrib.auth.models import Group
+from api.utils.roles import get_request_role
 
 class IsLabTechnician(permissions.BasePermission):
     """Allow only users in the 'LabTechnician' group."""
@@ -8,7 +9,7 @@ class IsLabTechnician(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        return request.user.groups.filter(name='LabTechnician').exists()
+        return get_request_role(request).in_group('LabTechnician')
 
 
 class IsDoctor(permissions.BasePermission):
@@ -18,7 +19,7 @@ class IsDoctor(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        return request.user.groups.filter(name='Doctors').exists()
+        return get_request_role(request).in_group('Doctors')
 
 
 class IsDoctorOrLabTechnician(permissions.BasePermission):
@@ -28,7 +29,7 @@ class IsDoctorOrLabTechnician(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        return request.user.groups.filter(name__in=['Doctors', 'LabTechnician']).exists()
+        return get_request_role(request).in_group('Doctors', 'LabTechnician')
 
 
 class IsReportRequesterOrLabTechnician(permissions.BasePermission):
@@ -45,12 +46,13 @@ class IsReportRequesterOrLabTechnician(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Lab technicians have full access
-        if request.user.groups.filter(name='LabTechnician').exists():
+        role = get_request_role(request)
+        if role.in_group('LabTechnician'):
             return True
         
         # Doctors can access only their requested reports
-        if request.user.groups.filter(name='Doctors').exists():
-            return obj.requested_by == request.user.doctor.staff_id  # Adjust field as needed
+        if role.in_group('Doctors'):
+            return obj.requested_by == role.staff_id_for('doctor')  # Adjust field as needed
         
         return False
 
@@ -0,0 +1,301 @@
+"""
+Lab report PDFs are rendered off the request: GenerateLabReportView saves the
+report as "queued" and `manage.py render_lab_reports` renders queued reports
+in a process pool. A report moves queued -> rendering -> ready, or back to
+queued on failure until MAX_ATTEMPTS, then failed.
+
+Workers claim reports with a conditional UPDATE on (status, status_changed_at),
+so any number of them can poll the same table without a broker or row locks.
+A report left in "rendering" longer than RENDER_TIMEOUT (its worker died) is
+claimed again.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from reportlab.pdfgen import canvas
+
+from .models import LabReport
+from .storage import content_digest, report_storage
+
+# Bump whenever render_pdf() changes what it draws, so reports rendered by the old layout aren't reused.
+TEMPLATE_VERSION = 1
+MAX_ATTEMPTS = 3
+RENDER_TIMEOUT = timedelta(minutes=5)
+
+
+def report_document(lab_report):
+    """Everything printed on a report, as plain data a worker process can render without the database."""
+    patient = lab_report.prescription.patient
+    doctor = lab_report.prescription.doctor
+    return {
+        'id': lab_report.id,
+        'patient_name': f"{patient.first_name} {patient.last_name}",
+        'date_of_birth': str(patient.date_of_birth),
+        'blood_group': patient.blood_group,
+        'doctor_name': doctor.user.get_full_name(),
+        'doctor_staff_id': doctor.staff_id,
+        'created_at': timezone.localtime(lab_report.created_at).strftime('%Y-%m-%d %H:%M'),
+        'technician_name': lab_report.generated_by.user.get_full_name() if lab_report.generated_by else None,
+        'results': [
+            {
+                'test_name': result.prescription_lab_test.lab_test.test_name,
+                'result_data': str(result.result_data),
+                'reference_range': getattr(result.prescription_lab_test.lab_test, 'reference_range', None),
+            }
+            for result in lab_report.labreporttestresult_set.all()
+        ],
+        'hospital_name': getattr(settings, 'HOSPITAL_NAME', 'Hospital'),
+    }
+
+
+def render_pdf(document):
+    """The PDF bytes for a report_document(). CPU-bound and free of Django, so it runs in pool workers."""
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer)
+
+    # Set font styles
+    p.setFont("Helvetica-Bold", 16)
+    p.drawCentredString(300, 800, "LABORATORY TEST REPORT")
+    p.setFont("Helvetica", 12)
+
+    # Patient Information
+    p.drawString(50, 770, f"Patient Name: {document['patient_name']}")
+    p.drawString(50, 750, f"Date of Birth: {document['date_of_birth']}")
+    p.drawString(50, 730, f"Blood Group: {document['blood_group']}")
+
+    # Doctor Information
+    p.drawString(50, 700, f"Referring Physician: Dr. {document['doctor_name']}")
+    p.drawString(50, 680, f"Doctor ID: {document['doctor_staff_id']}")
+
+    # Report Metadata
+    p.drawString(50, 650, f"Report ID: LR-{document['id']}")
+    p.drawString(50, 630, f"Report Date: {document['created_at']}")
+    if document['technician_name'] is not None:
+        p.drawString(50, 610, f"Lab Technician: {document['technician_name']}")
+
+    # Test Results Header
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(50, 580, "TEST RESULTS")
+    p.setFont("Helvetica", 12)
+    p.line(50, 575, 550, 575)
+
+    # Test Results Table
+    y_position = 550
+    for result in document['results']:
+        p.drawString(50, y_position, f"• {result['test_name']}")
+        p.drawString(300, y_position, f"Result: {result['result_data']}")
+
+        # Add reference range if available
+        if result['reference_range']:
+            p.setFont("Helvetica-Oblique", 10)
+            p.drawString(50, y_position-20, f"Reference Range: {result['reference_range']}")
+            p.setFont("Helvetica", 12)
+            y_position -= 25
+
+        y_position -= 40
+
+        # Add page break if running out of space
+        if y_position < 100:
+            p.showPage()
+            y_position = 800
+            p.setFont("Helvetica", 12)
+
+    # Footer
+    p.setFont("Helvetica-Oblique", 10)
+    p.drawString(50, 50, "This report was generated electronically and requires authorized signature")
+    p.drawString(50, 35, f"© {document['hospital_name']} - All rights reserved")
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def report_queryset():
+    """Reports loaded with everything report_document() reads."""
+    return LabReport.objects.select_related(
+        'prescription__patient', 'prescription__doctor__user', 'generated_by__user'
+    ).prefetch_related('labreporttestresult_set__prescription_lab_test__lab_test')
+
+
+def claim(limit):
+    """
+    Take up to `limit` reports to render: queued ones, and ones whose renderer
+    went quiet. Returns them loaded with everything report_document() reads.
+    """
+    now = timezone.now()
+    candidates = LabReport.objects.filter(
+        Q(status='queued') | Q(status='rendering', status_changed_at__lt=now - RENDER_TIMEOUT)
+    ).order_by('status_changed_at', 'pk').values_list('pk', 'status', 'status_changed_at')[:limit]
+
+    claimed = [pk for pk, seen_status, seen_at in candidates if _take(pk, seen_status, seen_at, now)]
+    return list(report_queryset().filter(pk__in=claimed).order_by('pk'))
+
+
+def _take(pk, seen_status, seen_at, now):
+    # Only one claimer's update can match the state it saw.
+    return LabReport.objects.filter(pk=pk, status=seen_status, status_changed_at=seen_at).update(
+        status='rendering', status_changed_at=now, render_attempts=F('render_attempts') + 1
+    )
+
+
+def claim_one(pk):
+    """
+    Claim a single report that isn't ready, as claim() does, for a caller that
+    can't wait for the worker. Failed reports are claimed too. Returns the
+    report loaded as by claim(), or None when it is ready or a worker has it.
+    """
+    now = timezone.now()
+    seen = LabReport.objects.filter(pk=pk).values_list('status', 'status_changed_at').first()
+    if seen is None:
+        return None
+    seen_status, seen_at = seen
+    if seen_status == 'ready' or (seen_status == 'rendering' and seen_at >= now - RENDER_TIMEOUT):
+        return None
+    if not _take(pk, seen_status, seen_at, now):
+        return None
+    return report_queryset().get(pk=pk)
+
+
+def render_one(pk):
+    """
+    The stored name of a report's PDF, rendering it in this process if it isn't
+    ready. The report is claimed first (claim_one), so this never overlaps a
+    worker; None when a worker is rendering it right now. Raises what rendering
+    raised, after fail() has queued the report again.
+    """
+    lab_report = claim_one(pk)
+    if lab_report is None:
+        return stored_pdf(LabReport.objects.only('status', 'report_pdf', 'content_digest').get(pk=pk))
+    try:
+        document = report_document(lab_report)
+        digest = content_digest(document, TEMPLATE_VERSION)
+        name = report_storage.name_for(digest) if report_storage.has(digest) else \
+            report_storage.store(digest, render_pdf(document))
+    except Exception as exc:
+        fail(lab_report, exc)
+        raise
+    finish(lab_report, digest, name)
+    return name
+
+
+def finish(lab_report, digest, name):
+    LabReport.objects.filter(pk=lab_report.pk, status='rendering').update(
+        status='ready', status_changed_at=timezone.now(), report_pdf=name, content_digest=digest, render_error=''
+    )
+
+
+def fail(lab_report, error):
+    """Queue the report again, or give up on it after MAX_ATTEMPTS."""
+    LabReport.objects.filter(pk=lab_report.pk, status='rendering').update(
+        status='failed' if lab_report.render_attempts >= MAX_ATTEMPTS else 'queued',
+        status_changed_at=timezone.now(), render_error=str(error)[:2000],
+    )
+
+
+# Render pool
+
+_pool = None
+
+
+def get_pool(workers):
+    """The render process pool, started on first use and again after discard_pool()."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool
+
+
+def discard_pool(pool):
+    """Drop a pool (e.g. broken by a dead process) so get_pool() starts a new one."""
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    if _pool is not None:
+        discard_pool(_pool)
+
+
+def _submit(pool, document):
+    try:
+        return pool.submit(render_pdf, document)
+    except BrokenProcessPool as exc:
+        future = Future()
+        future.set_exception(exc)
+        return future
+
+
+def render_batch(limit, pool=None):
+    """
+    Claim and render one batch; returns (rendered, failed). Renders in `pool`
+    when given, else inline. A report whose inputs were rendered before (a retry,
+    or a re-queue with nothing changed) reuses the stored PDF. If a pool process
+    dies, the pool is discarded and the reports it was rendering are failed (so
+    retried); the next get_pool() starts a fresh one.
+    """
+    reports = claim(limit)
+    if not reports:
+        return 0, 0
+
+    digests, rendered, failed = {}, 0, 0
+    jobs = {}  # digest -> (document, future)
+    for report in reports:
+        try:
+            document = report_document(report)
+        except Exception as exc:
+            fail(report, exc)
+            failed += 1
+            continue
+        digest = digests[report.pk] = content_digest(document, TEMPLATE_VERSION)
+        if digest not in jobs and not report_storage.has(digest):
+            jobs[digest] = (document, _submit(pool, document) if pool else None)
+
+    names = {}
+    for report in reports:
+        digest = digests.get(report.pk)
+        if digest is None:
+            continue
+        try:
+            if digest not in names:
+                if digest in jobs:
+                    document, future = jobs[digest]
+                    try:
+                        pdf = future.result() if future else render_pdf(document)
+                    except BrokenProcessPool:
+                        discard_pool(pool)
+                        raise
+                    names[digest] = report_storage.store(digest, pdf)
+                else:
+                    names[digest] = report_storage.name_for(digest)
+            finish(report, digest, names[digest])
+            rendered += 1
+        except Exception as exc:
+            fail(report, exc)
+            failed += 1
+    return rendered, failed
+
+
+def stored_pdf(lab_report):
+    """
+    The stored name of a ready report's PDF, or None while the worker hasn't
+    rendered it. Never renders: only the worker moves a report to ready.
+    """
+    if lab_report.status != 'ready':
+        return None
+    if lab_report.content_digest:
+        return report_storage.name_for(lab_report.content_digest)
+    return lab_report.report_pdf.name or None  # rendered before content addressing
+
+
+def requeue_failed():
+    """Give every failed report a fresh set of attempts; returns how many."""
+    return LabReport.objects.filter(status='failed').update(
+        status='queued', status_changed_at=timezone.now(), render_attempts=0
+    )
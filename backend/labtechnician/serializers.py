@@ -29,9 +29,9 @@ class LabReportSerializer(serializers.ModelSerializer):
         model = LabReport
         fields = [
             'id', 'prescription', 'remarks', 'requested_by', 
-            'generated_by', 'report_pdf', 'test_results'
+            'generated_by', 'report_pdf', 'status', 'status_changed_at', 'test_results'
         ]
-        read_only_fields = ['id', 'requested_by',  'report_pdf']
+        read_only_fields = ['id', 'requested_by',  'report_pdf', 'status', 'status_changed_at']
 
     def create(self, validated_data):
         # Extract test_results data
@@ -75,7 +75,8 @@ class PrescriptionLabTestSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PrescriptionLabTest
-        fields = ['id','patient', 'doctor', 'test_name', 'prescribed_date', 'status']
+        fields = ['id','patient', 'doctor', 'test_name', 'prescribed_date', 'status', 'claimed_by', 'lease_expires_at']
+        read_only_fields = ['claimed_by', 'lease_expires_at']
 
     def get_patient(self, obj):
         return f"{obj.prescription.patient.first_name} {obj.prescription.patient.last_name}"
@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api.models import PrescriptionLabTest
+
+from . import analytes, counters
+from .models import LabReport, LabReportTestResult
+
+
+@receiver(post_init, sender=PrescriptionLabTest)
+def remember_lab_test_status(sender, instance, **kwargs):
+    # None for new rows and when status was deferred (.only()); not read to avoid a query per row.
+    instance._counted_status = instance.__dict__.get('status') if instance.pk else None
+
+
+@receiver(post_save, sender=PrescriptionLabTest)
+def count_lab_test_status(sender, instance, created, **kwargs):
+    old = None if created else instance._counted_status
+    new = instance.status
+    instance._counted_status = new
+    if old == new or (old is None and not created):
+        return
+
+    counters.bump(counters.PENDING, (new == 'Pending') - (old == 'Pending'))
+    if new == 'Completed':
+        counters.record_completion(instance.created_at)
+
+
+@receiver(post_delete, sender=PrescriptionLabTest)
+def uncount_lab_test(sender, instance, **kwargs):
+    if instance.__dict__.get('status') == 'Pending':
+        counters.bump(counters.PENDING, -1)
+
+
+@receiver(post_save, sender=LabReport)
+def count_lab_report(sender, instance, created, **kwargs):
+    if created:
+        counters.bump(counters.REPORTS, 1, timezone.localdate(instance.created_at))
+
+
+@receiver(post_save, sender=LabReportTestResult)
+def record_lab_analytes(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        analytes.record_result(instance, replace=not created)
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+REPORT_DIR = 'lab_reports'
+
+
+def content_digest(document, template_version):
+    """sha256 of everything a rendered report depends on: its printed data and the template that lays it out."""
+    payload = json.dumps({'template': template_version, 'document': document}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each file under the digest of what it was made from, sharded two
+    levels deep by digest prefix (lab_reports/ab/cd/abcd....pdf) so no directory
+    grows past a few thousand entries. A name always holds the same bytes, so
+    saving over an existing name is a no-op rather than a new "_1" copy.
+    """
+
+    def name_for(self, digest, extension='.pdf'):
+        return f'{REPORT_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed into place: readers never see a partial file, and
+        # a concurrent writer of the same digest just replaces identical bytes.
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+    def has(self, digest):
+        return self.exists(self.name_for(digest))
+
+    def store(self, digest, data):
+        """Write `data` under its digest (once) and return the stored name."""
+        return self.save(self.name_for(digest), ContentFile(data))
+
+    def local_path(self, name):
+        """Absolute path of a stored name, or None when the file is missing."""
+        path = self.path(name)
+        return path if os.path.exists(path) else None
+
+
+report_storage = ContentAddressedStorage()
@@ -1,3 +1,481 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import uuid
+import zipfile
+from concurrent.futures import Future
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Appointment, LabTechnician, LabTest, Prescription, PrescriptionLabTest
+from api.tests import MONDAY, admin_client, at, make_doctor, make_patient
+
+from . import analytes, counters, export, reports, workqueue
+from .models import LabAnalyteResult, LabReport, LabReportTestResult
+from .storage import content_digest, report_storage
+
+
+def make_technician(n=0):
+    user = User.objects.create_user(f'technician{n}', password='x')
+    user.groups.add(Group.objects.get_or_create(name='LabTechnician')[0])
+    return LabTechnician.objects.create(user=user, first_name='L', last_name=str(n), email=f'l{n}@example.com',
+                                        date_of_birth=date(1990, 1, 1))
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+class LabFixtureMixin:
+    """A prescription with `lab_test_count` pending lab tests and a technician to work them."""
+    lab_test_count = 3
+
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        appointment = Appointment.objects.create(doctor=self.doctor, patient=self.patient, status='Completed',
+                                                 start_time=at(MONDAY, 10), end_time=at(MONDAY, 10, 15))
+        self.prescription = Prescription.objects.create(patient=self.patient, doctor=self.doctor,
+                                                        appointment=appointment)
+        lab_test = LabTest.objects.create(test_name='CBC', price=50, test_desc='-')
+        self.lab_tests = [
+            PrescriptionLabTest.objects.create(prescription=self.prescription, lab_test=lab_test, test_date=MONDAY)
+            for _ in range(self.lab_test_count)
+        ]
+        self.technician = make_technician()
+        self.client = client_for(self.technician.user)
+
+    def generate_report(self, results, client=None):
+        return (client or self.client).post('/api/labtechnician/generate-report/', {
+            'prescription_id': self.prescription.id,
+            'test_results': [
+                {'prescription_lab_test_id': lab_test.id, 'result_data': result_data}
+                for lab_test, result_data in results
+            ],
+        }, format='json')
+
+
+class MediaRootMixin:
+    """Stored PDFs go to a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+class LabCounterTests(LabFixtureMixin, TestCase):
+    def test_counters_follow_tests_and_reports(self):
+        self.assertEqual(counters.dashboard()['pending_tests'], 3)
+
+        response = self.generate_report([(self.lab_tests[0], {'Hb': 14})])
+        self.assertEqual(response.status_code, 202)
+        dashboard = counters.dashboard()
+        self.assertEqual(dashboard['pending_tests'], 2)
+        self.assertEqual(dashboard['completed_today'], 1)
+        self.assertEqual(dashboard['reports_today'], 1)
+        self.assertIsNotNone(dashboard['avg_turnaround_seconds'])
+
+        self.lab_tests[1].delete()
+        self.assertEqual(counters.dashboard()['pending_tests'], 1)
+
+    def test_rebuild_matches_live_counters(self):
+        self.generate_report([(self.lab_tests[0], {'Hb': 14}), (self.lab_tests[1], {'Hb': 15})])
+        live = counters.dashboard()
+        call_command('rebuild_lab_counters', stdout=io.StringIO())
+        self.assertEqual(counters.dashboard(), live)
+
+    def test_dashboard_is_one_read(self):
+        counters.dashboard()
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.dashboard(timezone.localdate())['pending_tests'], 3)
+
+
+class ReportQueueTests(MediaRootMixin, LabFixtureMixin, TestCase):
+    def queue_report(self, lab_test=None):
+        response = self.generate_report([(lab_test or self.lab_tests[0], {'Hb': 14})])
+        self.assertEqual(response.status_code, 202)
+        return LabReport.objects.get(pk=response.json()['id']), response
+
+    def status(self, lab_report):
+        return self.client.get(f'/api/labtechnician/reports/{lab_report.pk}/status/')
+
+    def test_report_is_queued_then_rendered_by_the_worker(self):
+        lab_report, response = self.queue_report()
+        self.assertEqual(response['Location'], f'/api/labtechnician/reports/{lab_report.pk}/status/')
+        pending = self.status(lab_report)
+        self.assertEqual((pending.json()['status'], pending['Retry-After']), ('queued', '2'))
+        self.assertEqual(self.client.get(f'/api/labtechnician/reports/{lab_report.pk}/download/').status_code, 409)
+
+        call_command('render_lab_reports', '--once', '--workers', '0', stdout=io.StringIO())
+
+        ready = self.status(lab_report)
+        self.assertEqual(ready.json()['status'], 'ready')
+        self.assertNotIn('Retry-After', ready)
+        self.assertEqual(ready.json()['download_url'], f'/api/labtechnician/reports/{lab_report.pk}/download/')
+        lab_report.refresh_from_db()
+        with open(report_storage.path(lab_report.report_pdf.name), 'rb') as f:
+            self.assertEqual(f.read(5), b'%PDF-')
+
+    def test_a_report_is_claimed_once_until_its_renderer_goes_quiet(self):
+        lab_report, _ = self.queue_report()
+        self.assertEqual([r.pk for r in reports.claim(10)], [lab_report.pk])
+        self.assertEqual(reports.claim(10), [])
+
+        LabReport.objects.filter(pk=lab_report.pk).update(
+            status_changed_at=timezone.now() - reports.RENDER_TIMEOUT - timezone.timedelta(seconds=1)
+        )
+        reclaimed = reports.claim(10)
+        self.assertEqual([(r.pk, r.render_attempts) for r in reclaimed], [(lab_report.pk, 2)])
+
+    def test_failures_are_retried_then_given_up(self):
+        lab_report, _ = self.queue_report()
+        with mock.patch.object(reports, 'render_pdf', side_effect=RuntimeError('font missing')):
+            for attempt in range(1, reports.MAX_ATTEMPTS + 1):
+                self.assertEqual(reports.render_batch(10), (0, 1))
+                lab_report.refresh_from_db()
+                self.assertEqual(lab_report.render_attempts, attempt)
+        self.assertEqual((lab_report.status, lab_report.render_error), ('failed', 'font missing'))
+        self.assertEqual(self.status(lab_report).json()['error'], 'font missing')
+
+        self.assertEqual(reports.requeue_failed(), 1)
+        self.assertEqual(reports.render_batch(10), (1, 0))
+
+    def test_worker_replaces_a_broken_pool_and_keeps_rendering(self):
+        lab_report, _ = self.queue_report()
+        broken = mock.Mock()
+        broken.submit.side_effect = reports.BrokenProcessPool('a process died')
+        working = InlinePool()
+
+        with mock.patch.object(reports, 'ProcessPoolExecutor', side_effect=[broken, working]) as pools:
+            call_command('render_lab_reports', '--once', '--workers', '2', stdout=io.StringIO())
+
+        self.assertEqual(pools.call_count, 2)
+        broken.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        self.assertEqual(working.submitted, 1)
+        lab_report.refresh_from_db()
+        self.assertEqual((lab_report.status, lab_report.render_attempts), ('ready', 2))
+        self.assertIsNone(reports._pool)
+
+
+class InlinePool:
+    """A process pool stand-in that runs each job as it is submitted."""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class ReportStorageTests(MediaRootMixin, LabFixtureMixin, TestCase):
+    def test_files_are_sharded_by_digest_and_stored_once(self):
+        digest = content_digest({'id': 1}, 1)
+        self.assertNotEqual(digest, content_digest({'id': 1}, 2))
+
+        name = report_storage.store(digest, b'%PDF-one')
+        self.assertEqual(name, f'lab_reports/{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+        self.assertEqual(report_storage.store(digest, b'%PDF-one'), name)
+        self.assertEqual(os.listdir(os.path.dirname(report_storage.path(name))), [f'{digest}.pdf'])
+        self.assertTrue(report_storage.has(digest))
+
+    def test_reports_with_the_same_inputs_share_one_render(self):
+        for lab_test in self.lab_tests[:2]:
+            self.generate_report([(lab_test, {'Hb': 14})])
+        document = reports.report_document(reports.report_queryset().first())
+
+        with mock.patch.object(reports, 'report_document', return_value=document), \
+                mock.patch.object(reports, 'render_pdf', wraps=reports.render_pdf) as render:
+            self.assertEqual(reports.render_batch(10), (2, 0))
+            self.assertEqual(render.call_count, 1)
+
+            # A re-queue with nothing changed reuses the stored file
+            LabReport.objects.update(status='queued')
+            self.assertEqual(reports.render_batch(10), (2, 0))
+            self.assertEqual(render.call_count, 1)
+
+        self.assertEqual(len(set(LabReport.objects.values_list('report_pdf', flat=True))), 1)
+
+    def test_reports_rendered_before_content_addressing_still_download(self):
+        self.generate_report([(self.lab_tests[0], {'Hb': 14})])
+        lab_report = LabReport.objects.get()
+        lab_report.report_pdf.save('report_legacy.pdf', io.BytesIO(b'%PDF-legacy'), save=False)
+        LabReport.objects.filter(pk=lab_report.pk).update(status='ready', report_pdf=lab_report.report_pdf.name)
+
+        response = self.client.get(f'/api/labtechnician/reports/{lab_report.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-legacy')
+
+
+class ReportDownloadTests(MediaRootMixin, LabFixtureMixin, TestCase):
+    def test_download_is_validated_by_the_content_digest(self):
+        self.generate_report([(self.lab_tests[0], {'Hb': 14})])
+        reports.render_batch(10)
+        lab_report = LabReport.objects.get()
+        url = f'/api/labtechnician/reports/{lab_report.pk}/download/'
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-4')
+        self.assertEqual((response.status_code, response['ETag']), (206, f'"{lab_report.content_digest}"'))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class ReportExportTests(MediaRootMixin, LabFixtureMixin, TestCase):
+    def export(self, **params):
+        response = self.client.get('/api/labtechnician/reports/export/', params)
+        return response, zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_missing_pdfs_are_rendered_into_the_archive(self):
+        for lab_test in self.lab_tests:
+            self.generate_report([(lab_test, {'Hb': 14})])
+        ready, failed, queued = LabReport.objects.order_by('pk')
+        reports.render_batch(1)
+        LabReport.objects.filter(pk=failed.pk).update(status='failed', render_attempts=reports.MAX_ATTEMPTS,
+                                                      render_error='font missing')
+
+        response, archive = self.export(patient=self.patient.pk)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        day = timezone.localdate().isoformat()
+        names = [f'patient-{self.patient.pk}/LR-{lab_report.pk}-{day}.pdf' for lab_report in (ready, failed, queued)]
+        self.assertEqual(sorted(archive.namelist()), sorted(['manifest.csv', *names]))
+        self.assertTrue(all(archive.read(name).startswith(b'%PDF-') for name in names))
+        manifest = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+        self.assertEqual([(row['file'], row['error']) for row in manifest], [(name, '') for name in names])
+
+        self.assertEqual(set(LabReport.objects.values_list('status', flat=True)), {'ready'})
+
+    def test_reports_a_worker_is_rendering_are_left_to_it(self):
+        self.generate_report([(self.lab_tests[0], {'Hb': 14})])
+        reports.claim(10)  # a worker has it
+
+        _, archive = self.export(patient=self.patient.pk)
+        self.assertEqual(archive.namelist(), ['manifest.csv'])
+        manifest = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+        self.assertEqual(manifest[0]['error'], 'PDF is being rendered by the worker; export again shortly')
+        self.assertEqual(LabReport.objects.get().render_attempts, 1)
+
+    def test_render_errors_are_listed(self):
+        self.generate_report([(self.lab_tests[0], {'Hb': 14})])
+        with mock.patch.object(reports, 'render_pdf', side_effect=RuntimeError('font missing')):
+            _, archive = self.export(patient=self.patient.pk)
+        manifest = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+        self.assertEqual(manifest[0]['error'], 'PDF could not be rendered: font missing')
+        self.assertEqual(LabReport.objects.get().status, 'queued')  # back to the worker
+
+    def test_reports_are_read_in_keyset_chunks(self):
+        for lab_test in self.lab_tests:
+            self.generate_report([(lab_test, {'Hb': 14})])
+        reports.render_batch(10)
+        queryset = LabReport.objects.select_related('prescription__patient')
+        with CaptureQueriesContext(connection) as queries:
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(export.stream_reports_zip(queryset, chunk_size=2))))
+        self.assertEqual(len(queries), 2)
+        self.assertIn('LIMIT 2', queries[1]['sql'])
+        self.assertEqual(len(archive.namelist()), 4)
+
+    def test_a_filter_is_required(self):
+        response = self.client.get('/api/labtechnician/reports/export/')
+        self.assertEqual(response.status_code, 400)
+
+
+class AnalyteParsingTests(TestCase):
+    def test_readings_are_typed(self):
+        parsed = analytes.parse_result_data({
+            ' Hemoglobin ': {'value': '14.2', 'unit': 'g/dL', 'reference_range': '12 - 16'},
+            'WBC': 7,
+            'Glucose': {'value': 180, 'low': 70, 'high': 140},
+            'Culture': 'No growth',
+            'Positive': True,
+            'Nested': {'value': {'a': 1}},
+            '': 5,
+            'Ratio': 'inf',
+        })
+        readings = {row['analyte']: row for row in parsed}
+        self.assertEqual(set(readings), {'hemoglobin', 'wbc', 'glucose', 'culture', 'positive', 'ratio'})
+        self.assertEqual(
+            {k: readings['hemoglobin'][k] for k in ('name', 'value', 'unit', 'reference_low', 'reference_high')},
+            {'name': 'Hemoglobin', 'value': 14.2, 'unit': 'g/dL', 'reference_low': 12.0, 'reference_high': 16.0},
+        )
+        self.assertEqual((readings['glucose']['reference_low'], readings['glucose']['reference_high']), (70.0, 140.0))
+        self.assertEqual((readings['culture']['value'], readings['culture']['value_text']), (None, 'No growth'))
+        self.assertEqual((readings['positive']['value'], readings['positive']['value_text']), (None, 'True'))
+        self.assertIsNone(readings['ratio']['value'])
+
+    def test_only_objects_have_analytes(self):
+        self.assertEqual(analytes.parse_result_data(['Hb', 14]), [])
+        self.assertEqual(analytes.parse_result_data('Hb 14'), [])
+
+
+class AnalyteTests(LabFixtureMixin, TestCase):
+    def reading(self, value):
+        return {'Hemoglobin': {'value': value, 'unit': 'g/dL', 'reference_range': '12-16'}}
+
+    def report_at(self, lab_test, value, day):
+        self.generate_report([(lab_test, self.reading(value))])
+        lab_report = LabReport.objects.latest('pk')
+        LabReport.objects.filter(pk=lab_report.pk).update(created_at=at(day, 9))
+        return lab_report
+
+    def trend(self, **params):
+        if not hasattr(self, 'admin'):
+            self.admin = admin_client()
+        response = self.admin.get(f'/api/patients/{self.patient.pk}/analyte-trend/',
+                                      {'analyte': 'HEMOGLOBIN', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_results_are_kept_in_step(self):
+        self.generate_report([(self.lab_tests[0], self.reading(14))])
+        result = LabReportTestResult.objects.get()
+        self.assertEqual(list(LabAnalyteResult.objects.values_list('analyte', 'value')), [('hemoglobin', 14.0)])
+
+        result.result_data = {'WBC': 7}
+        result.save()
+        self.assertEqual(list(LabAnalyteResult.objects.values_list('analyte', 'value')), [('wbc', 7.0)])
+
+        LabReportTestResult.objects.filter(pk=result.pk).update(result_data=self.reading(11))
+        self.assertEqual(list(LabAnalyteResult.objects.values_list('analyte', 'value')), [('hemoglobin', 11.0)])
+
+    def test_trend_and_out_of_range(self):
+        for lab_test, value, day in zip(self.lab_tests, (11, 14, 17), (MONDAY, MONDAY + timezone.timedelta(days=1),
+                                                                        MONDAY + timezone.timedelta(days=2))):
+            self.report_at(lab_test, value, day)
+        call_command('rebuild_lab_analytes', stdout=io.StringIO())  # picks up the back-dated reports
+
+        series = self.trend()
+        self.assertEqual(series['value'], [11.0, 14.0, 17.0])
+        self.assertEqual(series['unit'], ['g/dL'] * 3)
+        self.assertEqual(self.trend(limit=2)['value'], [14.0, 17.0])  # the newest two, oldest first
+
+        outside = self.client.get('/api/labtechnician/analytes/out-of-range/', {'analyte': 'hemoglobin'}).json()
+        self.assertEqual(outside['value'], [17.0, 11.0])
+        outside = self.client.get('/api/labtechnician/analytes/out-of-range/',
+                                  {'analyte': 'hemoglobin', 'high': 13}).json()
+        self.assertEqual(outside['value'], [17.0, 14.0])
+
+    def test_rebuild_rewrites_chunk_by_chunk(self):
+        for lab_test in self.lab_tests:
+            self.generate_report([(lab_test, self.reading(14))])
+        LabAnalyteResult.objects.filter(result=LabReportTestResult.objects.first()).delete()  # drifted
+        LabAnalyteResult.objects.update(value=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command('rebuild_lab_analytes', '--chunk-size', '2', stdout=io.StringIO())
+
+        self.assertEqual(list(LabAnalyteResult.objects.values_list('value', flat=True)), [14.0] * 3)
+        deletes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        self.assertTrue(all('WHERE' in sql for sql in deletes))
+
+
+class WorkQueueTests(LabFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = make_technician(1)
+        self.other_client = client_for(self.other.user)
+
+    def queue(self, action, client=None, **data):
+        return (client or self.client).post(f'/api/labtechnician/queue/{action}/', data, format='json')
+
+    def test_claims_are_disjoint_and_can_be_renewed_and_released(self):
+        mine = self.queue('claim', count=2).json()
+        theirs = self.queue('claim', self.other_client, count=2).json()
+        self.assertEqual([t['id'] for t in mine['tests']], [t.id for t in self.lab_tests[:2]])
+        self.assertEqual([t['id'] for t in theirs['tests']], [self.lab_tests[2].id])
+
+        renewed = self.queue('renew', claim_token=mine['claim_token'], lease_minutes=60).json()
+        self.assertGreater(renewed['lease_expires_at'], mine['lease_expires_at'])
+        # Only the holder can renew or release a claim
+        self.assertEqual(self.queue('renew', self.other_client, claim_token=mine['claim_token']).status_code, 404)
+        self.assertEqual(self.queue('release', self.other_client, claim_token=mine['claim_token']).json(),
+                         {'released': 0})
+
+        released = self.queue('release', claim_token=mine['claim_token'], ids=[self.lab_tests[0].id]).json()
+        self.assertEqual(released, {'released': 1})
+        again = self.queue('claim', self.other_client, count=5).json()
+        self.assertEqual([t['id'] for t in again['tests']], [self.lab_tests[0].id])
+
+    def test_lapsed_leases_go_back_to_the_queue(self):
+        mine = self.queue('claim', count=5).json()
+        PrescriptionLabTest.objects.update(lease_expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertEqual(self.queue('renew', claim_token=mine['claim_token']).status_code, 404)
+        self.assertEqual(len(self.queue('claim', self.other_client, count=5).json()['tests']), 3)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.queue('claim', count=workqueue.MAX_CLAIM + 1).status_code, 400)
+        self.assertEqual(self.queue('claim', lease_minutes=0).status_code, 400)
+        self.assertEqual(self.queue('renew', claim_token='nope').status_code, 400)
+        self.assertEqual(self.queue('release', claim_token=str(uuid.uuid4()), ids='1').status_code, 400)
+
+    def test_reporting_a_test_leased_to_someone_else_is_a_conflict(self):
+        self.queue('claim', self.other_client, count=1)
+        leased = self.lab_tests[0]
+
+        response = self.generate_report([(leased, {'Hb': 14}), (self.lab_tests[1], {'Hb': 15})])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['prescription_lab_test_ids'], [leased.id])
+        self.assertFalse(LabReport.objects.exists())
+        self.assertEqual(set(PrescriptionLabTest.objects.values_list('status', flat=True)), {'Pending'})
+
+        # The holder can report it, and the lease is cleared with it
+        self.assertEqual(self.generate_report([(leased, {'Hb': 14})], self.other_client).status_code, 202)
+        leased.refresh_from_db()
+        self.assertEqual((leased.status, leased.claimed_by, leased.claim_token), ('Completed', None, None))
+
+    def test_status_updates_respect_leases(self):
+        self.queue('claim', self.other_client, count=1)
+        leased = self.lab_tests[0]
+        url = f'/api/labtechnician/labtests/results/{leased.id}/'
+
+        response = self.client.patch(url, {'status': 'Completed'}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['prescription_lab_test_ids'], [leased.id])
+        leased.refresh_from_db()
+        self.assertEqual(leased.status, 'Pending')
+
+        # Unleased tests can be updated by anyone; the holder can update its own
+        self.assertEqual(self.client.patch(f'/api/labtechnician/labtests/results/{self.lab_tests[1].id}/',
+                                           {'status': 'Completed'}, format='json').status_code, 200)
+        self.assertEqual(self.other_client.patch(url, {'test_date': '2030-01-08'}, format='json').status_code, 200)
+        leased.refresh_from_db()
+        self.assertEqual(leased.claimed_by, self.other)  # still Pending, still held
+
+        self.assertEqual(self.other_client.patch(url, {'status': 'Completed'}, format='json').status_code, 200)
+        leased.refresh_from_db()
+        self.assertEqual((leased.status, leased.claimed_by, leased.claim_token, leased.lease_expires_at),
+                         ('Completed', None, None, None))
+
+    def test_report_is_signed_by_the_caller(self):
+        response = self.client.post('/api/labtechnician/generate-report/', {
+            'prescription_id': self.prescription.id,
+            'generated_by': self.other.id,
+            'test_results': [{'prescription_lab_test_id': self.lab_tests[0].id, 'result_data': {'Hb': 14}}],
+        }, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(LabReport.objects.get().generated_by, self.technician)
+
+    def test_unknown_tests_write_nothing(self):
+        response = self.generate_report([(self.lab_tests[0], {'Hb': 14}), (PrescriptionLabTest(id=9999), {})])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('9999', response.json()['error'])
+        self.assertFalse(LabReport.objects.exists())
@@ -11,16 +11,28 @@ urlpatterns = [
     path('pending-tests/', views.PendingLabTestsView.as_view(), name='pending-lab-tests'),
     path('prescription-tests/', views.PendingPrescriptionLabTestsView.as_view(), name='prescription-lab-tests'),
     
+    # Work queue: claim/renew/release leases on pending tests
+    path('queue/claim/', views.LabWorkQueueClaimView.as_view(), name='lab-queue-claim'),
+    path('queue/renew/', views.LabWorkQueueRenewView.as_view(), name='lab-queue-renew'),
+    path('queue/release/', views.LabWorkQueueReleaseView.as_view(), name='lab-queue-release'),
+
     # Lab Report Endpoints
     path('generate-report/', views.GenerateLabReportView.as_view(), name='generate-lab-report'),
     path('reports/by-prescription/<int:prescription_id>/', 
          views.LabReportListByPrescriptionView.as_view(), 
          name='lab-reports-by-prescription'),
+    path('reports/export/', views.LabReportExportView.as_view(), name='lab-report-export'),
+    path('reports/<int:report_id>/status/',
+         views.LabReportStatusView.as_view(),
+         name='lab-report-status'),
     path('reports/<int:report_id>/download/', 
          views.LabReportDownloadView.as_view(), 
          name='lab-report-download'),
 
     
+    # Analytes across patients
+    path('analytes/out-of-range/', views.AnalyteOutOfRangeView.as_view(), name='analyte-out-of-range'),
+
     # Dashboard
     path('dashboard/', views.LabTechnicianDashboardView.as_view(), name='lab-technician-dashboard'),
     
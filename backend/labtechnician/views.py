@@ -3,19 +3,27 @@
 from django.shortcuts import render
 from rest_framework import generics, status
 from rest_framework.response import Response
-from .models import LabTechnician, LabReport
+from . import analytes, counters, export, reports, workqueue
+from .storage import report_storage
+from .models import LabTechnician, LabReport, LabReportTestResult
 from .serializers import LabTechnicianSerializer, LabReportSerializer, PrescriptionLabTestSerializer,LabTestSerializer,LabTestResultSerializer
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import os
 from django.conf import settings
+from django.db import transaction
 from .permissions import IsLabTechnician
+from api.permissions import IsAdmin
 from .permissions import IsDoctorOrLabTechnician
 from rest_framework.views import APIView
 from .permissions import IsDoctor
 from api.models import PrescriptionLabTest,LabTest,Prescription
 from django.utils import timezone
-from django.http import FileResponse
+from django.utils.dateparse import parse_date
+import uuid
+from datetime import datetime, timedelta
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
 from reportlab.pdfgen import canvas
 from io import BytesIO
 from django.conf import settings
@@ -25,14 +33,23 @@ from rest_framework.response import Response
 from .models import PrescriptionLabTest
 from .permissions import IsLabTechnician
 from .serializers import PrescriptionLabTestSerializer
+from api.utils import timeline
+from api.utils.catalog_cache import CatalogCacheMixin
+from api.utils.downloads import serve_file
+from api.utils.fieldsets import SparseFieldsetMixin
+from api.utils.pagination import KeysetPaginationMixin
+from api.utils.related import AutoRelatedMixin
+from api.utils.roles import get_request_role
+from api.utils.streaming import StreamingListMixin
 
 
 
 
 
 # View Pending Lab Tests 
-class PendingLabTestsView(generics.ListAPIView):
+class PendingLabTestsView(KeysetPaginationMixin, AutoRelatedMixin, generics.ListAPIView):
     serializer_class = PrescriptionLabTestSerializer
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         queryset = PrescriptionLabTest.objects.all()  # Your original queryset
@@ -46,121 +63,58 @@ class GenerateLabReportView(generics.CreateAPIView):
     serializer_class = LabReportSerializer
     permission_classes = [IsLabTechnician]
 
-    def generate_pdf_report(self, lab_report):
-        """Generate professional PDF report and return the file path"""
-        try:
-            buffer = BytesIO()
-            p = canvas.Canvas(buffer)
-            
-            # Set font styles
-            p.setFont("Helvetica-Bold", 16)
-            p.drawCentredString(300, 800, "LABORATORY TEST REPORT")
-            p.setFont("Helvetica", 12)
-            
-            # Patient Information
-            patient = lab_report.prescription.patient
-            p.drawString(50, 770, f"Patient Name: {patient.first_name} {patient.last_name}")
-            p.drawString(50, 750, f"Date of Birth: {patient.date_of_birth}")
-            p.drawString(50, 730, f"Blood Group: {patient.blood_group}")
-            
-            # Doctor Information
-            doctor = lab_report.prescription.doctor
-            p.drawString(50, 700, f"Referring Physician: Dr. {doctor.user.get_full_name()}")
-            p.drawString(50, 680, f"Doctor ID: {doctor.staff_id}")
-            
-            # Report Metadata
-            p.drawString(50, 650, f"Report ID: LR-{lab_report.id}")
-            p.drawString(50, 630, f"Report Date: {lab_report.created_at.strftime('%Y-%m-%d %H:%M')}")
-            if lab_report.generated_by:
-                p.drawString(50, 610, f"Lab Technician: {lab_report.generated_by.user.get_full_name()}")
-            
-            # Test Results Header
-            p.setFont("Helvetica-Bold", 14)
-            p.drawString(50, 580, "TEST RESULTS")
-            p.setFont("Helvetica", 12)
-            p.line(50, 575, 550, 575)
-            
-            # Test Results Table
-            y_position = 550
-            for result in lab_report.labreporttestresult_set.all():
-                test = result.prescription_lab_test.lab_test
-                p.drawString(50, y_position, f"• {test.name}")
-                p.drawString(300, y_position, f"Result: {result.result_data}")
-                
-                # Add reference range if available
-                if hasattr(test, 'reference_range') and test.reference_range:
-                    p.setFont("Helvetica-Oblique", 10)
-                    p.drawString(50, y_position-20, f"Reference Range: {test.reference_range}")
-                    p.setFont("Helvetica", 12)
-                    y_position -= 25
-                
-                y_position -= 40
-                
-                # Add page break if running out of space
-                if y_position < 100:
-                    p.showPage()
-                    y_position = 800
-                    p.setFont("Helvetica", 12)
-            
-            # Footer
-            p.setFont("Helvetica-Oblique", 10)
-            p.drawString(50, 50, "This report was generated electronically and requires authorized signature")
-            p.drawString(50, 35, f"© {settings.HOSPITAL_NAME} - All rights reserved")
-            
-            p.showPage()
-            p.save()
-            
-            # Save PDF to media directory
-            media_root = settings.MEDIA_ROOT
-            os.makedirs(os.path.join(media_root, 'lab_reports'), exist_ok=True)
-            file_path = os.path.join(media_root, 'lab_reports', f'report_{lab_report.id}.pdf')
-            
-            with open(file_path, 'wb') as f:
-                f.write(buffer.getvalue())
-            
-            return f'lab_reports/report_{lab_report.id}.pdf'
-
-        except Exception as e:
-            print(f"PDF Generation Error: {str(e)}")
-            raise
-
     def create(self, request, *args, **kwargs):
         prescription_id = request.data.get('prescription_id')
         test_results = request.data.get('test_results')
-        generated_by_id = request.data.get('generated_by')  # Note: Typo here should be 'generated_by'
-        
-        try:
-            # Validate technician exists
-            technician = LabTechnician.objects.get(id=generated_by_id)
-            
-            prescription = Prescription.objects.get(id=prescription_id)
-            lab_report = LabReport.objects.create(
-                prescription=prescription,
-                requested_by=prescription.doctor.staff_id,
-                generated_by=technician
-            )
 
-            # Process test results
-            for result in test_results:
-                prescription_lab_test = PrescriptionLabTest.objects.get(
-                    id=result['prescription_lab_test_id']
-                )
-                LabReportTestResult.objects.create(
-                    lab_report=lab_report,
-                    prescription_lab_test=prescription_lab_test,
-                    result_data=result['result_data']
+        try:
+            # Report, results, status changes and dashboard counters commit together
+            with transaction.atomic():
+                # The report is signed by whoever is logged in, never by a body field
+                technician = LabTechnician.objects.get(user=request.user)
+
+                # Locked (in pk order, so concurrent reports can't deadlock) before the lease
+                # check, so a claim or report by another technician can't slip in between.
+                test_ids = [result['prescription_lab_test_id'] for result in test_results]
+                lab_tests = {
+                    lab_test.id: lab_test
+                    for lab_test in PrescriptionLabTest.objects.select_for_update().filter(id__in=test_ids).order_by('pk')
+                }
+                missing = set(test_ids) - lab_tests.keys()
+                if missing:
+                    raise PrescriptionLabTest.DoesNotExist(
+                        f"Prescription lab test(s) {', '.join(map(str, sorted(missing)))} not found"
+                    )
+                workqueue.check_not_leased_elsewhere(lab_tests.values(), technician)
+
+                prescription = Prescription.objects.get(id=prescription_id)
+                lab_report = LabReport.objects.create(
+                    prescription=prescription,
+                    requested_by=prescription.doctor.staff_id,
+                    generated_by=technician
                 )
-                prescription_lab_test.status = 'Completed'
-                prescription_lab_test.save()
 
-            # Generate and attach PDF
-            pdf_path = self.generate_pdf_report(lab_report)
-            lab_report.report_pdf = pdf_path
-            lab_report.save()
+                # Process test results
+                for result in test_results:
+                    prescription_lab_test = lab_tests[result['prescription_lab_test_id']]
+                    LabReportTestResult.objects.create(
+                        lab_report=lab_report,
+                        prescription_lab_test=prescription_lab_test,
+                        result_data=result['result_data']
+                    )
+                    prescription_lab_test.status = 'Completed'
+                    prescription_lab_test.claimed_by = None
+                    prescription_lab_test.claim_token = None
+                    prescription_lab_test.lease_expires_at = None
+                    prescription_lab_test.save()
+
+                # The PDF is rendered by the render_lab_reports worker; poll the status URL
+                timeline.record_lab_report(lab_report)
 
             return Response(
-                LabReportSerializer(lab_report).data, 
-                status=status.HTTP_201_CREATED
+                LabReportSerializer(lab_report).data,
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': reverse('lab-report-status', args=[lab_report.id])}
             )
             
         except Prescription.DoesNotExist:
@@ -173,21 +127,28 @@ class GenerateLabReportView(generics.CreateAPIView):
                 {"error": "Lab technician not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except workqueue.LeaseConflict as e:
+            return Response(
+                {"error": str(e), "prescription_lab_test_ids": e.test_ids},
+                status=status.HTTP_409_CONFLICT
+            )
         except Exception as e:
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-class PendingPrescriptionLabTestsView(generics.ListAPIView):
+class PendingPrescriptionLabTestsView(KeysetPaginationMixin, AutoRelatedMixin, generics.ListAPIView):
     serializer_class = PrescriptionLabTestSerializer
     permission_classes = [IsDoctorOrLabTechnician]
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         user = self.request.user
-        if user.groups.filter(name='LabTechnician').exists():
+        role = get_request_role(self.request)
+        if role.in_group('LabTechnician'):
             return PrescriptionLabTest.objects.filter(status='Pending')
-        elif user.groups.filter(name='Doctors').exists():
+        elif role.in_group('Doctors'):
             return PrescriptionLabTest.objects.filter(
                 status='Pending',
                 prescription__doctor__user=user  # Assumes Doctor model links to User
@@ -201,18 +162,98 @@ class LabTechnicianDashboardView(APIView):
     
 
     def get(self, request):
-        pending_tests = PrescriptionLabTest.objects.filter(status='Pending').count()
-        print(request.user)
-        completed_today = LabReport.objects.filter(
-        ).count()
-        
+        # Read from the counters maintained by labtechnician.signals
+        return Response(counters.dashboard())
+
+
+class LabWorkQueueMixin:
+    """Shared request parsing for the work-queue endpoints; parse errors are ValueErrors with the message to return."""
+    permission_classes = [IsLabTechnician]
+
+    def post(self, request):
+        try:
+            technician = LabTechnician.objects.get(user=request.user)
+        except LabTechnician.DoesNotExist:
+            return Response({"error": "Lab technician not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            return self.handle_claim(request, technician)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_token(self):
+        try:
+            return uuid.UUID(str(self.request.data.get('claim_token')))
+        except ValueError:
+            raise ValueError('A valid claim_token is required.')
+
+    def get_lease(self):
+        minutes = self.request.data.get('lease_minutes')
+        if minutes in (None, ''):
+            return workqueue.LEASE
+        max_minutes = int(workqueue.MAX_LEASE.total_seconds() // 60)
+        try:
+            lease = timedelta(minutes=float(minutes))
+        except (TypeError, ValueError, OverflowError):
+            lease = None
+        if lease is None or not timedelta(0) < lease <= workqueue.MAX_LEASE:
+            raise ValueError(f'lease_minutes must be a number between 0 and {max_minutes}.')
+        return lease
+
+    def claim_response(self, token, technician):
+        tests = list(workqueue.claimed_tests(token, technician).select_related(
+            'lab_test', 'prescription__patient', 'prescription__doctor'
+        ))
         return Response({
-            'pending_tests': pending_tests,
-            'completed_today': completed_today
+            'claim_token': str(token),
+            'lease_expires_at': tests[0].lease_expires_at if tests else None,
+            'tests': PrescriptionLabTestSerializer(tests, many=True).data,
         })
 
 
-class LabReportListByPrescriptionView(generics.ListAPIView):
+class LabWorkQueueClaimView(LabWorkQueueMixin, APIView):
+    """
+    POST {"count": N, "lease_minutes": M}: lease the next N unclaimed pending
+    tests to the calling technician. Technicians claiming at the same time get
+    different tests; a lease that isn't renewed lapses and its tests go back
+    to the queue.
+    """
+
+    def handle_claim(self, request, technician):
+        try:
+            count = int(request.data.get('count', workqueue.DEFAULT_CLAIM))
+        except (TypeError, ValueError):
+            count = 0
+        if not 1 <= count <= workqueue.MAX_CLAIM:
+            raise ValueError(f'count must be an integer between 1 and {workqueue.MAX_CLAIM}.')
+
+        token = workqueue.claim(technician, count, self.get_lease())
+        return self.claim_response(token, technician)
+
+
+class LabWorkQueueRenewView(LabWorkQueueMixin, APIView):
+    """POST {"claim_token": ..., "lease_minutes": M}: extend a live claim; 404 once its lease has lapsed."""
+
+    def handle_claim(self, request, technician):
+        token = self.get_token()
+        if workqueue.renew(token, technician, self.get_lease()) is None:
+            return Response({"error": "Claim not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+        return self.claim_response(token, technician)
+
+
+class LabWorkQueueReleaseView(LabWorkQueueMixin, APIView):
+    """POST {"claim_token": ..., "ids": [...]}: return a claim's tests (or just those ids) to the queue."""
+
+    def handle_claim(self, request, technician):
+        token = self.get_token()
+        test_ids = request.data.get('ids')
+        if test_ids is not None and not (
+            isinstance(test_ids, list) and all(isinstance(test_id, int) for test_id in test_ids)
+        ):
+            raise ValueError('ids must be a list of prescription lab test ids.')
+        return Response({'released': workqueue.release(token, technician, test_ids)})
+
+
+class LabReportListByPrescriptionView(AutoRelatedMixin, generics.ListAPIView):
     serializer_class = LabReportSerializer
     permission_classes = [IsDoctor]
     
@@ -260,6 +301,34 @@ class LabTestResultDetailView(generics.UpdateAPIView):
     permission_classes = [IsLabTechnician]
     http_method_names = ['get', 'patch', 'put'] 
 
+    def get_queryset(self):
+        # Locked for the lease check in update(), like GenerateLabReportView
+        return super().get_queryset().select_for_update()
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        try:
+            with transaction.atomic():
+                technician = LabTechnician.objects.get(user=request.user)
+                instance = self.get_object()
+                workqueue.check_not_leased_elsewhere([instance], technician)
+
+                serializer = self.get_serializer(instance, data=request.data, partial=partial)
+                serializer.is_valid(raise_exception=True)
+                if serializer.validated_data.get('status', instance.status) != 'Pending':
+                    # Done with (or cancelled): nobody holds it any more
+                    serializer.save(claimed_by=None, claim_token=None, lease_expires_at=None)
+                else:
+                    serializer.save()
+        except LabTechnician.DoesNotExist:
+            return Response({"error": "Lab technician not found"}, status=status.HTTP_404_NOT_FOUND)
+        except workqueue.LeaseConflict as e:
+            return Response(
+                {"error": str(e), "prescription_lab_test_ids": e.test_ids},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(serializer.data)
+
 
 
 class AppointmentLabTestResultsView(generics.ListAPIView):
@@ -275,10 +344,11 @@ class AppointmentLabTestResultsView(generics.ListAPIView):
 
 
 # # 4.2 Lab Test Management
-class LabTestListView(generics.ListCreateAPIView):
+class LabTestListView(CatalogCacheMixin, generics.ListCreateAPIView):
     queryset = LabTest.objects.all()
     serializer_class = LabTestSerializer
     permission_classes = [IsDoctorOrLabTechnician]
+    catalog = 'labtest'
     
 
 class LabTestDetailView(generics.RetrieveUpdateAPIView):
@@ -295,11 +365,21 @@ class PrescriptionLabTestFilter(filters.FilterSet):
         model = PrescriptionLabTest
         fields = []
 
-class LabTestResultsByDateView(generics.ListAPIView):
+class LabReportExportFilter(filters.FilterSet):
+    start_date = filters.DateFilter(field_name='created_at', lookup_expr='date__gte')
+    end_date = filters.DateFilter(field_name='created_at', lookup_expr='date__lte')
+    patient = filters.NumberFilter(field_name='prescription__patient_id')
+
+    class Meta:
+        model = LabReport
+        fields = []
+
+class LabTestResultsByDateView(KeysetPaginationMixin, generics.ListAPIView):
     serializer_class = LabTestResultSerializer
     permission_classes = [IsLabTechnician]
     filter_backends = [filters.DjangoFilterBackend]
     filterset_class = PrescriptionLabTestFilter
+    cursor_ordering = ('-created_at', '-id')
     
     def get_queryset(self):
         return PrescriptionLabTest.objects.all()
@@ -307,38 +387,119 @@ class LabTestResultsByDateView(generics.ListAPIView):
 from django.http import FileResponse, Http404
 import os
 
+class LabReportStatusView(APIView):
+    """Where a report's PDF is in the render queue. Poll until status is ready or failed."""
+    permission_classes = [IsLabTechnician]
+
+    def get(self, request, report_id):
+        report = LabReport.objects.filter(id=report_id).only(
+            'id', 'status', 'status_changed_at', 'render_attempts', 'render_error', 'report_pdf'
+        ).first()
+        if report is None:
+            return Response({'error': 'Report not found'}, status=404)
+
+        headers = {}
+        if report.status in ('queued', 'rendering'):
+            headers['Retry-After'] = '2'
+        return Response({
+            'id': report.id,
+            'status': report.status,
+            'status_changed_at': report.status_changed_at,
+            'render_attempts': report.render_attempts,
+            'error': report.render_error or None,
+            'download_url': reverse('lab-report-download', args=[report.id]) if report.status == 'ready' else None,
+        }, headers=headers)
+
+class LabReportExportView(APIView):
+    """
+    GET ?start_date=&end_date= (report dates, inclusive) and/or ?patient=<id>:
+    a ZIP of the matching reports, streamed as it is built.
+    """
+    permission_classes = [IsLabTechnician | IsAdmin]
+
+    def get(self, request):
+        filterset = LabReportExportFilter(request.query_params, queryset=LabReport.objects.select_related('prescription__patient'))
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not any(filterset.form.cleaned_data.get(name) is not None for name in filterset.filters):
+            return Response({'error': 'Give a date range (start_date, end_date) or a patient.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(export.stream_reports_zip(filterset.qs), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="lab-reports-{timezone.localdate():%Y%m%d}.zip"'
+        return response
+
+class AnalyteOutOfRangeView(APIView):
+    """
+    GET ?analyte=Hemoglobin: readings outside the normal range across all
+    patients, newest first, as columns. ?low= / ?high= set the range; without
+    them each reading's own reference range is used. Optional ?since= / ?until=
+    (dates, until exclusive) and ?limit=.
+    """
+    permission_classes = [IsLabTechnician | IsAdmin]
+
+    def get(self, request):
+        params = request.query_params
+        analyte = params.get('analyte', '').strip()
+        if not analyte:
+            return Response({'error': 'analyte is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            low = float(params['low']) if params.get('low') else None
+            high = float(params['high']) if params.get('high') else None
+            limit = min(int(params.get('limit', analytes.COHORT_LIMIT)), analytes.MAX_COHORT_LIMIT)
+            since, until = (_start_of(params.get(name)) for name in ('since', 'until'))
+        except ValueError:
+            return Response({'error': 'low/high must be numbers, limit an integer and since/until dates (YYYY-MM-DD).'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytes.out_of_range(analyte, low, high, since, until, max(limit, 1)))
+
+def _start_of(value):
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
 class LabReportDownloadView(APIView):
     permission_classes = [IsLabTechnician]
 
     def get(self, request, report_id):
         try:
-            report = LabReport.objects.get(id=report_id)
+            report = LabReport.objects.only('id', 'status', 'report_pdf', 'content_digest').get(id=report_id)
 
-            if not report.report_pdf:
+            if report.status != 'ready':
+                return Response({'error': f'Report PDF is {report.status}', 'status': report.status}, status=409)
+            name = reports.stored_pdf(report)
+            if name is None:
                 return Response({'error': 'Report PDF not found'}, status=404)
 
-            file_path = os.path.join(settings.MEDIA_ROOT, report.report_pdf)
-            if not os.path.exists(file_path):
+            file_path = report_storage.local_path(name)
+            if file_path is None:
                 return Response({'error': 'PDF file not found on server'}, status=404)
 
-            return FileResponse(open(file_path, 'rb'), content_type='application/pdf')
+            return serve_file(
+                request, file_path, 'application/pdf', filename=f'lab-report-{report.id}.pdf',
+                etag=f'"{report.content_digest}"' if report.content_digest else None,
+            )
 
         except LabReport.DoesNotExist:
             return Response({'error': 'Report not found'}, status=404)
 
 # lab/views.py
 
-class PrescriptionLabTestListAPIView(generics.ListAPIView):
+class PrescriptionLabTestListAPIView(StreamingListMixin, KeysetPaginationMixin, AutoRelatedMixin, generics.ListAPIView):
     queryset = PrescriptionLabTest.objects.select_related(
         'prescription__patient',
         'prescription__doctor',
         'lab_test'
     ).all()
     serializer_class = PrescriptionLabTestSerializer
+    cursor_ordering = ('-created_at', '-id')
 
 
 
-class PrescriptionLabTestViewSet(viewsets.ModelViewSet):
+class PrescriptionLabTestViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = PrescriptionLabTest.objects.all()
     serializer_class = PrescriptionLabTestSerializer
     permission_classes = [IsLabTechnician]
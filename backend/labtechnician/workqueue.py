@@ -0,0 +1,97 @@
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.models import PrescriptionLabTest
+
+LEASE = timedelta(minutes=15)
+MAX_LEASE = timedelta(hours=2)
+DEFAULT_CLAIM = 5
+MAX_CLAIM = 50
+CLAIM_ROUNDS = 3  # fallback only: retries after losing rows to another technician
+
+
+class LeaseConflict(Exception):
+    """A test is leased to another technician."""
+
+    def __init__(self, test_ids):
+        super().__init__(f"Lab test(s) {', '.join(map(str, test_ids))} are claimed by another technician")
+        self.test_ids = test_ids
+
+
+def _available(now):
+    """Pending tests nobody holds a live lease on, oldest first."""
+    return PrescriptionLabTest.objects.filter(
+        Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now),
+        status='Pending',
+    ).order_by('created_at', 'id')
+
+
+def claim(technician, count=DEFAULT_CLAIM, lease=LEASE):
+    """
+    Lease up to `count` of the oldest unclaimed pending tests to `technician`
+    and return the claim token. Concurrent callers get disjoint tests: where the
+    database has SKIP LOCKED, rows another claimer is locking are passed over;
+    elsewhere the UPDATE re-checks that each row is still free and rows lost to
+    another technician are made up from the next candidates.
+    """
+    now = timezone.now()
+    token = uuid.uuid4()
+    lease_values = {'claimed_by': technician, 'claim_token': token, 'lease_expires_at': now + lease}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_available(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:count])
+            PrescriptionLabTest.objects.filter(id__in=ids).update(**lease_values)
+        return token
+
+    claimed = 0
+    for _ in range(CLAIM_ROUNDS):
+        ids = list(_available(now).values_list('id', flat=True)[:count - claimed])
+        if not ids:
+            break
+        claimed += _available(now).filter(id__in=ids).update(**lease_values)
+        if claimed >= count:
+            break
+    return token
+
+
+def claimed_tests(token, technician):
+    """The pending tests still leased under `token`."""
+    return PrescriptionLabTest.objects.filter(
+        claim_token=token, claimed_by=technician, status='Pending', lease_expires_at__gt=timezone.now()
+    ).order_by('created_at', 'id')
+
+
+def renew(token, technician, lease=LEASE):
+    """Extend a live claim; returns the new expiry, or None when nothing under it is still held."""
+    expires_at = timezone.now() + lease
+    if claimed_tests(token, technician).update(lease_expires_at=expires_at):
+        return expires_at
+    return None
+
+
+def release(token, technician, test_ids=None):
+    """Hand a claim's tests (or just `test_ids` of them) back to the queue; returns how many."""
+    tests = PrescriptionLabTest.objects.filter(claim_token=token, claimed_by=technician, status='Pending')
+    if test_ids is not None:
+        tests = tests.filter(id__in=test_ids)
+    return tests.update(claimed_by=None, claim_token=None, lease_expires_at=None)
+
+
+def check_not_leased_elsewhere(tests, technician):
+    """
+    Raise LeaseConflict if any of `tests` is under another technician's live
+    lease. Pass rows read with select_for_update() inside the transaction that
+    writes them, or a claim can land between the check and the write.
+    """
+    now = timezone.now()
+    held = [
+        test.id for test in tests
+        if test.lease_expires_at and test.lease_expires_at > now and test.claimed_by_id != technician.id
+    ]
+    if held:
+        raise LeaseConflict(held)
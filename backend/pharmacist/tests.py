@@ -1,3 +1,50 @@
+from datetime import date
+
+from django.contrib.auth.models import Group, User
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.models import Medicine, Pharmacist, StockMovement
+
+
+class PharmacistMedicineTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('pharmacist', password='x')
+        user.groups.add(Group.objects.create(name='Pharmacist'))
+        Pharmacist.objects.create(user=user, first_name='P', last_name='H', email='p@example.com',
+                                  date_of_birth=date(1990, 1, 1))
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.aspirin = Medicine.objects.create(medicine_name='Aspirin', price=2, medicine_desc='-', manufacturer='-',
+                                               stock=10)
+
+    def test_search_and_stock_update_address_the_same_medicine(self):
+        found = self.client.get('/api/pharmacist/medicine/?search=asp').json()
+        self.assertEqual([row['id'] for row in found], [self.aspirin.pk])
+
+        response = self.client.patch(f"/api/pharmacist/medicine/{found[0]['id']}/update-stock/", {'stock': 5})
+        self.assertEqual(response.json()['stock'], 15)
+        self.assertEqual(Medicine.objects.get(pk=self.aspirin.pk).stock, 15)
+        self.assertTrue(StockMovement.objects.filter(medicine=self.aspirin, reason='receipt', delta=5).exists())
+
+    def test_stock_cannot_go_negative(self):
+        response = self.client.patch(f'/api/pharmacist/medicine/{self.aspirin.pk}/update-stock/', {'stock': -11})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Medicine.objects.get(pk=self.aspirin.pk).stock, 10)
+        self.assertEqual(self.client.patch('/api/pharmacist/medicine/9999/update-stock/', {'stock': 1}).status_code,
+                         404)
+
+    def test_detail_update_leaves_stock_alone(self):
+        Medicine.objects.filter(pk=self.aspirin.pk).update(stock=7)  # e.g. a sale since it was loaded
+        response = self.client.patch(f'/api/pharmacist/medicine/{self.aspirin.pk}/update/', {'manufacturer': 'Acme'})
+        self.assertEqual(response.status_code, 200)
+        medicine = Medicine.objects.get(pk=self.aspirin.pk)
+        self.assertEqual((medicine.manufacturer, medicine.stock), ('Acme', 7))
 
-# Create your tests here.
+    def test_other_roles_cannot_change_stock(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('someone', password='x'))
+        self.assertEqual(client.patch(f'/api/pharmacist/medicine/{self.aspirin.pk}/update-stock/', {'stock': 5})
+                         .status_code, 403)
+        self.assertEqual(client.delete(f'/api/pharmacist/medicine/{self.aspirin.pk}/delete/').status_code, 403)
+        self.assertEqual(Medicine.objects.get(pk=self.aspirin.pk).stock, 10)
@@ -3,7 +3,8 @@ from .views import (
     MedicineSearchView,
     MedicineStockUpdateView,
     MedicineUpdateView,
-    MedicineDeleteView
+    MedicineDeleteView,
+    StockReconcileView
 )
 
 urlpatterns = [
@@ -11,4 +12,5 @@ urlpatterns = [
     path('medicine/<int:pk>/update-stock/', MedicineStockUpdateView.as_view(), name='update_stock'),
     path('medicine/<int:pk>/update/', MedicineUpdateView.as_view(), name='update_medicine'),
     path('medicine/<int:pk>/delete/', MedicineDeleteView.as_view(), name='delete_medicine'),
+    path('stock/reconcile/', StockReconcileView.as_view(), name='reconcile_stock'),
 ]
@@ -1,39 +1,70 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Medicine
-from .serializers import MedicineSerializer
+from api.models import Medicine
+from api.permissions import IsAdmin, IsPharmacist
+from api.serializers import MedicineSerializer
+from api.utils import stock
+
+# Every pharmacist medicine route works on api.Medicine, the catalog that bills
+# and the stock ledger use, so a pk from the search addresses the same row everywhere.
 
 class MedicineSearchView(APIView):
     def get(self, request):
         search_term = request.GET.get('search', '')
-        medicines = Medicine.objects.filter(medicine_name__icontains=search_term)  # Corrected field name
+        medicines = Medicine.objects.filter(medicine_name__icontains=search_term).order_by('medicine_name')
         serializer = MedicineSerializer(medicines, many=True)
         return Response(serializer.data)
 
 class MedicineStockUpdateView(APIView):
+    # Stock goes through the ledger as an atomic increment rather than read-add-save.
+    permission_classes = [IsPharmacist | IsAdmin]
+
     def patch(self, request, pk):
         try:
-            medicine = Medicine.objects.get(pk=pk)
-            stock_to_add = request.data.get('stock', 0)
-            medicine.stock += stock_to_add
-            medicine.save()
-            return Response({"message": "Stock updated successfully!"}, status=status.HTTP_200_OK)
+            stock_to_add = int(request.data.get('stock', 0))
+        except (TypeError, ValueError):
+            return Response({"error": "stock must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if not stock_to_add:
+            return Response({"error": "stock must not be zero."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            balance = stock.receive(pk, stock_to_add, reason='receipt' if stock_to_add > 0 else 'adjustment')
         except Medicine.DoesNotExist:
             return Response({"error": "Medicine not found!"}, status=status.HTTP_404_NOT_FOUND)
+        except stock.InsufficientStock as exc:
+            _, available = exc.shortages[pk]
+            return Response({"error": f"Only {available} in stock."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Stock updated successfully!", "stock": balance}, status=status.HTTP_200_OK)
+
+class StockReconcileView(APIView):
+    permission_classes = [IsPharmacist | IsAdmin]
+
+    def post(self, request):
+        medicine_ids = request.data.get('medicine_ids')
+        if medicine_ids is not None and not (
+            isinstance(medicine_ids, list) and all(isinstance(pk, int) for pk in medicine_ids)
+        ):
+            return Response({"error": "medicine_ids must be a list of ids."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stock.reconcile(medicine_ids), status=status.HTTP_200_OK)
 
 class MedicineUpdateView(APIView):
+    permission_classes = [IsPharmacist | IsAdmin]
+
     def patch(self, request, pk):
         try:
             medicine = Medicine.objects.get(pk=pk)
             medicine.medicine_name = request.data.get('medicine_name', medicine.medicine_name)
             medicine.manufacturer = request.data.get('manufacturer', medicine.manufacturer)
-            medicine.save()
+            # Leaves stock alone: it only moves through api.utils.stock
+            medicine.save(update_fields=['medicine_name', 'manufacturer'])
             return Response({"message": "Medicine updated successfully!"}, status=status.HTTP_200_OK)
         except Medicine.DoesNotExist:
             return Response({"error": "Medicine not found!"}, status=status.HTTP_404_NOT_FOUND)
 
 class MedicineDeleteView(APIView):
+    permission_classes = [IsPharmacist | IsAdmin]
+
     def delete(self, request, pk):
         try:
             medicine = Medicine.objects.get(pk=pk)